@@ -1,6 +1,8 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from fitness_app.core.models import Marathon
+from fitness_app.core.entitlements import bump_entitlements
 from .models import ChatRoom
 
 @receiver(post_save, sender=Marathon)
@@ -13,4 +15,11 @@ def create_marathon_chat_room(sender, instance, created, **kwargs):
                 'name': f'Чат марафона: {instance.title}',
                 'slug': f'marathon-{instance.slug}',
             }
-        )
\ No newline at end of file
+        )
+
+
+@receiver(post_save, sender=ChatRoom)
+@receiver(post_delete, sender=ChatRoom)
+def chat_room_changed(sender, instance, **kwargs):
+    # Список чатов в навигации берётся из кэша прав пользователей
+    transaction.on_commit(bump_entitlements)
@@ -4,7 +4,7 @@ from django.core.exceptions import PermissionDenied
 from django.views.decorators.cache import never_cache
 
 from .models import ChatRoom
-from fitness_app.core.models import MarathonAccess
+from fitness_app.core.entitlements import get_entitlements
 
 @never_cache
 def chat_room(request, room_slug):
@@ -12,11 +12,7 @@ def chat_room(request, room_slug):
 
     # Проверка доступа для чатов марафонов
     if room.room_type == 'marathon':
-        if not MarathonAccess.objects.filter(
-            user=request.user,
-            marathon=room.marathon,
-            is_active=True
-        ).exists():
+        if not get_entitlements(request).has_marathon_access(room.marathon_id):
             raise PermissionDenied
 
     return render(request, 'chat/room.html', {'room': room})
\ No newline at end of file
@@ -1,7 +1,15 @@
 import os
 from celery import Celery
+from celery.signals import worker_process_init
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fitness_app.settings')
 app = Celery('fitness_app')
 app.config_from_object('django.conf:settings', namespace='CELERY')
-app.autodiscover_tasks()
\ No newline at end of file
+app.autodiscover_tasks()
+
+
+@worker_process_init.connect
+def reset_storage_after_fork(**kwargs):
+    # Дочерний процесс prefork не должен использовать S3-соединения, открытые в родителе
+    from fitness_app.core.storage import reset_video_storage
+    reset_video_storage()
@@ -19,6 +19,22 @@ from .models import (UserProfile,
                      UserConsent,
                      Payment,
                      )
+from .forms import VideoAdminForm, MarathonVideoAdminForm
+
+
+class DirectUploadAdminMixin:
+    """Подставляет в file исходник, загруженный из браузера напрямую в бакет."""
+
+    def save_model(self, request, obj, form, change):
+        key = form.cleaned_data.get('direct_upload_key')
+        if key:
+            obj.file.name = key
+            # post_save поставит обработку в очередь для необработанного видео с файлом
+            obj.is_processed = False
+        super().save_model(request, obj, form, change)
+
+    class Media:
+        js = ('admin/js/direct_upload.js',)
 
 
 @admin.register(UserProfile)
@@ -29,21 +45,23 @@ class UserProfileAdmin(admin.ModelAdmin):
 
 
 @admin.register(Video)
-class VideoAdmin(admin.ModelAdmin):
+class VideoAdmin(DirectUploadAdminMixin, admin.ModelAdmin):
+    form = VideoAdminForm
     list_display = ('id', 'title', 'is_free', 'views', 'allow_comments', 'allow_likes', 'created_at', 'is_processed')
     list_filter = ('is_free', 'allow_comments', 'allow_likes', 'categories', 'is_processed')
     list_editable = ('is_free', 'allow_comments', 'allow_likes')
     search_fields = ('title', 'description')
     filter_horizontal = ('categories',)
-    readonly_fields = ('views', 'created_at')
+    readonly_fields = ('views', 'created_at', 'source_probe')
 
     fieldsets = (
         ('Основное', {
-            'fields': ('title', 'file', 'description', 'is_free', 'categories')
+            'fields': ('title', 'file', 'direct_upload_key', 'description', 'is_free', 'categories')
         }),
         ('Превью и длительность', {
             'fields': ('thumbnail', 'duration'),
-            'description': 'Рекомендуемый размер превью: 1280×720px'
+            'description': 'Рекомендуемый размер превью: 1280×720px. '
+                           'Длительность 0 заполнится автоматически при обработке видео'
         }),
         ('Социальные функции', {
             'fields': ('allow_comments', 'allow_likes', 'allow_sharing'),
@@ -54,7 +72,8 @@ class VideoAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
         ('HLS обработка', {
-            'fields': ('is_processed', 'hls_links_refreshed_at', 'processing_error', 'hls_master_playlist'),
+            'fields': ('is_processed', 'hls_links_refreshed_at', 'processing_error', 'hls_master_playlist',
+                       'source_probe'),
             'classes': ('collapse',)
         }),
     )
@@ -556,20 +575,21 @@ class SeoBlockAdmin(admin.ModelAdmin):
 
 
 @admin.register(MarathonVideo)
-class MarathonVideoAdmin(admin.ModelAdmin):
+class MarathonVideoAdmin(DirectUploadAdminMixin, admin.ModelAdmin):
+    form = MarathonVideoAdminForm
     list_display = ('title', 'marathon', 'order', 'views', 'is_processed', 'created_at')
     list_filter = ('marathon', 'is_processed')
     search_fields = ('title', 'description')
     list_editable = ('order',)
     readonly_fields = ('views', 'created_at', 'updated_at',
-                       'hls_master_playlist', 'hls_profiles', 'hls_links_refreshed_at')
+                       'hls_master_playlist', 'hls_profiles', 'hls_links_refreshed_at', 'source_probe')
 
     fieldsets = (
         ('Основное', {
             'fields': ('marathon', 'title', 'description', 'order')
         }),
         ('Файлы', {
-            'fields': ('file', 'thumbnail'),
+            'fields': ('file', 'direct_upload_key', 'thumbnail'),
             'description': 'Исходный файл (будет автоматически обработан в HLS)'
         }),
         ('Длительность', {
@@ -577,7 +597,7 @@ class MarathonVideoAdmin(admin.ModelAdmin):
         }),
         ('HLS обработка', {
             'fields': ('is_processed', 'processing_error', 'hls_master_playlist',
-                       'hls_profiles', 'hls_links_refreshed_at', 'hls_last_ttl'),
+                       'hls_profiles', 'hls_links_refreshed_at', 'hls_last_ttl', 'source_probe'),
             'classes': ('collapse',)
         }),
         ('Статистика', {
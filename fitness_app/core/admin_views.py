@@ -1,6 +1,17 @@
+import json
+import uuid
+
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, redirect
 from django.contrib import messages
-from .models import Document, DocumentVersion
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+from django.views.decorators.http import require_POST
+
+from .models import Document, DocumentVersion, Video, MarathonVideo
+from .storage import get_video_storage, is_direct_upload_key
 
 def create_document_version(request, doc_id):
     doc = get_object_or_404(Document, id=doc_id)
@@ -31,4 +42,106 @@ def set_active_version(request, version_id):
     doc.save()
     messages.success(request,
                      f'Версия {version.version_number} документа {doc.get_type_display()} теперь активна.')
-    return redirect('admin:core_documentversion_changelist')
\ No newline at end of file
+    return redirect('admin:core_documentversion_changelist')
+
+
+# ----- Прямая загрузка исходников в бакет (multipart по подписанным URL) -----
+# Модели, в которые загружается исходник; путь в бакете повторяет upload_to поля file
+DIRECT_UPLOAD_TARGETS = {
+    'video': Video,
+    'marathon_video': MarathonVideo,
+}
+
+
+class DirectUploadError(Exception):
+    pass
+
+
+def _direct_upload_storage():
+    storage = get_video_storage()
+    if not getattr(settings, 'DIRECT_UPLOAD_ENABLED', False) or not storage.supports_direct_upload:
+        raise DirectUploadError('Прямая загрузка недоступна для текущего хранилища')
+    return storage
+
+
+def _load_direct_upload_request(request, *required):
+    try:
+        data = json.loads(request.body.decode('utf-8'))
+    except (ValueError, UnicodeDecodeError):
+        raise DirectUploadError('Некорректный JSON')
+    missing = [name for name in required if not data.get(name)]
+    if missing:
+        raise DirectUploadError(f'Не переданы поля: {", ".join(missing)}')
+    if 'key' in data and not is_direct_upload_key(data['key']):
+        raise DirectUploadError('Недопустимый ключ загрузки')
+    return data
+
+
+def _direct_upload_view(handler):
+    """Общая обработка ошибок JSON-эндпоинтов прямой загрузки."""
+    @require_POST
+    def view(request):
+        try:
+            return JsonResponse(handler(request))
+        except DirectUploadError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        except ClientError as e:
+            return JsonResponse({'error': f'Ошибка хранилища: {e}'}, status=502)
+    view.__name__ = handler.__name__
+    return view
+
+
+@_direct_upload_view
+def direct_upload_create(request):
+    data = _load_direct_upload_request(request, 'target', 'filename')
+    model = DIRECT_UPLOAD_TARGETS.get(data['target'])
+    if model is None:
+        raise DirectUploadError('Неизвестная модель для загрузки')
+    storage = _direct_upload_storage()
+
+    upload_to = timezone.now().strftime(model._meta.get_field('file').upload_to)
+    filename = get_valid_filename(data['filename'])[-150:]
+    key = f"{settings.DIRECT_UPLOAD_PREFIX}{upload_to}{uuid.uuid4().hex}_{filename}"
+    upload_id = storage.create_multipart_upload(key, data.get('content_type', ''))
+    return {'key': key, 'upload_id': upload_id, 'part_size': settings.DIRECT_UPLOAD_PART_SIZE}
+
+
+@_direct_upload_view
+def direct_upload_sign_parts(request):
+    data = _load_direct_upload_request(request, 'key', 'upload_id', 'part_numbers')
+    storage = _direct_upload_storage()
+    expires = settings.DIRECT_UPLOAD_URL_EXPIRE
+    try:
+        part_numbers = [int(n) for n in data['part_numbers']]
+    except (TypeError, ValueError):
+        raise DirectUploadError('Некорректные номера частей')
+    if any(n < 1 or n > 10000 for n in part_numbers):
+        raise DirectUploadError('Номер части должен быть от 1 до 10000')
+    urls = {
+        str(n): storage.presign_upload_part(data['key'], data['upload_id'], n, expires)
+        for n in part_numbers
+    }
+    return {'urls': urls, 'expires': expires}
+
+
+@_direct_upload_view
+def direct_upload_list_parts(request):
+    data = _load_direct_upload_request(request, 'key', 'upload_id')
+    storage = _direct_upload_storage()
+    return {'parts': storage.list_uploaded_parts(data['key'], data['upload_id'])}
+
+
+@_direct_upload_view
+def direct_upload_complete(request):
+    data = _load_direct_upload_request(request, 'key', 'upload_id')
+    storage = _direct_upload_storage()
+    size = storage.complete_multipart_upload(data['key'], data['upload_id'])
+    return {'key': data['key'], 'size': size}
+
+
+@_direct_upload_view
+def direct_upload_abort(request):
+    data = _load_direct_upload_request(request, 'key', 'upload_id')
+    storage = _direct_upload_storage()
+    storage.abort_multipart_upload(data['key'], data['upload_id'])
+    return {'aborted': True}
@@ -0,0 +1,266 @@
+# fitness_app/core/async_storage.py
+"""
+Асинхронный API хранилища для ASGI-представлений.
+
+Синхронное хранилище (storage.py) ходит в S3 через boto3 и в async-представлении
+занимает поток из пула на всё время ответа S3. Здесь те же операции выполняются
+через httpx.AsyncClient в цикле событий: запросы подписываются SigV4 (botocore
+только считает подпись, без сетевых вызовов), ссылки на чтение — пакетным
+подписывающим из signing.py. Локальное хранилище работает через aiofiles.
+"""
+
+import os
+import base64
+import asyncio
+import hashlib
+import logging
+import shutil
+import xml.etree.ElementTree as ET
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Optional
+from urllib.parse import quote, urlencode
+
+import aiofiles
+import aiofiles.os
+import httpx
+from botocore.auth import S3SigV4Auth
+from botocore.awsrequest import AWSRequest
+from botocore.credentials import Credentials
+from django.conf import settings
+
+from .storage import S3_DELETE_BATCH, LocalVideoStorage, get_token_url, get_video_storage, guess_content_type
+
+logger = logging.getLogger(__name__)
+
+S3_NAMESPACE = "http://s3.amazonaws.com/doc/2006-03-01/"
+S3_XMLNS = "{" + S3_NAMESPACE + "}"
+
+
+class AsyncVideoStorageInterface(ABC):
+    """Асинхронный аналог VideoStorageInterface для представлений."""
+
+    @abstractmethod
+    async def get_signed_url(self, remote_path: str, expires: int = settings.AWS_QUERYSTRING_EXPIRE) -> str:
+        pass
+
+    @abstractmethod
+    async def exists(self, remote_path: str) -> bool:
+        pass
+
+    @abstractmethod
+    async def load_bytes(self, remote_path: str) -> bytes:
+        pass
+
+    @abstractmethod
+    async def save_bytes(self, data: bytes, remote_path: str) -> None:
+        pass
+
+    @abstractmethod
+    def list_prefix(self, prefix: str) -> AsyncIterator[str]:
+        """Ключи всех объектов с путём, начинающимся с prefix (асинхронный генератор, постранично)."""
+        pass
+
+    @abstractmethod
+    async def delete_prefix(self, prefix: str) -> int:
+        """Удаляет все объекты с префиксом prefix. Возвращает число удалённых."""
+        pass
+
+    async def aclose(self) -> None:
+        pass
+
+
+class AsyncLocalVideoStorage(AsyncVideoStorageInterface):
+    def __init__(self, base_path: Optional[str] = None):
+        self.base_path = base_path or os.path.join(settings.MEDIA_ROOT, "videos")
+
+    def _path(self, remote_path: str) -> str:
+        return os.path.join(self.base_path, remote_path)
+
+    async def get_signed_url(self, remote_path: str, expires: int = settings.AWS_QUERYSTRING_EXPIRE) -> str:
+        return get_token_url(remote_path, expires)
+
+    async def exists(self, remote_path: str) -> bool:
+        return await aiofiles.os.path.exists(self._path(remote_path))
+
+    async def load_bytes(self, remote_path: str) -> bytes:
+        async with aiofiles.open(self._path(remote_path), "rb") as f:
+            return await f.read()
+
+    async def save_bytes(self, data: bytes, remote_path: str) -> None:
+        # Как и LocalVideoStorage.save_file: запись во временный файл и атомарная замена
+        dest = self._path(remote_path)
+        await aiofiles.os.makedirs(os.path.dirname(dest), exist_ok=True)
+        tmp = dest + ".part"
+        async with aiofiles.open(tmp, "wb") as f:
+            await f.write(data)
+        await aiofiles.os.replace(tmp, dest)
+
+    async def list_prefix(self, prefix: str) -> AsyncIterator[str]:
+        def walk():
+            root = self._path(prefix)
+            directory = root if os.path.isdir(root) else os.path.dirname(root)
+            keys = []
+            for dirpath, _, filenames in os.walk(directory):
+                for filename in filenames:
+                    key = os.path.relpath(os.path.join(dirpath, filename), self.base_path).replace(os.sep, "/")
+                    if key.startswith(prefix):
+                        keys.append(key)
+            return sorted(keys)
+        for key in await asyncio.to_thread(walk):
+            yield key
+
+    async def delete_prefix(self, prefix: str) -> int:
+        deleted = 0
+        async for key in self.list_prefix(prefix):
+            await aiofiles.os.remove(self._path(key))
+            deleted += 1
+        if prefix.endswith("/"):
+            await asyncio.to_thread(shutil.rmtree, self._path(prefix), True)
+        return deleted
+
+
+class AsyncS3VideoStorage(AsyncVideoStorageInterface):
+    """
+    S3 (path-style) поверх httpx.AsyncClient с пулом keep-alive соединений.
+    Параметры бакета и учётные данные берутся у синхронного хранилища процесса.
+    """
+
+    def __init__(self, sync_storage):
+        self.sync_storage = sync_storage
+        presigner = sync_storage.presigner
+        self.bucket_name = presigner.bucket_name
+        self.region_name = presigner.region_name
+        self.bucket_url = presigner.endpoint_url + "/" + quote(presigner.bucket_name, safe="-_.~")
+        self._credentials = Credentials(presigner.access_key, presigner.secret_key, presigner.session_token)
+        max_connections = getattr(settings, 'S3_MAX_POOL_CONNECTIONS', 10)
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(
+                getattr(settings, 'S3_READ_TIMEOUT', 60), connect=getattr(settings, 'S3_CONNECT_TIMEOUT', 5)
+            ),
+        )
+
+    def _object_url(self, key: str) -> str:
+        return f"{self.bucket_url}/{quote(key, safe='/~')}"
+
+    async def _request(self, method: str, url: str, body: bytes = b"", headers: Optional[dict] = None,
+                       expected=(200,)) -> httpx.Response:
+        request = AWSRequest(method=method, url=url, data=body, headers=headers or {})
+        request.headers["x-amz-content-sha256"] = hashlib.sha256(body).hexdigest()
+        S3SigV4Auth(self._credentials, "s3", self.region_name).add_auth(request)
+        response = await self.client.request(method, url, content=body or None, headers=dict(request.headers.items()))
+        if response.status_code not in expected:
+            raise httpx.HTTPStatusError(
+                f"S3 {method} {url}: HTTP {response.status_code} {response.text[:200]}",
+                request=response.request, response=response,
+            )
+        return response
+
+    async def get_signed_url(self, remote_path: str, expires: int = settings.AWS_QUERYSTRING_EXPIRE) -> str:
+        # Подпись ссылки — только вычисления, в S3 не обращаемся
+        return self.sync_storage.get_signed_url(remote_path, expires=expires)
+
+    async def exists(self, remote_path: str) -> bool:
+        response = await self._request("HEAD", self._object_url(remote_path), expected=(200, 404))
+        return response.status_code == 200
+
+    async def load_bytes(self, remote_path: str) -> bytes:
+        return (await self._request("GET", self._object_url(remote_path))).content
+
+    async def save_bytes(self, data: bytes, remote_path: str) -> None:
+        headers = {"Content-Type": guess_content_type(remote_path)}
+        default_acl = getattr(self.sync_storage, "default_acl", None)
+        if default_acl:
+            headers["x-amz-acl"] = default_acl
+        await self._request("PUT", self._object_url(remote_path), body=data, headers=headers)
+        logger.debug(f"Файл сохранён в S3 (async): {remote_path}, {len(data)} байт")
+
+    async def list_prefix(self, prefix: str) -> AsyncIterator[str]:
+        params = {"list-type": "2", "prefix": prefix}
+        while True:
+            response = await self._request("GET", f"{self.bucket_url}?{urlencode(params, quote_via=quote)}")
+            root = ET.fromstring(response.content)
+            for el in root.iter(f"{S3_XMLNS}Key"):
+                yield el.text
+            token = root.findtext(f"{S3_XMLNS}NextContinuationToken")
+            if root.findtext(f"{S3_XMLNS}IsTruncated") != "true" or not token:
+                return
+            params["continuation-token"] = token
+
+    async def _delete_batch(self, keys: list) -> int:
+        """DeleteObjects для пачки ключей. Возвращает число удалённых (без ключей из <Error>)."""
+        delete = ET.Element("Delete", xmlns=S3_NAMESPACE)
+        ET.SubElement(delete, "Quiet").text = "true"
+        for key in keys:
+            ET.SubElement(ET.SubElement(delete, "Object"), "Key").text = key
+        body = ET.tostring(delete, encoding="utf-8", xml_declaration=True)
+        headers = {
+            "Content-Type": "application/xml",
+            "Content-MD5": base64.b64encode(hashlib.md5(body).digest()).decode("ascii"),
+        }
+        response = await self._request("POST", f"{self.bucket_url}?delete=", body=body, headers=headers)
+        # В режиме Quiet ответ содержит только ключи, которые удалить не удалось
+        errors = ET.fromstring(response.content).findall(f"{S3_XMLNS}Error") if response.content else []
+        for error in errors[:10]:
+            logger.warning(
+                f"Не удалось удалить {error.findtext(f'{S3_XMLNS}Key')}: "
+                f"{error.findtext(f'{S3_XMLNS}Code')} {error.findtext(f'{S3_XMLNS}Message')}"
+            )
+        return len(keys) - len(errors)
+
+    async def delete_prefix(self, prefix: str) -> int:
+        # Как и синхронный delete_keys: в памяти не больше S3_DELETE_WORKERS пачек,
+        # пачки удаляются параллельно по мере листинга
+        workers = getattr(settings, 'S3_DELETE_WORKERS', 4)
+        deleted = 0
+        batches = [[]]
+        async for key in self.list_prefix(prefix):
+            batches[-1].append(key)
+            if len(batches[-1]) == S3_DELETE_BATCH:
+                if len(batches) == workers:
+                    deleted += sum(await asyncio.gather(*(self._delete_batch(batch) for batch in batches)))
+                    batches = []
+                batches.append([])
+        batches = [batch for batch in batches if batch]
+        if batches:
+            deleted += sum(await asyncio.gather(*(self._delete_batch(batch) for batch in batches)))
+        logger.info(f"Удалено {deleted} объектов с префиксом {prefix} (async)")
+        return deleted
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+
+# Клиент httpx привязан к циклу событий, поэтому хранилище создаётся на каждый цикл
+# (в воркере uvicorn цикл один на процесс)
+_async_storages = {}
+# Задачи закрытия хранилищ завершённых циклов (ссылка нужна, чтобы задачу не собрал GC)
+_closing = set()
+
+
+async def _aclose_stale(storage: AsyncVideoStorageInterface) -> None:
+    try:
+        await storage.aclose()
+    except Exception as e:
+        # Соединения завершённого цикла закрываются с ошибкой; сокеты всё равно освобождаются
+        logger.debug(f"Хранилище завершённого цикла событий закрыто с ошибкой: {e}")
+
+
+def get_async_video_storage() -> AsyncVideoStorageInterface:
+    """Асинхронное хранилище для текущего цикла событий (вызывать из async-кода)."""
+    loop = asyncio.get_running_loop()
+    key = (os.getpid(), id(loop))
+    storage = _async_storages.get(key)
+    if storage is None:
+        sync_storage = get_video_storage()
+        if isinstance(sync_storage, LocalVideoStorage):
+            storage = AsyncLocalVideoStorage(sync_storage.base_path)
+        else:
+            storage = AsyncS3VideoStorage(sync_storage)
+        # Хранилища завершённых циклов (тесты, asyncio.run) закрываются, а не накапливаются
+        for stale in [k for k in _async_storages if k != key]:
+            task = loop.create_task(_aclose_stale(_async_storages.pop(stale)))
+            _closing.add(task)
+            task.add_done_callback(_closing.discard)
+        _async_storages[key] = storage
+    return storage
@@ -0,0 +1,127 @@
+# fitness_app/core/catalog_cache.py
+"""
+Кэш редко меняющихся данных витрины: баннеры, SEO-блоки, категории, услуги,
+видео категорий (группа 'catalog'), активные версии документов (группа 'consent').
+
+Два уровня: LRU в памяти процесса и общий кэш (Redis, CACHES['default']).
+Ключи включают версию группы. Сигналы post_save/post_delete меняют версию, и
+старые записи обоих уровней больше не читаются (в Redis истекают по TTL).
+Версию процесс перечитывает из Redis не чаще раза в
+CATALOG_VERSION_CHECK_INTERVAL секунд, поэтому в установившемся режиме
+страница витрины не обращается ни к Postgres, ни (в основном) к Redis.
+"""
+
+import math
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = "catalog:version:{group}"
+DATA_CACHE_KEY = "catalog:{group}:{version}:{name}"
+
+_lock = threading.Lock()
+_local = OrderedDict()      # (group, version, name) -> значение
+_local_versions = {}        # group -> (версия, время проверки)
+
+
+def _get_version(group: str) -> str:
+    interval = getattr(settings, 'CATALOG_VERSION_CHECK_INTERVAL', 2)
+    with _lock:
+        cached = _local_versions.get(group)
+    if cached and time.monotonic() - cached[1] < interval:
+        return cached[0]
+
+    key = VERSION_KEY.format(group=group)
+    version = cache.get(key)
+    if version is None:
+        # add не перезапишет версию, которую параллельно создал другой процесс
+        cache.add(key, uuid.uuid4().hex[:12], None)
+        version = cache.get(key) or "0"
+    with _lock:
+        _local_versions[group] = (version, time.monotonic())
+    return version
+
+
+def _local_get(local_key):
+    with _lock:
+        if local_key in _local:
+            _local.move_to_end(local_key)
+            return _local[local_key]
+    return None
+
+
+def _local_set(local_key, value) -> None:
+    with _lock:
+        _local[local_key] = value
+        _local.move_to_end(local_key)
+        while len(_local) > getattr(settings, 'CATALOG_LOCAL_CACHE_SIZE', 256):
+            _local.popitem(last=False)
+
+
+def get_cached(group: str, name: str, builder: Callable):
+    """
+    Значение name группы group: из памяти процесса, из общего кэша или builder().
+    builder должен возвращать готовые данные (список, а не ленивый QuerySet).
+    """
+    version = _get_version(group)
+    local_key = (group, version, name)
+    value = _local_get(local_key)
+    if value is not None:
+        return value
+
+    key = DATA_CACHE_KEY.format(group=group, version=version, name=name)
+    value = cache.get(key)
+    if value is None:
+        value = builder()
+        cache.set(key, value, getattr(settings, 'CATALOG_CACHE_TTL', 3600))
+        logger.debug(f"Кэш витрины {group}:{name} пересобран (версия {version})")
+
+    _local_set(local_key, value)
+    return value
+
+
+def get_cached_until(group: str, name: str, builder: Callable):
+    """
+    Как get_cached, но builder возвращает (значение, valid_until): запись живёт
+    до valid_until (datetime или None — до смены версии), например до ближайшей
+    даты начала или окончания показа баннера.
+    """
+    version = _get_version(group)
+    local_key = (group, version, name)
+    now = timezone.now()
+    entry = _local_get(local_key)
+    if entry is not None and (entry[1] is None or entry[1] > now):
+        return entry[0]
+
+    key = DATA_CACHE_KEY.format(group=group, version=version, name=name)
+    entry = cache.get(key)
+    if entry is None or (entry[1] is not None and entry[1] <= now):
+        entry = builder()
+        timeout = getattr(settings, 'CATALOG_CACHE_TTL', 3600)
+        if entry[1] is not None:
+            timeout = min(timeout, math.ceil((entry[1] - now).total_seconds()))
+        if timeout > 0:
+            cache.set(key, entry, timeout)
+        logger.debug(f"Кэш витрины {group}:{name} пересобран до {entry[1]} (версия {version})")
+
+    _local_set(local_key, entry)
+    return entry[0]
+
+
+def bump_version(group: str) -> None:
+    """Сбрасывает кэш группы во всех процессах (в остальных — через CATALOG_VERSION_CHECK_INTERVAL)."""
+    cache.set(VERSION_KEY.format(group=group), uuid.uuid4().hex[:12], None)
+    with _lock:
+        _local_versions.pop(group, None)
+        for local_key in [k for k in _local if k[0] == group]:
+            del _local[local_key]
+    logger.info(f"Кэш витрины {group} сброшен")
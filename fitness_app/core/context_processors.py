@@ -1,21 +1,53 @@
+import re
+from datetime import timedelta
+
+from django.db.models import Count, Min, Q
 from django.utils import timezone
-from .models import Banner, SeoBlock, MarathonAccess, Marathon, UserProfile, Category
+from .models import Banner, SeoBlock, Category
+from .entitlements import get_entitlements
+from .catalog_cache import get_cached, get_cached_until
+
+
+# Мобильные браузеры: клиентская подсказка Sec-CH-UA-Mobile или User-Agent
+MOBILE_UA_RE = re.compile(r'Mobi|Android|iPhone|iPod|Opera Mini|IEMobile', re.IGNORECASE)
+
+
+def device_class(request):
+    """'mobile' или 'desktop' — для выбора баннеров с show_on_mobile / show_on_desktop"""
+    hint = request.headers.get('Sec-CH-UA-Mobile')
+    if hint is not None:
+        return 'mobile' if hint == '?1' else 'desktop'
+    return 'mobile' if MOBILE_UA_RE.search(request.headers.get('User-Agent', '')) else 'desktop'
+
+
+def _build_active_banners(device):
+    """
+    Баннеры, видимые сейчас на устройстве device (окно дат — в запросе), и момент,
+    когда набор изменится: ближайшая start_date в будущем или end_date ещё не прошедшего баннера.
+    """
+    now = timezone.now()
+    banners = Banner.objects.filter(is_active=True, **{f'show_on_{device}': True})
+    visible = list(banners.filter(
+        Q(start_date__isnull=True) | Q(start_date__lte=now),
+        Q(end_date__isnull=True) | Q(end_date__gte=now),
+    ).order_by('-priority', '-created_at'))
+    boundaries = banners.aggregate(
+        next_start=Min('start_date', filter=Q(start_date__gt=now)),
+        next_end=Min('end_date', filter=Q(end_date__gte=now)),
+    )
+    # Окончание показа включительно: баннер скрывается сразу после end_date
+    if boundaries['next_end'] is not None:
+        boundaries['next_end'] += timedelta(microseconds=1)
+    valid_until = min((b for b in boundaries.values() if b is not None), default=None)
+    return visible, valid_until
 
 
 def active_banners(request):
     """Добавляет активные баннеры в контекст всех шаблонов"""
     try:
-        banners = Banner.objects.filter(
-            is_active=True,
-            show_on_desktop=True
-        )
-
-        # Фильтруем по датам
-        now = timezone.now()
-        banners = [b for b in banners if b.is_currently_active]
-
-        # Сортируем по приоритету
-        banners.sort(key=lambda x: x.priority, reverse=True)
+        # Набор кэшируется до ближайшей смены по датам показа и сбрасывается при изменении баннеров
+        device = device_class(request)
+        banners = get_cached_until('catalog', f'banners:{device}', lambda: _build_active_banners(device))
 
         return {'active_banners': banners}  # Можно сделать ограничение по кол-ву. Например: banners[:3]
     except Exception as e:
@@ -33,10 +65,10 @@ def active_seo_blocks(request):
             return {'seo_blocks': []}
 
         # Получаем активные SEO-блоки для главной
-        seo_blocks = SeoBlock.objects.filter(
+        seo_blocks = get_cached('catalog', 'seo_blocks_home', lambda: list(SeoBlock.objects.filter(
             is_active=True,
             show_on_home=True
-        ).order_by('order')[:10]  # Ограничиваем 10 блоками
+        ).order_by('order')[:10]))  # Ограничиваем 10 блоками
 
         return {'seo_blocks': seo_blocks}
     except Exception as e:
@@ -51,17 +83,12 @@ def marathon_stats(request):
 
     if request.user.is_authenticated:
         try:
-            # ТОЛЬКО купленные марафоны
-            purchased_count = MarathonAccess.objects.filter(
-                user=request.user,
-                is_active=True
-            ).count()
-
-            # Всего активных марафонов
-            total_marathons = Marathon.objects.filter(is_active=True).count()
+            # ТОЛЬКО купленные марафоны (из кэша прав пользователя)
+            entitlements = get_entitlements(request)
+            purchased_count = entitlements.purchased_count
 
             context.update({
-                'total_marathons': total_marathons,
+                'total_marathons': entitlements.total_marathons,
                 'user_accessible_marathons': purchased_count,  # Только купленные
                 'purchased_marathons_count': purchased_count,
                 'subscribed_marathons_count': 0,  # Всегда 0, т.к. марафоны не по подписке
@@ -79,19 +106,17 @@ def user_marathon_access(request):
     if not request.user.is_authenticated:
         return {'user_marathon_ids': []}
 
-    # Из кэша или сессии можно брать
-    marathon_ids = MarathonAccess.objects.filter(
-        user=request.user,
-        is_active=True
-    ).values_list('marathon_id', flat=True)
-
-    return {'user_marathon_ids': list(marathon_ids)}
+    return {'user_marathon_ids': get_entitlements(request).marathon_ids}
 
 
 def categories_processor(request):
     """Добавляет все видимые категории в контекст всех шаблонов с сортировкой"""
     try:
-        categories = Category.objects.filter(is_visible=True).order_by('-is_featured', 'name')
+        categories = get_cached('catalog', 'categories_visible', lambda: list(
+            Category.objects.filter(is_visible=True).annotate(
+                video_count=Count('videos')
+            ).order_by('-is_featured', 'name')
+        ))
         return {'categories': categories}
     except Exception as e:
         print(f"Ошибка при получении категорий: {e}")
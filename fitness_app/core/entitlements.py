@@ -0,0 +1,143 @@
+# fitness_app/core/entitlements.py
+"""
+Права пользователя и данные навигации (доступы к марафонам, подписка, чаты).
+
+Раньше контекст-процессоры и представления считали их по отдельности на каждый
+рендер. Здесь они собираются один раз и кэшируются на пользователя. Ключ кэша
+включает две версии: пользователя (доступы, профиль) и общую (марафоны, чаты).
+Сигналы меняют версию, после чего старая запись просто не читается. Версии
+хранятся в общем кэше (CACHES, Redis), поэтому покупка или отзыв доступа сразу
+видны всем процессам web и Celery. В пределах запроса объект один
+(get_entitlements) и загружается при первом обращении.
+"""
+
+import uuid
+import logging
+from functools import cached_property
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Marathon, MarathonAccess, UserProfile
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_VERSION_KEY = "entitlements:version"
+USER_VERSION_KEY = "entitlements:version:{user_id}"
+DATA_CACHE_KEY = "entitlements:{user_id}:{global_version}:{user_version}"
+
+
+def _get_versions(user_id: int) -> tuple:
+    keys = [GLOBAL_VERSION_KEY, USER_VERSION_KEY.format(user_id=user_id)]
+    versions = cache.get_many(keys)
+    result = []
+    for key in keys:
+        version = versions.get(key)
+        if version is None:
+            # add не перезапишет версию, которую параллельно создал другой процесс
+            cache.add(key, uuid.uuid4().hex[:12], None)
+            version = cache.get(key)
+        result.append(version)
+    return tuple(result)
+
+
+def bump_user_entitlements(user_id: int) -> None:
+    """Сбрасывает кэш прав пользователя (изменились доступы или профиль)."""
+    cache.set(USER_VERSION_KEY.format(user_id=user_id), uuid.uuid4().hex[:12], None)
+
+
+def bump_entitlements() -> None:
+    """Сбрасывает кэш прав всех пользователей (изменились марафоны или чаты)."""
+    cache.set(GLOBAL_VERSION_KEY, uuid.uuid4().hex[:12], None)
+
+
+class Entitlements:
+    """Права и навигация пользователя. Данные загружаются при первом обращении."""
+
+    def __init__(self, user):
+        self.user = user
+
+    @cached_property
+    def _data(self) -> dict:
+        if not self.user.is_authenticated:
+            return {'accesses': [], 'total_marathons': 0, 'subscription_active': False, 'chat_rooms': []}
+
+        global_version, user_version = _get_versions(self.user.id)
+        key = DATA_CACHE_KEY.format(user_id=self.user.id, global_version=global_version, user_version=user_version)
+        data = cache.get(key)
+        if data is None:
+            data = self._build()
+            cache.set(key, data, getattr(settings, 'ENTITLEMENTS_CACHE_TTL', 3600))
+        return data
+
+    def _build(self) -> dict:
+        ChatRoom = apps.get_model('chat', 'ChatRoom')
+        accesses = list(
+            MarathonAccess.objects.filter(user=self.user, is_active=True)
+            .values_list('marathon_id', 'valid_until')
+        )
+        marathon_ids = [marathon_id for marathon_id, _ in accesses]
+
+        # Общий чат и чаты купленных марафонов — одним запросом
+        rooms = [
+            {'name': room.name, 'slug': room.slug, 'type': room.room_type}
+            for room in ChatRoom.objects.filter(
+                Q(room_type='general') | Q(room_type='marathon', marathon_id__in=marathon_ids),
+                is_active=True,
+            )
+        ]
+        rooms.sort(key=lambda x: x['name'])
+
+        logger.debug(f"Права пользователя {self.user.id} пересчитаны")
+        return {
+            'accesses': accesses,
+            'total_marathons': Marathon.objects.filter(is_active=True).count(),
+            'subscription_active': UserProfile.objects.filter(
+                user=self.user, subscription_active=True
+            ).exists(),
+            'chat_rooms': rooms,
+        }
+
+    @property
+    def marathon_ids(self) -> list:
+        """Марафоны с активным доступом (is_active), как в навигации."""
+        return [marathon_id for marathon_id, _ in self._data['accesses']]
+
+    @property
+    def valid_marathon_ids(self) -> set:
+        """Марафоны с действующим доступом (как MarathonAccess.is_valid)."""
+        now = timezone.now()
+        return {
+            marathon_id for marathon_id, valid_until in self._data['accesses']
+            if valid_until is None or valid_until >= now
+        }
+
+    def has_marathon_access(self, marathon_id: int) -> bool:
+        return marathon_id in self.marathon_ids
+
+    @property
+    def purchased_count(self) -> int:
+        return len(self._data['accesses'])
+
+    @property
+    def total_marathons(self) -> int:
+        return self._data['total_marathons']
+
+    @property
+    def subscription_active(self) -> bool:
+        return self._data['subscription_active']
+
+    @property
+    def chat_rooms(self) -> list:
+        return self._data['chat_rooms']
+
+
+def get_entitlements(request) -> Entitlements:
+    """Права текущего пользователя, один объект на запрос."""
+    entitlements = getattr(request, '_entitlements', None)
+    if entitlements is None or entitlements.user is not request.user:
+        entitlements = request._entitlements = Entitlements(request.user)
+    return entitlements
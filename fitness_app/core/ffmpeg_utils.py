@@ -1,12 +1,15 @@
 # fitness_app/core/ffmpeg_utils.py
 """
-Утилиты для работы с FFmpeg: определение разрешения, частоты кадров,
+Утилиты для работы с FFmpeg: анализ исходника (ffprobe),
 профили кодирования, генерация HLS-потоков с высоким качеством.
 """
 
 import subprocess
 import os
+import json
+import math
 import logging
+from dataclasses import dataclass, asdict, fields
 from typing import Tuple, List, Dict, Optional
 
 logger = logging.getLogger(__name__)
@@ -57,22 +60,111 @@ MASTER_BITRATE_LADDER: List[Dict] = [
 ]
 
 
-def get_video_resolution(file_path: str) -> Tuple[int, int]:
+@dataclass
+class MediaProbe:
+    """Параметры исходного видео, полученные одним вызовом ffprobe."""
+    width: int
+    height: int
+    framerate: Optional[float] = None
+    duration: Optional[float] = None
+    video_codec: Optional[str] = None
+    video_profile: Optional[str] = None
+    video_level: Optional[int] = None
+    video_bitrate: Optional[int] = None
+    audio_codec: Optional[str] = None
+    has_audio: bool = False
+    bit_rate: Optional[int] = None
+    format_name: Optional[str] = None
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "MediaProbe":
+        known = {f.name for f in fields(cls)}
+        return cls(**{k: v for k, v in data.items() if k in known})
+
+
+def _parse_framerate(value: Optional[str]) -> Optional[float]:
+    """Разбирает частоту кадров в форматах "25/1", "30000/1001", "25", "25.000"."""
+    if not value:
+        return None
+    try:
+        if '/' in value:
+            num, den = value.split('/')
+            return float(num) / float(den) if float(den) else None
+        return float(value)
+    except ValueError:
+        return None
+
+
+def _parse_int(value) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_float(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def probe_media(file_path: str) -> MediaProbe:
     """
-    Определяет ширину и высоту видео с помощью ffprobe.
-    Возвращает (width, height).
+    Получает все нужные параметры видео одним вызовом
+    ffprobe -show_streams -show_format -of json.
+    Бросает исключение, если в файле нет видеопотока.
     """
     cmd = [
-        "ffprobe", "-v", "error", "-select_streams", "v:0",
-        "-show_entries", "stream=width,height", "-of", "csv=p=0:s=x",
+        "ffprobe", "-v", "error", "-show_streams", "-show_format", "-of", "json",
         file_path
     ]
     logger.debug(f"Выполняется команда: {' '.join(cmd)}")
     result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-    output = result.stdout.strip()
-    width, height = map(int, output.split("x"))
-    logger.info(f"Разрешение исходного видео: {width}x{height}")
-    return width, height
+    data = json.loads(result.stdout or "{}")
+
+    streams = data.get("streams", [])
+    fmt = data.get("format", {})
+    video = next((st for st in streams if st.get("codec_type") == "video"), None)
+    audio = next((st for st in streams if st.get("codec_type") == "audio"), None)
+    if video is None:
+        raise RuntimeError(f"В файле {file_path} нет видеопотока")
+
+    framerate = _parse_framerate(video.get("r_frame_rate")) or _parse_framerate(video.get("avg_frame_rate"))
+    duration = _parse_float(fmt.get("duration")) or _parse_float(video.get("duration"))
+
+    probe = MediaProbe(
+        width=int(video["width"]),
+        height=int(video["height"]),
+        framerate=framerate,
+        duration=duration,
+        video_codec=video.get("codec_name"),
+        video_profile=video.get("profile"),
+        video_level=_parse_int(video.get("level")),
+        video_bitrate=_parse_int(video.get("bit_rate")),
+        audio_codec=audio.get("codec_name") if audio else None,
+        has_audio=audio is not None,
+        bit_rate=_parse_int(fmt.get("bit_rate")),
+        format_name=fmt.get("format_name"),
+    )
+    logger.info(
+        f"Исходное видео: {probe.width}x{probe.height}, "
+        f"{probe.framerate or 0:.2f} fps, {probe.duration or 0:.1f} с, "
+        f"видео {probe.video_codec}, аудио {probe.audio_codec or 'нет'}"
+    )
+    return probe
+
+
+def get_video_resolution(file_path: str) -> Tuple[int, int]:
+    """
+    Определяет ширину и высоту видео с помощью ffprobe.
+    Возвращает (width, height).
+    """
+    probe = probe_media(file_path)
+    return probe.width, probe.height
 
 
 def get_video_framerate(file_path: str) -> float | None:
@@ -80,31 +172,65 @@ def get_video_framerate(file_path: str) -> float | None:
     Определяет частоту кадров (fps) исходного видео с помощью ffprobe.
     Возвращает float или None, если не удалось определить.
     """
-    cmd = [
-        "ffprobe", "-v", "error", "-select_streams", "v:0",
-        "-show_entries", "stream=r_frame_rate", "-of", "default=noprint_wrappers=1:nokey=1",
-        file_path
-    ]
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        output = result.stdout.strip()
-        if not output:
-            return None
-
-        # Обработка форматов: "25/1", "30000/1001", "25", "25.000"
-        if '/' in output:
-            num, den = output.split('/')
-            fps = float(num) / float(den)
-        else:
-            fps = float(output)
-
-        logger.info(f"Частота кадров: {fps:.2f} fps")
-        return fps
+        return probe_media(file_path).framerate
     except Exception as e:
         logger.warning(f"Не удалось определить частоту кадров: {e}")
         return None
 
 
+def can_passthrough_video(probe: MediaProbe, profile: Dict) -> bool:
+    """
+    Можно ли не перекодировать видеопоток для профиля, а скопировать его как есть:
+    исходник в H.264 ровно того же разрешения и с битрейтом не выше профиля.
+    """
+    if probe.video_codec != "h264":
+        return False
+    if (probe.width, probe.height) != (profile["width"], profile["height"]):
+        return False
+    profile_bitrate = int(profile["video_bitrate"].replace("k", "000"))
+    return bool(probe.video_bitrate) and probe.video_bitrate <= profile_bitrate
+
+
+# profile_idc + constraint flags H.264 для атрибута CODECS (RFC 6381)
+H264_PROFILE_IDC = {
+    "baseline": "42E0",
+    "constrained baseline": "42E0",
+    "main": "4D40",
+    "high": "6400",
+}
+
+# Уровни H.264: (уровень * 10, MaxMBPS, MaxFS) — по таблице A-1 спецификации
+H264_LEVEL_LIMITS = [
+    (30, 40500, 1620),
+    (31, 108000, 3600),
+    (32, 216000, 5120),
+    (40, 245760, 8192),
+    (42, 522240, 8704),
+    (50, 589824, 22080),
+    (51, 983040, 36864),
+]
+
+
+def estimate_h264_level(width: int, height: int, framerate: Optional[float]) -> int:
+    """Минимальный уровень H.264 (уровень * 10), допускающий такое разрешение и частоту кадров."""
+    frame_mbs = ((width + 15) // 16) * ((height + 15) // 16)
+    mbps = frame_mbs * (framerate or 25)
+    for level, max_mbps, max_fs in H264_LEVEL_LIMITS:
+        if frame_mbs <= max_fs and mbps <= max_mbps:
+            return level
+    return H264_LEVEL_LIMITS[-1][0]
+
+
+def hls_codecs_string(video_profile: Optional[str], video_level: Optional[int], has_audio: bool = True) -> str:
+    """Строка CODECS для EXT-X-STREAM-INF, например 'avc1.640028,mp4a.40.2' (AAC-LC)."""
+    profile_idc = H264_PROFILE_IDC.get((video_profile or "high").lower(), H264_PROFILE_IDC["high"])
+    codecs = [f"avc1.{profile_idc}{(video_level or 40):02X}"]
+    if has_audio:
+        codecs.append("mp4a.40.2")
+    return ",".join(codecs)
+
+
 def filter_profiles(source_height: int, ladder: List[Dict]) -> List[Dict]:
     """Оставляет только профили, высота которых <= высоты исходника."""
     filtered = [p for p in ladder if p["height"] <= source_height]
@@ -112,10 +238,54 @@ def filter_profiles(source_height: int, ladder: List[Dict]) -> List[Dict]:
     return filtered
 
 
-def encode_hls_profile(input_path: str, output_dir: str, profile: Dict, framerate: Optional[float] = None) -> str:
+def calculate_gop_size(framerate: Optional[float], hls_time: int) -> int:
+    """
+    Рассчитывает GOP (количество кадров между ключевыми кадрами),
+    синхронизированный с длительностью сегмента hls_time.
+    """
+    if framerate and framerate > 0:
+        gop_size = int(round(framerate * hls_time))
+    else:
+        # Fallback: предполагаем 25 fps (стандарт для PAL)
+        gop_size = int(round(25 * hls_time))
+        logger.warning(f"Частота кадров не определена, используем GOP={gop_size} (предполагается 25 fps)")
+    # Минимальный GOP = 2, максимальный = 600 (20 секунд при 30 fps)
+    return max(2, min(gop_size, 600))
+
+
+def allocate_encoder_threads(profiles: List[Dict], thread_budget: int) -> Dict[str, int]:
+    """
+    Делит бюджет потоков x264 между одновременно кодируемыми профилями
+    пропорционально числу пикселей кадра (1080p получает больше потоков, чем 360p).
+    Каждому профилю достаётся минимум один поток.
+    Возвращает словарь {имя профиля: количество потоков}.
+    """
+    if not profiles:
+        return {}
+    thread_budget = max(thread_budget, len(profiles))
+    areas = {p["name"]: p["width"] * p["height"] for p in profiles}
+    total_area = sum(areas.values())
+
+    # Сначала по одному потоку каждому, остаток — пропорционально площади (метод наибольших остатков)
+    spare = thread_budget - len(profiles)
+    shares = {name: spare * area / total_area for name, area in areas.items()}
+    allocation = {name: 1 + int(share) for name, share in shares.items()}
+    leftover = thread_budget - sum(allocation.values())
+    for name in sorted(shares, key=lambda n: shares[n] - int(shares[n]), reverse=True)[:leftover]:
+        allocation[name] += 1
+
+    logger.info(f"Распределение потоков x264 (бюджет {thread_budget}): {allocation}")
+    return allocation
+
+
+def encode_hls_profile(input_path: str, output_dir: str, profile: Dict, framerate: Optional[float] = None,
+                       threads: Optional[int] = None, passthrough: bool = False) -> str:
     """
     Конвертирует исходное видео в один HLS-профиль с улучшенными параметрами.
     Использует framerate для расчёта GOP (группы кадров), синхронизированного с hls_time.
+    threads ограничивает число потоков x264 (None — ffmpeg выбирает сам).
+    passthrough — видеопоток копируется без перекодирования (см. can_passthrough_video),
+    сегменты при этом режутся по ключевым кадрам исходника.
     Возвращает относительный путь к variant.m3u8 (относительно output_dir).
     """
     variant_name = profile["name"]
@@ -124,24 +294,27 @@ def encode_hls_profile(input_path: str, output_dir: str, profile: Dict, framerat
 
     # Определяем GOP (количество кадров между ключевыми кадрами)
     hls_time = profile.get("hls_time", 10)
-    if framerate and framerate > 0:
-        gop_size = int(round(framerate * hls_time))
-        # Минимальный GOP = 2, максимальный = 600 (20 секунд при 30 fps)
-        gop_size = max(2, min(gop_size, 600))
+    gop_size = calculate_gop_size(framerate, hls_time)
+
+    if passthrough:
+        video_args = ["-c:v", "copy"]
     else:
-        # Fallback: предполагаем 25 fps (стандарт для PAL)
-        gop_size = int(round(25 * hls_time))
-        gop_size = max(2, min(gop_size, 600))
-        logger.warning(f"Частота кадров не определена, используем GOP={gop_size} (предполагается 25 fps)")
+        video_args = [
+            "-c:v", "libx264",
+            "-b:v", profile["video_bitrate"],
+            "-maxrate", profile["video_bitrate"],
+            "-bufsize", f"{int(profile['video_bitrate'][:-1]) * 2}k",
+            "-vf", f"scale={profile['width']}:{profile['height']}:flags=lanczos",  # качественный ресайз
+            "-preset", profile.get("preset", "slow"),
+            "-profile:v", profile.get("profile", "high"),
+            "-g", str(gop_size),
+            "-force_key_frames", f"expr:gte(t,n_forced*{hls_time})",  # ключевые кадры каждые hls_time секунд
+        ]
+        if threads:
+            video_args += ["-threads:v", str(threads)]
 
     # Базовые параметры
-    cmd = [
-        "ffmpeg", "-i", input_path,
-        "-c:v", "libx264",
-        "-b:v", profile["video_bitrate"],
-        "-maxrate", profile["video_bitrate"],
-        "-bufsize", f"{int(profile['video_bitrate'][:-1]) * 2}k",
-        "-vf", f"scale={profile['width']}:{profile['height']}:flags=lanczos",  # качественный ресайз
+    cmd = ["ffmpeg", "-i", input_path] + video_args + [
         "-c:a", "aac",
         "-b:a", profile["audio_bitrate"],
         "-ac", "2",                     # стерео
@@ -149,12 +322,8 @@ def encode_hls_profile(input_path: str, output_dir: str, profile: Dict, framerat
         "-f", "hls",
     ]
 
-    # Дополнительные опции из профиля
+    # Параметры HLS-муксера
     cmd += [
-        "-preset", profile.get("preset", "slow"),
-        "-profile:v", profile.get("profile", "high"),
-        "-g", str(gop_size),
-        "-force_key_frames", f"expr:gte(t,n_forced*{hls_time})",  # ключевые кадры каждые hls_time секунд
         "-hls_time", str(hls_time),
         "-hls_list_size", "0",
         "-hls_playlist_type", "vod",
@@ -163,12 +332,249 @@ def encode_hls_profile(input_path: str, output_dir: str, profile: Dict, framerat
         os.path.join(output_dir, variant_m3u8)
     ]
 
-    logger.info(f"Запуск кодирования профиля {variant_name} (GOP={gop_size}): {' '.join(cmd)}")
+    mode = "копирование видео" if passthrough else f"GOP={gop_size}"
+    logger.info(f"Запуск кодирования профиля {variant_name} ({mode}): {' '.join(cmd)}")
     subprocess.run(cmd, check=True, capture_output=True, text=True)
     logger.info(f"Профиль {variant_name} успешно создан")
     return variant_m3u8
 
 
+def encode_hls_ladder_single_pass(input_path: str, output_dir: str, profiles: List[Dict],
+                                  framerate: Optional[float] = None, has_audio: bool = True,
+                                  threads: Optional[Dict[str, int]] = None) -> List[str]:
+    """
+    Кодирует все профили лестницы одним процессом ffmpeg: исходник декодируется один раз,
+    видеопоток размножается фильтром split и масштабируется под каждый профиль,
+    а hls-муксер с -var_stream_map раскладывает варианты по отдельным плейлистам.
+    Раскладка файлов совпадает с encode_hls_profile: out_{name}.m3u8 и out_{name}_%03d.ts.
+    threads — необязательное распределение потоков x264 по профилям (см. allocate_encoder_threads).
+    Возвращает список имён вариантных плейлистов (относительно output_dir).
+    """
+    if not profiles:
+        return []
+
+    # У hls-муксера одна длительность сегмента на все варианты
+    hls_time = profiles[0].get("hls_time", 10)
+    gop_size = calculate_gop_size(framerate, hls_time)
+
+    # Граф фильтров: [0:v]split=N[s0][s1]...; [s0]scale=...[v0]; ...
+    split_outputs = "".join(f"[s{i}]" for i in range(len(profiles)))
+    filters = [f"[0:v]split={len(profiles)}{split_outputs}"]
+    for i, profile in enumerate(profiles):
+        filters.append(f"[s{i}]scale={profile['width']}:{profile['height']}:flags=lanczos[v{i}]")
+
+    cmd = ["ffmpeg", "-i", input_path, "-filter_complex", ";".join(filters)]
+
+    stream_map = []
+    for i, profile in enumerate(profiles):
+        cmd += ["-map", f"[v{i}]"]
+        if has_audio:
+            cmd += ["-map", "0:a:0"]
+            stream_map.append(f"v:{i},a:{i},name:{profile['name']}")
+        else:
+            stream_map.append(f"v:{i},name:{profile['name']}")
+
+    # Параметры видео для каждого выходного потока
+    cmd += ["-c:v", "libx264"]
+    for i, profile in enumerate(profiles):
+        cmd += [
+            f"-b:v:{i}", profile["video_bitrate"],
+            f"-maxrate:v:{i}", profile["video_bitrate"],
+            f"-bufsize:v:{i}", f"{int(profile['video_bitrate'][:-1]) * 2}k",
+            f"-preset:v:{i}", profile.get("preset", "slow"),
+            f"-profile:v:{i}", profile.get("profile", "high"),
+        ]
+        if threads and threads.get(profile["name"]):
+            cmd += [f"-threads:v:{i}", str(threads[profile["name"]])]
+    cmd += [
+        "-g", str(gop_size),
+        "-force_key_frames", f"expr:gte(t,n_forced*{hls_time})",  # ключевые кадры каждые hls_time секунд
+    ]
+
+    # Параметры аудио для каждого выходного потока
+    if has_audio:
+        cmd += ["-c:a", "aac", "-ac", "2", "-ar", "48000"]
+        for i, profile in enumerate(profiles):
+            cmd += [f"-b:a:{i}", profile["audio_bitrate"]]
+
+    cmd += [
+        "-f", "hls",
+        "-hls_time", str(hls_time),
+        "-hls_list_size", "0",
+        "-hls_playlist_type", "vod",
+        "-hls_flags", "independent_segments",
+        "-hls_segment_filename", os.path.join(output_dir, "out_%v_%03d.ts"),
+        "-var_stream_map", " ".join(stream_map),
+        os.path.join(output_dir, "out_%v.m3u8")
+    ]
+
+    names = [p["name"] for p in profiles]
+    logger.info(f"Запуск однопроходного кодирования профилей {names} (GOP={gop_size}): {' '.join(cmd)}")
+    subprocess.run(cmd, check=True, capture_output=True, text=True)
+    logger.info(f"Профили {names} успешно созданы за один проход")
+    return [f"out_{name}.m3u8" for name in names]
+
+
+# Запас по краям куска при нарезке без перекодирования: -ss с -c copy начинает
+# с ключевого кадра до точки входа, а B-кадры у границы ссылаются на кадры после неё
+CHUNK_OVERLAP = 5
+
+
+def get_video_start_time(file_path: str) -> float:
+    """Временная метка первого кадра видеопотока (у MPEG-TS и части MP4 она не нулевая)."""
+    cmd = [
+        "ffprobe", "-v", "error", "-select_streams", "v:0",
+        "-show_entries", "stream=start_time", "-of", "csv=p=0",
+        file_path
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    return _parse_float(result.stdout.strip()) or 0.0
+
+
+def split_into_chunks(input_path: str, output_dir: str, chunk_duration: int, hls_time: int,
+                      duration: float) -> List[Dict]:
+    """
+    Режет видеопоток исходника на куски без перекодирования (-c copy, Matroska, -copyts).
+    Границы кусков кратны hls_time (длительность куска округляется вниз до кратной),
+    поэтому ключевые кадры, которые encode_chunk_profile ставит каждые hls_time секунд
+    от начала куска, после склейки попадают ровно на границы HLS-сегментов.
+    Разрез -c copy идёт по ключевым кадрам исходника, поэтому каждый кусок берётся
+    с запасом CHUNK_OVERLAP с обеих сторон, а точная граница [start, end) вырезается
+    при кодировании по исходным временным меткам. Звук кодируется отдельно
+    (encode_audio_track) и в куски не попадает.
+    Возвращает список словарей {"path", "start", "end"} в порядке воспроизведения;
+    start/end — метки исходника, end последнего куска — None (до конца).
+    """
+    chunk_len = max(hls_time, chunk_duration // hls_time * hls_time)
+    origin = get_video_start_time(input_path)
+    count = max(1, math.ceil(duration / chunk_len))
+
+    chunks = []
+    for index in range(count):
+        offset = index * chunk_len
+        seek = max(0, offset - CHUNK_OVERLAP)
+        chunk_path = os.path.join(output_dir, f"chunk_{index:03d}.mkv")
+        cmd = ["ffmpeg", "-ss", str(seek)]
+        if index < count - 1:
+            cmd += ["-t", str(offset - seek + chunk_len + CHUNK_OVERLAP)]
+        cmd += [
+            "-i", input_path,
+            "-map", "0:v:0",
+            "-c", "copy",
+            "-copyts",
+            "-f", "matroska",
+            chunk_path
+        ]
+        logger.debug(f"Выполняется команда: {' '.join(cmd)}")
+        subprocess.run(cmd, check=True, capture_output=True, text=True)
+        chunks.append({
+            "path": chunk_path,
+            "start": origin + offset,
+            "end": origin + offset + chunk_len if index < count - 1 else None,
+        })
+    logger.info(f"Исходник разрезан на {len(chunks)} кусков по {chunk_len} с")
+    return chunks
+
+
+def encode_audio_track(input_path: str, output_path: str, audio_bitrate: str, start_time: float = 0.0) -> str:
+    """
+    Кодирует звук всего исходника в AAC одним проходом (M4A). Отдельное кодирование
+    звука по кускам даёт на каждой склейке priming-задержку AAC (щелчок) и
+    накопленный рассинхрон, поэтому звук кодируется один раз и подмешивается
+    в package_hls_from_chunks. Метки сдвигаются так, что 0 совпадает с первым
+    кадром видео (start_time), недостающее в начале дополняется тишиной.
+    Возвращает output_path.
+    """
+    cmd = [
+        "ffmpeg", "-copyts", "-i", input_path,
+        "-map", "0:a:0", "-vn",
+        "-af", f"asetpts=PTS-{start_time}/TB,aresample=async=1:first_pts=0",
+        "-c:a", "aac",
+        "-b:a", audio_bitrate,
+        "-ac", "2",
+        "-ar", "48000",
+        "-f", "mp4",
+        output_path
+    ]
+    logger.info(f"Кодирование звука {audio_bitrate}: {' '.join(cmd)}")
+    subprocess.run(cmd, check=True, capture_output=True, text=True)
+    return output_path
+
+
+def encode_chunk_profile(input_path: str, output_path: str, profile: Dict, start: float, end: Optional[float] = None,
+                         framerate: Optional[float] = None, threads: Optional[int] = None) -> str:
+    """
+    Кодирует видео одного куска в один профиль (Matroska, без звука и нарезки на HLS-сегменты).
+    Из куска вырезаются кадры с исходными метками [start, end), метки начинаются с нуля.
+    Параметры кодека совпадают с encode_hls_profile, ключевые кадры расставляются
+    каждые hls_time секунд от начала куска, чтобы после склейки сегменты резались ровно.
+    Возвращает output_path.
+    """
+    hls_time = profile.get("hls_time", 10)
+    gop_size = calculate_gop_size(framerate, hls_time)
+    trim = f"trim=start={start}" + (f":end={end}" if end is not None else "")
+
+    cmd = [
+        "ffmpeg", "-copyts", "-i", input_path,
+        "-map", "0:v:0",
+        "-c:v", "libx264",
+        "-b:v", profile["video_bitrate"],
+        "-maxrate", profile["video_bitrate"],
+        "-bufsize", f"{int(profile['video_bitrate'][:-1]) * 2}k",
+        "-vf", f"{trim},setpts=PTS-STARTPTS,scale={profile['width']}:{profile['height']}:flags=lanczos",
+        "-preset", profile.get("preset", "slow"),
+        "-profile:v", profile.get("profile", "high"),
+        "-g", str(gop_size),
+        "-force_key_frames", f"expr:gte(t,n_forced*{hls_time})",
+    ]
+    if threads:
+        cmd += ["-threads:v", str(threads)]
+    cmd += ["-f", "matroska", output_path]
+
+    logger.info(f"Кодирование куска {os.path.basename(input_path)} в профиль {profile['name']}: {' '.join(cmd)}")
+    subprocess.run(cmd, check=True, capture_output=True, text=True)
+    return output_path
+
+
+def package_hls_from_chunks(chunk_paths: List[str], output_dir: str, profile: Dict,
+                            audio_path: Optional[str] = None) -> str:
+    """
+    Склеивает закодированные куски одного профиля (concat demuxer, без перекодирования),
+    подмешивает звук, закодированный одним проходом (audio_path), и нарезает
+    результат в непрерывный HLS: out_{name}.m3u8 и out_{name}_%03d.ts.
+    Временные метки склейки непрерывны, поэтому EXT-X-DISCONTINUITY не появляется.
+    Возвращает имя вариантного плейлиста (относительно output_dir).
+    """
+    variant_name = profile["name"]
+    variant_m3u8 = f"out_{variant_name}.m3u8"
+    hls_time = profile.get("hls_time", 10)
+
+    concat_list = os.path.join(output_dir, f"concat_{variant_name}.txt")
+    with open(concat_list, "w") as f:
+        for path in chunk_paths:
+            f.write(f"file '{path}'\n")
+
+    cmd = ["ffmpeg", "-f", "concat", "-safe", "0", "-i", concat_list]
+    if audio_path:
+        cmd += ["-i", audio_path, "-map", "0:v:0", "-map", "1:a:0"]
+    else:
+        cmd += ["-map", "0:v:0"]
+    cmd += [
+        "-c", "copy",
+        "-f", "hls",
+        "-hls_time", str(hls_time),
+        "-hls_list_size", "0",
+        "-hls_playlist_type", "vod",
+        "-hls_flags", "independent_segments",
+        "-hls_segment_filename", os.path.join(output_dir, f"out_{variant_name}_%03d.ts"),
+        os.path.join(output_dir, variant_m3u8)
+    ]
+    logger.info(f"Сборка HLS профиля {variant_name} из {len(chunk_paths)} кусков: {' '.join(cmd)}")
+    subprocess.run(cmd, check=True, capture_output=True, text=True)
+    os.remove(concat_list)
+    return variant_m3u8
+
+
 def create_master_playlist(output_dir: str, profiles: List[Dict], variant_files: List[str]) -> str:
     """
     Создаёт master.m3u8, который ссылается на все варианты.
@@ -1,6 +1,9 @@
 from allauth.account.forms import SignupForm, LoginForm, ResetPasswordForm, ResetPasswordKeyForm
 from django import forms
-from .models import VideoComment, DocumentVersion, UserConsent
+from django.conf import settings
+from django.urls import reverse
+from .models import VideoComment, DocumentVersion, UserConsent, Video, MarathonVideo
+from .storage import get_video_storage, is_direct_upload_key
 
 
 class CustomSignupForm(SignupForm):
@@ -163,3 +166,60 @@ class ServiceRequestForm(forms.ModelForm):
                 'placeholder': 'Расскажите о ваших целях, уровне подготовки, пожеланиях...'
             }),
         }
+
+
+class DirectUploadFormMixin(forms.Form):
+    """
+    Исходник видео можно загрузить из браузера напрямую в бакет (static/admin/js/direct_upload.js):
+    скрипт кладёт ключ объекта в direct_upload_key и не отправляет сам файл,
+    поэтому поле file становится необязательным.
+    """
+    direct_upload_target = None
+
+    direct_upload_key = forms.CharField(required=False, widget=forms.HiddenInput())
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['file'].required = False
+        if getattr(settings, 'DIRECT_UPLOAD_ENABLED', False):
+            self.fields['direct_upload_key'].widget.attrs.update({
+                'data-direct-upload': self.direct_upload_target,
+                'data-create-url': reverse('direct_upload_create'),
+                'data-sign-url': reverse('direct_upload_sign_parts'),
+                'data-list-url': reverse('direct_upload_list_parts'),
+                'data-complete-url': reverse('direct_upload_complete'),
+                'data-abort-url': reverse('direct_upload_abort'),
+            })
+
+    def clean_direct_upload_key(self):
+        key = self.cleaned_data.get('direct_upload_key', '').strip()
+        if not key:
+            return ''
+        if not getattr(settings, 'DIRECT_UPLOAD_ENABLED', False) or not is_direct_upload_key(key):
+            raise forms.ValidationError('Недопустимый ключ загруженного файла')
+        if not get_video_storage().exists(key):
+            raise forms.ValidationError('Загруженный файл не найден в хранилище, загрузите его ещё раз')
+        return key
+
+    def clean(self):
+        cleaned_data = super().clean()
+        has_file = cleaned_data.get('file') or cleaned_data.get('direct_upload_key') or self.instance.file
+        if not has_file and 'direct_upload_key' not in self.errors:
+            self.add_error('file', 'Обязательное поле.')
+        return cleaned_data
+
+
+class VideoAdminForm(DirectUploadFormMixin, forms.ModelForm):
+    direct_upload_target = 'video'
+
+    class Meta:
+        model = Video
+        fields = '__all__'
+
+
+class MarathonVideoAdminForm(DirectUploadFormMixin, forms.ModelForm):
+    direct_upload_target = 'marathon_video'
+
+    class Meta:
+        model = MarathonVideo
+        fields = '__all__'
@@ -0,0 +1,195 @@
+# fitness_app/core/hls_delivery.py
+"""
+Динамическая отдача HLS-плейлистов (HLS_DELIVERY_MODE = 'dynamic').
+
+Вариантные плейлисты в хранилище не переписываются: список сегментов один раз
+читается из out_{profile}.m3u8 и кэшируется, а подписанные URL сегментов
+подставляются при каждом запросе плейлиста. Мастер-плейлист ссылается на
+вариантные плейлисты Django относительными URI.
+
+При S3_SIGNING_BUCKET подписи в пределах интервала одинаковы, поэтому вариантный
+плейлист рендерится один раз на интервал, а ETag известен до подписи сегментов
+(повторные запросы получают 304 без рендера).
+"""
+
+import os
+import hashlib
+import logging
+import tempfile
+from typing import Optional
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.urls import reverse
+
+from .ffmpeg_utils import MASTER_BITRATE_LADDER
+from .signing import signing_window
+from .hls_utils import (
+    HLS_REMOTE_PREFIXES,
+    build_master_playlist,
+    get_existing_profiles,
+    hls_remote_base,
+    is_token_delivery,
+    render_rendition_playlist,
+)
+from .storage import get_token_url
+
+logger = logging.getLogger(__name__)
+
+# Вид видео в URL -> модель (префикс в хранилище — HLS_REMOTE_PREFIXES)
+HLS_SOURCES = {
+    'video': 'core.Video',
+    'marathon': 'core.MarathonVideo',
+}
+
+SEGMENT_CACHE_KEY = "hls:segments:{remote_base}{profile}"
+VARIANT_CACHE_KEY = "hls:variant:{etag}"
+
+
+def get_hls_source(kind: str):
+    """Возвращает (модель, префикс в хранилище) для вида видео или None."""
+    model_label = HLS_SOURCES.get(kind)
+    if model_label is None:
+        return None
+    return apps.get_model(model_label), HLS_REMOTE_PREFIXES[model_label]
+
+
+def hls_kind_for(obj) -> str:
+    for kind, model_label in HLS_SOURCES.items():
+        if obj._meta.label == model_label:
+            return kind
+    raise ValueError(f"HLS не поддерживается для {obj._meta.label}")
+
+
+def get_hls_stream_url(obj) -> str:
+    """
+    URL мастер-плейлиста: в режиме 'token' — файл из хранилища с токеном на каталог,
+    иначе — плейлист, который Django отдаёт динамически.
+    """
+    if is_token_delivery():
+        return get_token_url(hls_remote_base(obj) + "master.m3u8", playlist_url_expires(obj))
+    return reverse('hls_master_playlist', kwargs={'kind': hls_kind_for(obj), 'obj_id': obj.id})
+
+
+def playlist_url_expires(obj) -> int:
+    """
+    Время жизни подписей сегментов: плейлист VOD загружается плеером один раз,
+    поэтому ссылки должны дожить до конца просмотра (TTL + длительность видео).
+    """
+    return settings.AWS_QUERYSTRING_EXPIRE + (obj.duration or 0)
+
+
+def get_stream_profiles(obj, remote_base: str, storage, renditions: dict = None) -> list:
+    """
+    Профили лестницы, закодированные для объекта (в порядке MASTER_BITRATE_LADDER):
+    из индекса HlsRendition, иначе из hls_profiles, иначе проверкой хранилища.
+    """
+    names = renditions or obj.hls_profiles
+    if names:
+        return [p for p in MASTER_BITRATE_LADDER if p['name'] in names]
+    return get_existing_profiles(remote_base, storage)
+
+
+def _parse_playlist(content: str) -> list:
+    """
+    Разбирает вариантный плейлист в список [строка, это_сегмент].
+    Для сегментов хранится имя файла: плейлист мог быть уже переписан с подписанными URL.
+    """
+    items = []
+    for line in content.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith('#'):
+            items.append([line, False])
+        else:
+            items.append([line.split('/')[-1].split('?')[0], True])
+    return items
+
+
+def get_segment_list(remote_base: str, profile_name: str, storage, rendition=None) -> list:
+    """
+    Разобранный вариантный плейлист из кэша; при промахе строится по индексу
+    HlsSegment (один запрос), а для непроиндексированных видео читается из хранилища.
+    """
+    key = SEGMENT_CACHE_KEY.format(remote_base=remote_base, profile=profile_name)
+    items = cache.get(key)
+    if items is not None:
+        return items
+
+    if rendition is not None:
+        items = _parse_playlist(render_rendition_playlist(rendition, lambda names: names))
+    else:
+        with tempfile.TemporaryDirectory(prefix="hls_playlist_") as temp_dir:
+            local_variant = os.path.join(temp_dir, f"out_{profile_name}.m3u8")
+            storage.load_file(remote_base + f"out_{profile_name}.m3u8", local_variant)
+            with open(local_variant, 'r') as f:
+                items = _parse_playlist(f.read())
+
+    cache.set(key, items, getattr(settings, 'HLS_SEGMENT_CACHE_TTL', 86400))
+    logger.debug(f"Список сегментов {remote_base}{profile_name} закэширован ({len(items)} строк)")
+    return items
+
+
+def invalidate_segment_cache(remote_base: str, profile_names: list) -> None:
+    cache.delete_many([
+        SEGMENT_CACHE_KEY.format(remote_base=remote_base, profile=name) for name in profile_names
+    ])
+
+
+def playlist_etag(*parts) -> str:
+    """Сильный ETag по содержимому или по данным, из которых оно однозначно строится."""
+    return '"' + hashlib.sha256(repr(parts).encode('utf-8')).hexdigest()[:32] + '"'
+
+
+def signing_bucket() -> int:
+    return getattr(settings, 'S3_SIGNING_BUCKET', 0)
+
+
+def variant_playlist_etag(remote_base: str, profile_name: str, storage, expires: int,
+                          rendition=None) -> Optional[str]:
+    """
+    ETag вариантного плейлиста в текущем интервале подписи (None, если подписи не выровнены):
+    содержимое определяется списком сегментов, сроком действия и началом интервала.
+    """
+    bucket = signing_bucket()
+    if not bucket:
+        return None
+    items = get_segment_list(remote_base, profile_name, storage, rendition)
+    signed_at, _ = signing_window(bucket)
+    return playlist_etag(remote_base, profile_name, items, expires, signed_at.timestamp())
+
+
+def _render_variant_playlist(remote_base: str, profile_name: str, storage, expires: int, rendition=None) -> str:
+    items = get_segment_list(remote_base, profile_name, storage, rendition)
+    signed_urls = iter(storage.get_signed_urls(
+        [remote_base + value for value, is_segment in items if is_segment], expires=expires
+    ))
+    lines = [next(signed_urls) if is_segment else value for value, is_segment in items]
+    return "\n".join(lines) + "\n"
+
+
+def render_variant_playlist(remote_base: str, profile_name: str, storage, expires: int, rendition=None,
+                            etag: Optional[str] = None) -> str:
+    """
+    Вариантный плейлист с подписанными URL сегментов (одной пачкой).
+    При выровненных подписях результат кэшируется до конца интервала под ключом etag.
+    """
+    etag = etag or variant_playlist_etag(remote_base, profile_name, storage, expires, rendition)
+    if etag is None:
+        return _render_variant_playlist(remote_base, profile_name, storage, expires, rendition)
+
+    key = VARIANT_CACHE_KEY.format(etag=etag)
+    content = cache.get(key)
+    if content is None:
+        content = _render_variant_playlist(remote_base, profile_name, storage, expires, rendition)
+        _, remaining = signing_window(signing_bucket())
+        cache.set(key, content, remaining)
+    return content
+
+
+def render_master_playlist(profiles: list, renditions: dict = None) -> str:
+    """Мастер-плейлист с относительными ссылками на вариантные плейлисты Django."""
+    uris = {p['name']: f"{p['name']}.m3u8" for p in profiles}
+    return build_master_playlist(profiles, uris, renditions) + "\n"
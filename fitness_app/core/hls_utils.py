@@ -1,36 +1,58 @@
 # fitness_app/core/hls_utils.py
 
 import os
-import shutil
 import tempfile
+import time
 import logging
-from typing import Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Optional
 
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import redis
+from django.apps import apps
 from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, F, Q, Value, When
 from django.utils import timezone
 
 from .ffmpeg_utils import (
     filter_profiles,
     MASTER_BITRATE_LADDER,
-    get_video_resolution,
-    get_video_framerate,
-    encode_hls_profile
+    MediaProbe,
+    probe_media,
+    estimate_h264_level,
+    hls_codecs_string,
+    can_passthrough_video,
+    allocate_encoder_threads,
+    encode_hls_profile,
+    encode_hls_ladder_single_pass,
+    split_into_chunks,
+    encode_audio_track,
+    encode_chunk_profile,
+    package_hls_from_chunks,
 )
-from .storage import get_video_storage
+from .locks import single_flight, wait_for_release
+from .storage import get_video_storage, is_direct_upload_key
 
 logger = logging.getLogger(__name__)
 
 
 # ----- Вспомогательные функции -----
 def get_or_download_source(file_field, temp_dir: str, storage) -> str:
-    """Копирует или скачивает исходный файл во временную папку."""
+    """
+    Возвращает локальный путь к исходному файлу. Локальный исходник читается на месте
+    (ffmpeg только читает его, а удаляется он после публикации HLS);
+    иначе файл скачивается из хранилища во временную папку.
+    """
     local_input = os.path.join(temp_dir, "input.mp4")
     try:
         original_path = file_field.path
         if os.path.exists(original_path):
-            shutil.copy2(original_path, local_input)
-            logger.info(f"Исходный файл скопирован из {original_path}")
-            return local_input
+            logger.info(f"Исходный файл читается на месте: {original_path}")
+            return original_path
     except (NotImplementedError, AttributeError, FileNotFoundError):
         pass
 
@@ -43,6 +65,9 @@ def delete_original_file(obj) -> None:
     """Удаляет исходный файл у модели (если есть)."""
     if obj.file:
         try:
+            if is_direct_upload_key(obj.file.name):
+                # Исходник загружен из админки напрямую в бакет видео
+                get_video_storage().delete_file(obj.file.name)
             obj.file.delete(save=False)
             obj.file = None
             obj.save(update_fields=['file'])
@@ -51,25 +76,197 @@ def delete_original_file(obj) -> None:
             logger.warning(f"Не удалось удалить исходный файл {obj.id}: {e}")
 
 
-def encode_all_profiles(local_input: str, temp_dir: str, profiles: list, framerate: Optional[float] = None) -> None:
-    """Кодирует все профили HLS."""
+def get_encoder_thread_budget() -> int:
+    """Бюджет потоков x264 на один узел (HLS_ENCODER_THREAD_BUDGET, 0 — число ядер)."""
+    budget = getattr(settings, "HLS_ENCODER_THREAD_BUDGET", 0)
+    return budget if budget > 0 else (os.cpu_count() or 1)
+
+
+def get_source_probe(obj, local_input: str) -> MediaProbe:
+    """
+    Возвращает параметры исходника из obj.source_probe или, если их нет
+    (или файл сменился), вызывает ffprobe один раз и сохраняет результат в модели.
+    Заодно заполняет obj.duration, если администратор не указал длительность.
+    """
+    source_name = obj.file.name if obj.file else ""
+    cached = obj.source_probe or {}
+    if cached and cached.get("source_name") == source_name:
+        logger.info(f"Используются сохранённые параметры исходника {obj.__class__.__name__} {obj.id}")
+        return MediaProbe.from_dict(cached)
+
+    probe = probe_media(local_input)
+    obj.source_probe = {**probe.to_dict(), "source_name": source_name}
+    updates = {"source_probe": obj.source_probe}
+    if not obj.duration and probe.duration:
+        obj.duration = int(round(probe.duration))
+        updates["duration"] = obj.duration
+    # update() без post_save: сохранение ещё не обработанного объекта с файлом
+    # поставило бы в очередь повторное кодирование (signals.video_post_save)
+    type(obj).objects.filter(pk=obj.pk).update(**updates)
+    return probe
+
+
+def _use_passthrough(probe: Optional[MediaProbe], profile: dict) -> bool:
+    """Копировать ли видеопоток профиля без перекодирования (HLS_PASSTHROUGH)."""
+    if not probe or not getattr(settings, "HLS_PASSTHROUGH", False):
+        return False
+    return can_passthrough_video(probe, profile)
+
+
+def encode_profiles_parallel(local_input: str, temp_dir: str, profiles: list, framerate: Optional[float] = None,
+                             probe: Optional[MediaProbe] = None) -> None:
+    """
+    Кодирует профили одновременно, по процессу ffmpeg на профиль.
+    Число одновременных процессов ограничено HLS_PARALLEL_MAX_JOBS и бюджетом потоков,
+    потоки x264 делятся между профилями пропорционально разрешению.
+    Пул потоков здесь только ждёт дочерние процессы ffmpeg: дочерние процессы
+    Celery (prefork) не могут создавать multiprocessing-пулы.
+    """
+    budget = get_encoder_thread_budget()
+    max_jobs = getattr(settings, "HLS_PARALLEL_MAX_JOBS", 0) or len(profiles)
+    jobs = max(1, min(len(profiles), max_jobs, budget))
+
+    if jobs == len(profiles):
+        threads = allocate_encoder_threads(profiles, budget)
+    else:
+        # Профили идут волнами — каждому процессу равная доля бюджета
+        threads = {p["name"]: max(1, budget // jobs) for p in profiles}
+
+    logger.info(f"Параллельное кодирование: {jobs} процессов, бюджет {budget} потоков")
+    with ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="hls_encode") as executor:
+        futures = [
+            executor.submit(encode_hls_profile, local_input, temp_dir, profile, framerate,
+                            threads[profile["name"]], _use_passthrough(probe, profile))
+            for profile in profiles
+        ]
+        # result() пробрасывает первую ошибку кодирования
+        for future in futures:
+            future.result()
+
+
+def encode_all_profiles(local_input: str, temp_dir: str, profiles: list, framerate: Optional[float] = None,
+                        probe: Optional[MediaProbe] = None) -> None:
+    """
+    Кодирует все профили HLS.
+    Режим задаётся настройкой HLS_ENCODE_MODE:
+    - 'sequential' — отдельный проход ffmpeg на каждый профиль;
+    - 'single_pass' — один процесс ffmpeg, исходник декодируется один раз;
+    - 'parallel' — профили кодируются одновременно в ограниченном пуле.
+    probe — параметры исходника (аудио, passthrough); без него считаем, что аудио есть.
+    """
+    mode = getattr(settings, "HLS_ENCODE_MODE", "sequential")
+    if mode == "single_pass":
+        threads = allocate_encoder_threads(profiles, get_encoder_thread_budget())
+        has_audio = probe.has_audio if probe else True
+        encode_hls_ladder_single_pass(local_input, temp_dir, profiles, framerate, has_audio, threads)
+        return
+    if mode == "parallel":
+        encode_profiles_parallel(local_input, temp_dir, profiles, framerate, probe)
+        return
+
     for profile in profiles:
-        encode_hls_profile(local_input, temp_dir, profile, framerate)
+        encode_hls_profile(local_input, temp_dir, profile, framerate, passthrough=_use_passthrough(probe, profile))
 
 
-def upload_all_files(temp_dir: str, remote_base: str, storage) -> None:
-    """Загружает все файлы из temp_dir в хранилище, сохраняя структуру."""
+def _upload_with_retries(storage, local_file: str, remote_path: str, retries: int, backoff: float,
+                         move: bool = False) -> None:
+    """
+    Загружает один файл, повторяя попытку с экспоненциальной задержкой. Повтор
+    большого файла догружает недостающие части; после последней неудачной попытки
+    незавершённая загрузка прерывается, чтобы её части не остались в бакете.
+    """
+    attempt = 0
+    while True:
+        try:
+            if move:
+                storage.move_file(local_file, remote_path, resumable=True)
+            else:
+                storage.save_file(local_file, remote_path, resumable=True)
+            return
+        except Exception as e:
+            if attempt >= retries:
+                try:
+                    storage.abort_upload(local_file)
+                except Exception as abort_error:
+                    logger.warning(f"Не удалось прервать загрузку {remote_path}: {abort_error}")
+                raise
+            delay = backoff * (2 ** attempt)
+            attempt += 1
+            logger.warning(
+                f"Ошибка загрузки {remote_path} (попытка {attempt}/{retries}): {e}. Повтор через {delay:.1f} с"
+            )
+            time.sleep(delay)
+
+
+def _log_upload_progress(done: int, total: int, remote_path: str) -> None:
+    if done == total or done % 50 == 0:
+        logger.info(f"Загружено {done}/{total} файлов HLS")
+
+
+def upload_all_files(
+    temp_dir: str,
+    remote_base: str,
+    storage,
+    workers: Optional[int] = None,
+    progress_callback: Optional[Callable[[int, int, str], None]] = None,
+    move: bool = False,
+) -> None:
+    """
+    Загружает все файлы из temp_dir в хранилище, сохраняя структуру.
+
+    Файлы загружаются параллельно в workers потоков (по умолчанию HLS_UPLOAD_WORKERS)
+    через общий клиент хранилища; каждый файл повторяется до HLS_UPLOAD_RETRIES раз.
+    Плейлисты загружаются после сегментов, чтобы не ссылаться на ещё не загруженные файлы.
+    progress_callback(done, total, remote_path) вызывается после каждого загруженного файла.
+    move=True — файлы временные: они переносятся в хранилище (локально — os.replace) и удаляются.
+    """
+    segments, playlists = [], []
     for root, _, files in os.walk(temp_dir):
         for file in files:
             local_file = os.path.join(root, file)
-            relative_path = os.path.relpath(local_file, temp_dir)
-            remote_path = remote_base + relative_path
-            storage.save_file(local_file, remote_path)
-            logger.debug(f"Загружен {remote_path}")
-
+            remote_path = remote_base + os.path.relpath(local_file, temp_dir)
+            (playlists if file.endswith(".m3u8") else segments).append((local_file, remote_path))
+
+    total = len(segments) + len(playlists)
+    if not total:
+        return
+
+    workers = workers or getattr(settings, 'HLS_UPLOAD_WORKERS', 8)
+    retries = getattr(settings, 'HLS_UPLOAD_RETRIES', 3)
+    backoff = getattr(settings, 'HLS_UPLOAD_RETRY_BACKOFF', 1.0)
+    lock = threading.Lock()
+    done = 0
+
+    def upload(item):
+        nonlocal done
+        local_file, remote_path = item
+        _upload_with_retries(storage, local_file, remote_path, retries, backoff, move)
+        with lock:
+            done += 1
+            current = done
+        logger.debug(f"Загружен {remote_path}")
+        if progress_callback:
+            progress_callback(current, total, remote_path)
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for batch in (segments, playlists):
+            futures = [pool.submit(upload, item) for item in batch]
+            for future in as_completed(futures):
+                future.result()
+    logger.info(f"Загружено {total} файлов в {remote_base} за {time.monotonic() - started:.1f} с ({workers} потоков)")
+
+
+def get_existing_profiles(remote_base: str, storage, obj=None) -> list:
+    """
+    Возвращает список профилей, для которых существуют вариантные плейлисты.
+    Для проиндексированного объекта (HlsRendition) — одним запросом к БД, без обращений к хранилищу.
+    """
+    if obj is not None:
+        renditions = get_renditions(obj)
+        if renditions:
+            return [p for p in MASTER_BITRATE_LADDER if p['name'] in renditions]
 
-def get_existing_profiles(remote_base: str, storage) -> list:
-    """Возвращает список профилей, для которых существуют вариантные плейлисты."""
     profiles = []
     for profile in MASTER_BITRATE_LADDER:
         variant_path = remote_base + f"out_{profile['name']}.m3u8"
@@ -81,29 +278,59 @@ def get_existing_profiles(remote_base: str, storage) -> list:
     return profiles
 
 
-def _update_variant_playlist(profile, remote_base: str, temp_dir: str, storage, expires: int) -> None:
+def render_rendition_playlist(rendition, segment_uris) -> str:
+    """
+    Вариантный плейлист VOD из индекса; segment_uris(список имён сегментов)
+    возвращает их URI одной пачкой (так подписи считаются за один вызов).
+    """
+    lines = [
+        "#EXTM3U",
+        "#EXT-X-VERSION:3",
+        f"#EXT-X-TARGETDURATION:{rendition.target_duration}",
+        "#EXT-X-MEDIA-SEQUENCE:0",
+        "#EXT-X-PLAYLIST-TYPE:VOD",
+    ]
+    segments = list(rendition.segments.all())
+    for segment, uri in zip(segments, segment_uris([segment.name for segment in segments])):
+        lines.append(f"#EXTINF:{segment.duration:.6f},")
+        lines.append(uri)
+    lines.append("#EXT-X-ENDLIST")
+    return "\n".join(lines) + "\n"
+
+
+def _update_variant_playlist(profile, remote_base: str, temp_dir: str, storage, expires: int,
+                             rendition=None) -> None:
     """Перезаписывает вариантный плейлист, заменяя сегменты на подписанные URL."""
     variant_remote = remote_base + f"out_{profile['name']}.m3u8"
-    local_variant = os.path.join(temp_dir, f"out_{profile['name']}.m3u8")
-    storage.load_file(variant_remote, local_variant)
-
-    with open(local_variant, 'r') as f:
-        lines = f.read().splitlines()
-
-    new_lines = []
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-        if line.startswith('#'):
-            new_lines.append(line)
-        else:
-            segment_name = line.split('/')[-1].split('?')[0]
-            segment_remote = remote_base + segment_name
-            signed_url = storage.get_signed_url(segment_remote, expires=expires)
-            new_lines.append(signed_url)
 
-    new_content = "\n".join(new_lines)
+    if rendition is not None:
+        # Сегменты известны из индекса — плейлист из хранилища не скачивается
+        new_content = render_rendition_playlist(
+            rendition, lambda names: storage.get_signed_urls([remote_base + name for name in names], expires=expires)
+        )
+    else:
+        local_variant = os.path.join(temp_dir, f"out_{profile['name']}.m3u8")
+        storage.load_file(variant_remote, local_variant)
+
+        with open(local_variant, 'r') as f:
+            lines = f.read().splitlines()
+
+        new_lines = []
+        segment_indexes = []
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('#'):
+                new_lines.append(line)
+            else:
+                segment_indexes.append(len(new_lines))
+                new_lines.append(remote_base + line.split('/')[-1].split('?')[0])
+        signed_urls = storage.get_signed_urls([new_lines[i] for i in segment_indexes], expires=expires)
+        for i, signed_url in zip(segment_indexes, signed_urls):
+            new_lines[i] = signed_url
+        new_content = "\n".join(new_lines)
+
     new_local = os.path.join(temp_dir, f"new_{profile['name']}.m3u8")
     with open(new_local, 'w') as f:
         f.write(new_content)
@@ -112,27 +339,51 @@ def _update_variant_playlist(profile, remote_base: str, temp_dir: str, storage,
     logger.info(f"Плейлист {profile['name']} перезаписан с подписанными сегментами")
 
 
-def rewrite_variant_playlists(remote_base: str, profiles: list, storage, expires: int, temp_dir: str) -> None:
-    """Перезаписывает все вариантные плейлисты."""
+def rewrite_variant_playlists(remote_base: str, profiles: list, storage, expires: int, temp_dir: str,
+                              renditions: Optional[dict] = None) -> None:
+    """Перезаписывает все вариантные плейлисты (renditions — {имя: HlsRendition}, если есть индекс)."""
+    renditions = renditions or {}
     for profile in profiles:
-        _update_variant_playlist(profile, remote_base, temp_dir, storage, expires)
+        _update_variant_playlist(profile, remote_base, temp_dir, storage, expires, renditions.get(profile['name']))
+
 
+def profile_bandwidth(profile: dict) -> int:
+    """Пиковая полоса профиля (видео + аудио) в бит/с для EXT-X-STREAM-INF."""
+    return int(profile['video_bitrate'].replace('k', '000')) + int(profile['audio_bitrate'].replace('k', '000'))
 
-def regenerate_master_playlist(remote_base: str, profiles: list, storage, expires: int, temp_dir: str) -> tuple:
+
+def build_master_playlist(profiles: list, variant_uris: dict, renditions: Optional[dict] = None) -> str:
+    """
+    Текст мастер-плейлиста; variant_uris — {имя профиля: URI вариантного плейлиста}.
+    Для проиндексированных профилей (renditions) BANDWIDTH/AVERAGE-BANDWIDTH берутся
+    из измеренного битрейта сегментов и добавляется CODECS.
+    """
+    renditions = renditions or {}
+    lines = ["#EXTM3U", "#EXT-X-VERSION:3"]
+    for profile in profiles:
+        resolution = f"{profile['width']}x{profile['height']}"
+        rendition = renditions.get(profile['name'])
+        if rendition is not None and rendition.peak_bitrate:
+            attrs = (f"BANDWIDTH={rendition.peak_bitrate},AVERAGE-BANDWIDTH={rendition.average_bitrate},"
+                     f"RESOLUTION={rendition.width}x{rendition.height}")
+            if rendition.codecs:
+                attrs += f',CODECS="{rendition.codecs}"'
+        else:
+            attrs = f"BANDWIDTH={profile_bandwidth(profile)},RESOLUTION={resolution}"
+        lines.append(f'#EXT-X-STREAM-INF:{attrs}')
+        lines.append(variant_uris[profile['name']])
+    return "\n".join(lines)
+
+
+def regenerate_master_playlist(remote_base: str, profiles: list, storage, expires: int, temp_dir: str,
+                               renditions: Optional[dict] = None) -> tuple:
     """Создаёт мастер-плейлист с подписанными URL на варианты."""
     variant_signed_urls = {}
     for profile in profiles:
         variant_remote = remote_base + f"out_{profile['name']}.m3u8"
         variant_signed_urls[profile['name']] = storage.get_signed_url(variant_remote, expires=expires)
 
-    new_lines = ["#EXTM3U", "#EXT-X-VERSION:3"]
-    for profile in profiles:
-        bandwidth = int(profile['video_bitrate'].replace('k', '000')) + int(profile['audio_bitrate'].replace('k', '000'))
-        resolution = f"{profile['width']}x{profile['height']}"
-        new_lines.append(f'#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},RESOLUTION={resolution}')
-        new_lines.append(variant_signed_urls[profile['name']])
-
-    new_content = "\n".join(new_lines)
+    new_content = build_master_playlist(profiles, variant_signed_urls, renditions)
     master_local = os.path.join(temp_dir, "master_signed.m3u8")
     with open(master_local, 'w') as f:
         f.write(new_content)
@@ -143,70 +394,403 @@ def regenerate_master_playlist(remote_base: str, profiles: list, storage, expire
     return master_remote, variant_signed_urls
 
 
+def is_dynamic_delivery() -> bool:
+    """
+    HLS_DELIVERY_MODE == 'dynamic': плейлисты в хранилище не переписываются,
+    Django отдаёт их сам и подписывает сегменты в момент запроса (см. hls_delivery).
+    """
+    return getattr(settings, 'HLS_DELIVERY_MODE', 'presigned') == 'dynamic'
+
+
+def is_token_delivery() -> bool:
+    """
+    HLS_DELIVERY_MODE == 'token': плейлисты в хранилище неизменны (относительные URI),
+    доступ к каталогу {id}/hls/ открывает один токен в URL (см. storage.get_token_url).
+    """
+    return getattr(settings, 'HLS_DELIVERY_MODE', 'presigned') == 'token'
+
+
+def is_presigned_delivery() -> bool:
+    """Подписанные плейлисты хранятся в хранилище и периодически переписываются."""
+    return not (is_dynamic_delivery() or is_token_delivery())
+
+
+def save_static_master_playlist(remote_base: str, profiles: list, storage, temp_dir: str,
+                                renditions: Optional[dict] = None) -> str:
+    """Мастер-плейлист с относительными URI вариантов (не зависит от подписей)."""
+    uris = {p['name']: f"out_{p['name']}.m3u8" for p in profiles}
+    master_local = os.path.join(temp_dir, "master_static.m3u8")
+    with open(master_local, 'w') as f:
+        f.write(build_master_playlist(profiles, uris, renditions) + "\n")
+    master_remote = remote_base + "master.m3u8"
+    storage.move_file(master_local, master_remote)
+    return master_remote
+
+
+# ----- Индекс профилей и сегментов HLS в БД -----
+def get_renditions(obj) -> dict:
+    """Проиндексированные профили объекта: {имя: HlsRendition} (один запрос)."""
+    return {r.name: r for r in obj.hls_renditions.all()}
+
+
+def parse_variant_playlist(path: str) -> tuple:
+    """Разбирает локальный вариантный плейлист: (EXT-X-TARGETDURATION, [(имя сегмента, длительность)])."""
+    target_duration = 0
+    segments = []
+    duration = None
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith('#EXT-X-TARGETDURATION:'):
+                target_duration = int(float(line.split(':', 1)[1]))
+            elif line.startswith('#EXTINF:'):
+                duration = float(line.split(':', 1)[1].split(',')[0])
+            elif line and not line.startswith('#'):
+                segments.append((line.split('/')[-1].split('?')[0], duration or 0.0))
+                duration = None
+    return target_duration, segments
+
+
+def _rendition_codecs(first_segment: str, profile: dict, has_audio: bool) -> str:
+    """CODECS профиля: профиль и уровень H.264 берутся из ffprobe сегмента, иначе оцениваются."""
+    try:
+        probe = probe_media(first_segment)
+        return hls_codecs_string(probe.video_profile, probe.video_level, probe.has_audio)
+    except Exception as e:
+        logger.warning(f"Не удалось определить кодеки сегмента {first_segment}: {e}")
+        level = estimate_h264_level(profile['width'], profile['height'], None)
+        return hls_codecs_string(profile.get('profile'), level, has_audio)
+
+
+def index_hls_renditions(obj, temp_dir: str, remote_base: str, profiles: list) -> dict:
+    """
+    Записывает в БД профили и сегменты закодированного HLS из temp_dir
+    (до загрузки в хранилище, пока файлы локальные). Заменяет прежний индекс объекта.
+    """
+    from .models import HlsRendition, HlsSegment
+
+    has_audio = MediaProbe.from_dict(obj.source_probe).has_audio if obj.source_probe else True
+    renditions = {}
+    with transaction.atomic():
+        obj.hls_renditions.all().delete()
+        for profile in profiles:
+            playlist = os.path.join(temp_dir, f"out_{profile['name']}.m3u8")
+            target_duration, segments = parse_variant_playlist(playlist)
+            sizes = [os.path.getsize(os.path.join(temp_dir, name)) for name, _ in segments]
+            duration = sum(d for _, d in segments)
+            total_bytes = sum(sizes)
+            peak = max((size * 8 / d for size, (_, d) in zip(sizes, segments) if d > 0), default=0)
+
+            rendition = HlsRendition.objects.create(
+                content_object=obj,
+                name=profile['name'],
+                width=profile['width'],
+                height=profile['height'],
+                remote_base=remote_base,
+                target_duration=target_duration or profile.get('hls_time', 10),
+                segment_count=len(segments),
+                duration=duration,
+                total_bytes=total_bytes,
+                average_bitrate=int(total_bytes * 8 / duration) if duration else 0,
+                peak_bitrate=int(peak),
+                codecs=_rendition_codecs(os.path.join(temp_dir, segments[0][0]), profile, has_audio)
+                if segments else "",
+            )
+            HlsSegment.objects.bulk_create([
+                HlsSegment(rendition=rendition, sequence=i, name=name, duration=d, byte_size=size)
+                for i, ((name, d), size) in enumerate(zip(segments, sizes))
+            ])
+            renditions[profile['name']] = rendition
+            logger.info(
+                f"Профиль {profile['name']} проиндексирован: {len(segments)} сегментов, "
+                f"{rendition.average_bitrate // 1000} кбит/с (пик {rendition.peak_bitrate // 1000}), {rendition.codecs}"
+            )
+    return renditions
+
+
 # ----- Универсальная обработка и обновление ссылок -----
+def publish_hls_output(obj, temp_dir: str, remote_base: str, profiles: list, storage) -> None:
+    """
+    Загружает закодированные файлы из temp_dir, подписывает плейлисты,
+    помечает объект обработанным и удаляет исходник.
+    """
+    from .hls_delivery import invalidate_segment_cache
+
+    renditions = index_hls_renditions(obj, temp_dir, remote_base, profiles)
+    upload_all_files(temp_dir, remote_base, storage, progress_callback=_log_upload_progress, move=True)
+    invalidate_segment_cache(remote_base, [p['name'] for p in profiles])
+
+    expires = settings.AWS_QUERYSTRING_EXPIRE
+    if not is_presigned_delivery():
+        # Плейлисты остаются в хранилище как есть: подпись сегментов при каждом запросе
+        # ('dynamic') или один токен на каталог ('token', нужен мастер-плейлист в хранилище)
+        if is_token_delivery():
+            save_static_master_playlist(remote_base, profiles, storage, temp_dir, renditions)
+        obj.hls_master_playlist = ""
+        obj.hls_profiles = {p['name']: remote_base + f"out_{p['name']}.m3u8" for p in profiles}
+    else:
+        rewrite_variant_playlists(remote_base, profiles, storage, expires, temp_dir, renditions)
+
+        master_remote, variant_signed_urls = regenerate_master_playlist(
+            remote_base, profiles, storage, expires, temp_dir, renditions
+        )
+
+        obj.hls_master_playlist = storage.get_signed_url(master_remote, expires=expires)
+        obj.hls_profiles = variant_signed_urls
+    obj.is_processed = True
+    obj.processing_error = ""
+    obj.hls_links_refreshed_at = timezone.now()
+    obj.hls_last_ttl = expires
+    obj.save(update_fields=[
+        "hls_master_playlist", "hls_profiles", "is_processed",
+        "processing_error", "hls_links_refreshed_at", "hls_last_ttl"
+    ])
+
+    delete_original_file(obj)
+    logger.info(f"{obj.__class__.__name__} {obj.id} успешно обработано")
+
+
+def _mark_processing_failed(obj, error: Exception) -> None:
+    logger.exception(f"Ошибка обработки {obj.__class__.__name__} {obj.id}: {error}")
+    obj.is_processed = False
+    obj.processing_error = str(error)
+    obj.save(update_fields=["is_processed", "processing_error"])
+
+
 def process_video_to_hls_generic(obj, remote_base_prefix: str) -> None:
     """
     Универсальная функция обработки видео в HLS.
     obj: экземпляр Video или MarathonVideo.
     remote_base_prefix: префикс пути в хранилище (например, '' для Video, 'marathon_video/' для MarathonVideo).
+    Длинные видео (см. use_chunked_encoding) уходят в распределённое кодирование по кускам.
     """
     storage = get_video_storage()
     with tempfile.TemporaryDirectory(prefix=f"hls_{obj.id}_") as temp_dir:
         try:
             local_input = get_or_download_source(obj.file, temp_dir, storage)
 
-            width, height = get_video_resolution(local_input)
-            framerate = get_video_framerate(local_input)
-            profiles = filter_profiles(height, MASTER_BITRATE_LADDER)
+            probe = get_source_probe(obj, local_input)
+            profiles = filter_profiles(probe.height, MASTER_BITRATE_LADDER)
             if not profiles:
                 raise RuntimeError("Нет подходящих профилей")
 
-            logger.info(f"Обработка {obj.__class__.__name__} {obj.id}: {width}x{height}, профили: {[p['name'] for p in profiles]}")
+            logger.info(f"Обработка {obj.__class__.__name__} {obj.id}: {probe.width}x{probe.height}, профили: {[p['name'] for p in profiles]}")
 
-            encode_all_profiles(local_input, temp_dir, profiles, framerate)
+            if use_chunked_encoding(probe):
+                start_chunked_encoding(obj, remote_base_prefix, local_input, temp_dir, storage, profiles, probe)
+                return
+
+            encode_all_profiles(local_input, temp_dir, profiles, probe.framerate, probe)
+            # Скачанный исходник больше не нужен и не должен попасть в выгрузку HLS
+            if os.path.dirname(local_input) == temp_dir:
+                os.remove(local_input)
 
             remote_base = f"{remote_base_prefix}{obj.id}/hls/"
-            upload_all_files(temp_dir, remote_base, storage)
+            publish_hls_output(obj, temp_dir, remote_base, profiles, storage)
 
-            expires = settings.AWS_QUERYSTRING_EXPIRE
-            rewrite_variant_playlists(remote_base, profiles, storage, expires, temp_dir)
+        except Exception as e:
+            _mark_processing_failed(obj, e)
+            raise
 
-            master_remote, variant_signed_urls = regenerate_master_playlist(
-                remote_base, profiles, storage, expires, temp_dir
-            )
 
-            obj.hls_master_playlist = storage.get_signed_url(master_remote, expires=expires)
-            obj.hls_profiles = variant_signed_urls
-            obj.is_processed = True
-            obj.processing_error = ""
-            obj.hls_links_refreshed_at = timezone.now()
-            obj.hls_last_ttl = expires
-            obj.save(update_fields=[
-                "hls_master_playlist", "hls_profiles", "is_processed",
-                "processing_error", "hls_links_refreshed_at", "hls_last_ttl"
-            ])
+# ----- Распределённое кодирование по кускам -----
+def use_chunked_encoding(probe: MediaProbe) -> bool:
+    """
+    Нужно ли кодировать видео по кускам на нескольких воркерах
+    (HLS_CHUNKED_ENCODING включено и длительность >= HLS_CHUNKED_MIN_DURATION).
+    """
+    if not getattr(settings, "HLS_CHUNKED_ENCODING", False):
+        return False
+    return bool(probe.duration) and probe.duration >= getattr(settings, "HLS_CHUNKED_MIN_DURATION", 1200)
+
+
+def _profiles_by_names(profile_names: list) -> list:
+    return [p for p in MASTER_BITRATE_LADDER if p["name"] in profile_names]
 
-            delete_original_file(obj)
-            logger.info(f"{obj.__class__.__name__} {obj.id} успешно обработано")
+
+def start_chunked_encoding(obj, remote_base_prefix: str, local_input: str, temp_dir: str, storage,
+                           profiles: list, probe: MediaProbe) -> None:
+    """
+    Режет видео исходника на куски с границами, кратными hls_time, кодирует звук
+    один раз на каждый битрейт профилей, выкладывает всё в хранилище
+    ({prefix}{id}/chunks/) и запускает chord: кодирование каждого куска отдельной
+    задачей Celery, затем finalize_chunked_hls собирает непрерывные HLS-плейлисты.
+    Если кусок или сборка окончательно упали, chunked_hls_failed помечает объект
+    и удаляет промежуточные куски.
+    """
+    from celery import chord
+    from .tasks import encode_hls_chunk, finalize_chunked_hls, chunked_hls_failed
+
+    chunks_dir = os.path.join(temp_dir, "chunks")
+    os.makedirs(chunks_dir, exist_ok=True)
+    chunks = split_into_chunks(
+        local_input, chunks_dir, getattr(settings, "HLS_CHUNK_DURATION", 300),
+        profiles[0].get("hls_time", 10), probe.duration,
+    )
+
+    chunks_base = f"{remote_base_prefix}{obj.id}/chunks/"
+    for index, chunk in enumerate(chunks):
+        storage.move_file(chunk["path"], chunks_base + f"src_{index:03d}.mkv")
+
+    audio_tracks = {}
+    if probe.has_audio:
+        for audio_bitrate in sorted({p["audio_bitrate"] for p in profiles}):
+            local_audio = os.path.join(chunks_dir, f"audio_{audio_bitrate}.m4a")
+            encode_audio_track(local_input, local_audio, audio_bitrate, chunks[0]["start"])
+            audio_tracks[audio_bitrate] = chunks_base + f"audio_{audio_bitrate}.m4a"
+            storage.move_file(local_audio, audio_tracks[audio_bitrate])
+
+    profile_names = [p["name"] for p in profiles]
+    chord(
+        encode_hls_chunk.s(chunks_base, index, profile_names, probe.framerate, chunk["start"], chunk["end"])
+        for index, chunk in enumerate(chunks)
+    )(
+        finalize_chunked_hls.s(obj._meta.label, obj.id, remote_base_prefix, profile_names, audio_tracks)
+        .on_error(chunked_hls_failed.s(obj._meta.label, obj.id, remote_base_prefix))
+    )
+    logger.info(f"{obj.__class__.__name__} {obj.id}: {len(chunks)} кусков отправлено на кодирование")
+
+
+def encode_chunk_generic(chunks_base: str, index: int, profile_names: list, framerate: Optional[float] = None,
+                         start: float = 0.0, end: Optional[float] = None) -> dict:
+    """
+    Кодирует видео одного куска (метки исходника [start, end)) во все профили
+    и выкладывает результат в хранилище.
+    Возвращает {"index": номер куска, "encoded": {имя профиля: путь в хранилище}}.
+    """
+    storage = get_video_storage()
+    threads = get_encoder_thread_budget()
+    encoded = {}
+    with tempfile.TemporaryDirectory(prefix=f"hls_chunk_{index}_") as temp_dir:
+        local_chunk = os.path.join(temp_dir, "chunk.mkv")
+        storage.load_file(chunks_base + f"src_{index:03d}.mkv", local_chunk)
+
+        for profile in _profiles_by_names(profile_names):
+            local_out = os.path.join(temp_dir, f"enc_{profile['name']}.mkv")
+            encode_chunk_profile(local_chunk, local_out, profile, start, end, framerate, threads)
+            remote_out = chunks_base + f"enc_{profile['name']}_{index:03d}.mkv"
+            storage.move_file(local_out, remote_out)
+            encoded[profile["name"]] = remote_out
+
+    logger.info(f"Кусок {index} ({chunks_base}) закодирован: {list(encoded)}")
+    return {"index": index, "encoded": encoded}
+
+
+def finalize_chunked_generic(obj, remote_base_prefix: str, chunk_results: list, profile_names: list,
+                             audio_tracks: Optional[dict] = None) -> None:
+    """
+    Собирает закодированные куски каждого профиля в непрерывный HLS
+    (сквозная нумерация сегментов, без EXT-X-DISCONTINUITY) со звуком из
+    audio_tracks ({битрейт: путь в хранилище}), публикует его и удаляет
+    промежуточные куски из хранилища.
+    """
+    storage = get_video_storage()
+    profiles = _profiles_by_names(profile_names)
+    chunk_results = sorted(chunk_results, key=lambda r: r["index"])
+    chunks_base = f"{remote_base_prefix}{obj.id}/chunks/"
+    audio_tracks = audio_tracks or {}
+
+    # Куски скачиваются в отдельную папку, чтобы upload_all_files выгрузил только HLS
+    with tempfile.TemporaryDirectory(prefix=f"hls_{obj.id}_") as temp_dir, \
+            tempfile.TemporaryDirectory(prefix=f"hls_chunks_{obj.id}_") as work_dir:
+        try:
+            local_audio = {}
+            for audio_bitrate, remote_audio in audio_tracks.items():
+                local_audio[audio_bitrate] = os.path.join(work_dir, os.path.basename(remote_audio))
+                storage.load_file(remote_audio, local_audio[audio_bitrate])
+
+            for profile in profiles:
+                local_chunks = []
+                for result in chunk_results:
+                    remote_chunk = result["encoded"][profile["name"]]
+                    local_chunk = os.path.join(work_dir, os.path.basename(remote_chunk))
+                    storage.load_file(remote_chunk, local_chunk)
+                    local_chunks.append(local_chunk)
+
+                package_hls_from_chunks(local_chunks, temp_dir, profile, local_audio.get(profile["audio_bitrate"]))
+                for local_chunk in local_chunks:
+                    os.remove(local_chunk)
+
+            remote_base = f"{remote_base_prefix}{obj.id}/hls/"
+            publish_hls_output(obj, temp_dir, remote_base, profiles, storage)
 
         except Exception as e:
-            logger.exception(f"Ошибка обработки {obj.__class__.__name__} {obj.id}: {e}")
-            obj.is_processed = False
-            obj.processing_error = str(e)
-            obj.save(update_fields=["is_processed", "processing_error"])
+            _mark_processing_failed(obj, e)
             raise
 
+    _delete_chunks(storage, chunks_base)
+
+
+def _delete_chunks(storage, chunks_base: str) -> None:
+    try:
+        storage.delete_prefix(chunks_base)
+    except Exception as e:
+        logger.warning(f"Не удалось удалить промежуточные куски {chunks_base}: {e}")
+
+
+def fail_chunked_encoding(obj, remote_base_prefix: str, error: Exception) -> None:
+    """
+    Обработчик окончательной ошибки chord: кусок не закодировался после всех
+    повторов или сборка не удалась. Помечает объект и удаляет промежуточные куски.
+    """
+    _mark_processing_failed(obj, error)
+    _delete_chunks(get_video_storage(), f"{remote_base_prefix}{obj.id}/chunks/")
+
+
+# Поля подписанных ссылок (режим 'presigned')
+LINK_FIELDS = ["hls_master_playlist", "hls_profiles", "hls_links_refreshed_at", "hls_last_ttl"]
+
 
 def refresh_video_links_generic(obj, remote_base: str, expires: int) -> bool:
     """
     Универсальная перегенерация подписанных ссылок для уже обработанного видео.
+    Если ссылки уже обновляет другой процесс, ждёт его результата и возвращает True,
+    когда у объекта есть действующие ссылки.
     """
     if not obj.is_processed:
         logger.warning(f"{obj.__class__.__name__} {obj.id} не обработано")
         return False
 
+    if not is_presigned_delivery():
+        # Плейлисты в хранилище не содержат подписей, переписывать нечего
+        logger.debug(f"{obj.__class__.__name__} {obj.id}: ссылки выдаются при запросе, обновление не требуется")
+        return True
+
+    # Одновременно ссылки объекта обновляет только один процесс, иначе параллельные
+    # запросы переписывают одни и те же плейлисты поверх друг друга
+    lock_key = f"hls:refresh-lock:{obj._meta.label}:{obj.id}"
+    refreshed_at = obj.hls_links_refreshed_at
+    with single_flight(lock_key, getattr(settings, 'HLS_REFRESH_LOCK_TTL', 120)) as acquired:
+        if acquired:
+            obj.refresh_from_db(fields=LINK_FIELDS)
+            if obj.hls_links_refreshed_at != refreshed_at and obj.hls_last_ttl == expires:
+                logger.debug(f"Ссылки {obj.__class__.__name__} {obj.id} уже обновлены другим процессом")
+                return True
+            return _refresh_video_links(obj, remote_base, expires)
+
+    return _wait_for_links_refresh(obj, lock_key)
+
+
+def _wait_for_links_refresh(obj, lock_key: str) -> bool:
+    """
+    Ссылки обновляет другой процесс: ждём его недолго и берём результат из БД.
+    Если ждать дольше нельзя, годятся и прежние ссылки, пока они не истекли.
+    """
+    try:
+        wait_for_release(lock_key, getattr(settings, 'HLS_REFRESH_LOCK_WAIT', 5.0))
+    except redis.RedisError as e:
+        logger.warning(f"Не удалось дождаться обновления ссылок {obj.__class__.__name__} {obj.id}: {e}")
+    obj.refresh_from_db(fields=LINK_FIELDS)
+    return not hls_links_expired(obj)
+
+
+def _refresh_video_links(obj, remote_base: str, expires: int) -> bool:
     storage = get_video_storage()
-    profiles = get_existing_profiles(remote_base, storage)
+    renditions = get_renditions(obj)
+    if renditions:
+        profiles = [p for p in MASTER_BITRATE_LADDER if p['name'] in renditions]
+    else:
+        profiles = get_existing_profiles(remote_base, storage)
     if not profiles:
         logger.error(f"Для {obj.__class__.__name__} {obj.id} нет вариантных плейлистов")
         return False
@@ -215,19 +799,16 @@ def refresh_video_links_generic(obj, remote_base: str, expires: int) -> bool:
 
     try:
         with tempfile.TemporaryDirectory(prefix=f"refresh_{obj.id}_") as temp_dir:
-            rewrite_variant_playlists(remote_base, profiles, storage, expires, temp_dir)
+            rewrite_variant_playlists(remote_base, profiles, storage, expires, temp_dir, renditions)
             master_remote, variant_signed_urls = regenerate_master_playlist(
-                remote_base, profiles, storage, expires, temp_dir
+                remote_base, profiles, storage, expires, temp_dir, renditions
             )
 
             obj.hls_master_playlist = storage.get_signed_url(master_remote, expires=expires)
             obj.hls_profiles = variant_signed_urls
             obj.hls_links_refreshed_at = timezone.now()
             obj.hls_last_ttl = expires
-            obj.save(update_fields=[
-                "hls_master_playlist", "hls_profiles",
-                "hls_links_refreshed_at", "hls_last_ttl"
-            ])
+            obj.save(update_fields=LINK_FIELDS)
             logger.info(f"Ссылки для {obj.__class__.__name__} {obj.id} обновлены")
             return True
     except Exception as e:
@@ -245,4 +826,92 @@ def refresh_video_links(video_id: int) -> bool:
 def refresh_marathon_video_links(marathon_video_id: int) -> bool:
     from .models import MarathonVideo
     mv = MarathonVideo.objects.get(id=marathon_video_id)
-    return refresh_video_links_generic(mv, f"marathon_video/{mv.id}/hls/", settings.AWS_QUERYSTRING_EXPIRE)
\ No newline at end of file
+    return refresh_video_links_generic(mv, f"marathon_video/{mv.id}/hls/", settings.AWS_QUERYSTRING_EXPIRE)
+
+
+# ----- Фоновое обновление ссылок до истечения -----
+# Модель -> префикс HLS в хранилище
+HLS_REMOTE_PREFIXES = {
+    'core.Video': '',
+    'core.MarathonVideo': 'marathon_video/',
+}
+
+
+def hls_remote_base(obj) -> str:
+    return f"{HLS_REMOTE_PREFIXES[obj._meta.label]}{obj.id}/hls/"
+
+
+def hls_links_need_refresh(obj, ahead: float = 0.8) -> bool:
+    """
+    Нужно ли обновить подписанные ссылки: TTL изменился, ссылки не создавались
+    или прошло не меньше ahead * TTL с последнего обновления.
+    """
+    ttl = settings.AWS_QUERYSTRING_EXPIRE
+    if obj.hls_last_ttl != ttl or not obj.hls_links_refreshed_at:
+        return True
+    return (timezone.now() - obj.hls_links_refreshed_at).total_seconds() >= ttl * ahead
+
+
+def hls_links_expired(obj) -> bool:
+    """Ссылки уже недействительны — без синхронного обновления видео не воспроизвести."""
+    return hls_links_need_refresh(obj, ahead=1.0)
+
+
+def schedule_hls_links_refresh(obj) -> bool:
+    """
+    Ставит фоновое обновление ссылок объекта (не чаще раза в четверть TTL на объект).
+    Возвращает True, если задача поставлена.
+    """
+    from .tasks import refresh_hls_links
+
+    ttl = settings.AWS_QUERYSTRING_EXPIRE
+    if not cache.add(f"hls:refresh-queued:{obj._meta.label}:{obj.id}", 1, max(1, ttl // 4)):
+        return False
+    refresh_hls_links.delay(obj._meta.label, obj.id)
+    logger.debug(f"Обновление ссылок {obj.__class__.__name__} {obj.id} поставлено в очередь")
+    return True
+
+
+def get_expiring_hls_objects(batch_size: int) -> list:
+    """
+    Обработанные Video и MarathonVideo, у которых прошло HLS_REFRESH_AHEAD * TTL
+    с обновления ссылок (или сменился TTL). Первыми идут просмотренные за
+    HLS_REFRESH_ACTIVE_WINDOW, внутри группы — с самыми старыми ссылками.
+    """
+    ttl = settings.AWS_QUERYSTRING_EXPIRE
+    now = timezone.now()
+    stale_before = now - timedelta(seconds=ttl * getattr(settings, 'HLS_REFRESH_AHEAD', 0.5))
+    active_since = now - timedelta(seconds=getattr(settings, 'HLS_REFRESH_ACTIVE_WINDOW', 86400))
+    never = datetime.min.replace(tzinfo=dt_timezone.utc)
+
+    def priority(obj):
+        is_active = obj.last_viewed_at is not None and obj.last_viewed_at >= active_since
+        return (not is_active, obj.hls_links_refreshed_at or never)
+
+    candidates = []
+    for label in HLS_REMOTE_PREFIXES:
+        model = apps.get_model(label)
+        candidates.extend(
+            model.objects.filter(is_processed=True)
+            .filter(
+                Q(hls_links_refreshed_at__isnull=True) | Q(hls_links_refreshed_at__lte=stale_before)
+                | Q(hls_last_ttl__isnull=True) | ~Q(hls_last_ttl=ttl)
+            )
+            .order_by(
+                Case(When(last_viewed_at__gte=active_since, then=Value(0)), default=Value(1)),
+                F('hls_links_refreshed_at').asc(nulls_first=True),
+            )[:batch_size]
+        )
+    candidates.sort(key=priority)
+    return candidates[:batch_size]
+
+
+def refresh_expiring_links_batch(batch_size: Optional[int] = None) -> int:
+    """Ставит в очередь обновление ссылок для пачки устаревающих объектов. Возвращает число задач."""
+    if not is_presigned_delivery():
+        return 0
+    batch_size = batch_size or getattr(settings, 'HLS_REFRESH_BATCH_SIZE', 100)
+    scheduled = sum(schedule_hls_links_refresh(obj) for obj in get_expiring_hls_objects(batch_size))
+    if scheduled:
+        logger.info(f"Поставлено обновление ссылок HLS: {scheduled}")
+    return scheduled
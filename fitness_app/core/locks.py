@@ -0,0 +1,91 @@
+# fitness_app/core/locks.py
+"""
+Распределённые блокировки на Redis (тот же Redis, что у Celery и Channels).
+
+single_flight гарантирует, что операция с данным ключом одновременно выполняется
+только в одном процессе: SET NX PX с уникальным токеном, снятие — Lua-скриптом,
+который удаляет ключ, только если он всё ещё принадлежит владельцу.
+"""
+
+import time
+import uuid
+import logging
+from contextlib import contextmanager
+from typing import Optional
+
+import redis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Удалить ключ, только если в нём наш токен (блокировка не перехвачена после истечения PX)
+RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+else
+    return 0
+end
+"""
+
+_client: Optional[redis.Redis] = None
+
+
+def get_redis() -> redis.Redis:
+    """Общий клиент Redis процесса (LOCK_REDIS_URL)."""
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(
+            getattr(settings, 'LOCK_REDIS_URL', 'redis://redis:6379/1'),
+            socket_timeout=2,
+            socket_connect_timeout=2,
+        )
+    return _client
+
+
+def acquire_lock(key: str, ttl: float) -> Optional[str]:
+    """Пытается взять блокировку на ttl секунд. Возвращает токен владельца или None."""
+    token = uuid.uuid4().hex
+    if get_redis().set(key, token, nx=True, px=int(ttl * 1000)):
+        return token
+    return None
+
+
+def release_lock(key: str, token: str) -> bool:
+    return bool(get_redis().eval(RELEASE_SCRIPT, 1, key, token))
+
+
+def wait_for_release(key: str, timeout: float, poll_interval: float = 0.1) -> bool:
+    """Ждёт снятия блокировки не дольше timeout секунд. True — блокировка снята."""
+    deadline = time.monotonic() + timeout
+    client = get_redis()
+    while time.monotonic() < deadline:
+        if not client.exists(key):
+            return True
+        time.sleep(poll_interval)
+    return not client.exists(key)
+
+
+@contextmanager
+def single_flight(key: str, ttl: float):
+    """
+    Контекстный менеджер: отдаёт True, если блокировка взята (операцию выполняем мы),
+    и False, если её держит другой процесс. Если Redis недоступен, операция
+    выполняется без блокировки (как до её появления).
+    """
+    try:
+        token = acquire_lock(key, ttl)
+    except redis.RedisError as e:
+        logger.warning(f"Redis недоступен, {key} выполняется без блокировки: {e}")
+        yield True
+        return
+
+    if token is None:
+        yield False
+        return
+    try:
+        yield True
+    finally:
+        try:
+            release_lock(key, token)
+        except redis.RedisError as e:
+            logger.warning(f"Не удалось снять блокировку {key}: {e}")
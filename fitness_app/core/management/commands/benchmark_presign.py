@@ -0,0 +1,73 @@
+# fitness_app/core/management/commands/benchmark_presign.py
+
+import time
+from datetime import datetime, timezone
+from urllib.parse import parse_qs, urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from fitness_app.core.storage import CloudRuS3VideoStorage, GenericS3VideoStorage
+
+# Подпись выполняется локально, поэтому для замера достаточно фиктивных параметров
+BACKENDS = {
+    'cloudru': (CloudRuS3VideoStorage, 'https://s3.cloud.ru', 'ru-central-1'),
+    'generic': (GenericS3VideoStorage, 'https://storage.example.com', 'us-east-1'),
+}
+
+
+class Command(BaseCommand):
+    help = "Сравнивает подпись сегментов по одному (boto3 generate_presigned_url) и пачкой (get_signed_urls)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--segments", type=int, default=1000, help="Число сегментов в плейлисте")
+        parser.add_argument("--repeat", type=int, default=5, help="Повторов замера (берётся лучший)")
+        parser.add_argument("--backend", choices=list(BACKENDS), action="append",
+                            help="Бэкенд (по умолчанию все)")
+
+    def handle(self, *args, **options):
+        keys = [f"1/hls/out_720p_{i:03d}.ts" for i in range(options["segments"])]
+        expires = settings.AWS_QUERYSTRING_EXPIRE
+
+        for name in options["backend"] or list(BACKENDS):
+            storage_class, endpoint_url, region_name = BACKENDS[name]
+            storage = storage_class(
+                bucket_name="benchmark", endpoint_url=endpoint_url, region_name=region_name,
+                access_key="AKIDEXAMPLE", secret_key="wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY",
+            )
+            self._verify(storage, keys[:3], expires)
+
+            single = self._best(options["repeat"], lambda: [self._boto3_url(storage, k, expires) for k in keys])
+            batch = self._best(options["repeat"], lambda: storage.get_signed_urls(keys, expires=expires))
+            self.stdout.write(
+                f"{name}: {len(keys)} сегментов — по одному {single * 1000:.1f} мс, "
+                f"пачкой {batch * 1000:.1f} мс, ускорение x{single / batch:.1f}"
+            )
+
+    @staticmethod
+    def _best(repeat: int, func) -> float:
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+        return min(timings)
+
+    @staticmethod
+    def _boto3_url(storage, key: str, expires: int) -> str:
+        return storage.client.generate_presigned_url(
+            ClientMethod='get_object', Params={'Bucket': storage.bucket_name, 'Key': key}, ExpiresIn=expires,
+        )
+
+    def _verify(self, storage, keys: list, expires: int) -> None:
+        """
+        Подписи пачкой должны совпадать с boto3: время подписи берётся из X-Amz-Date
+        ссылки boto3 и передаётся presigner явно.
+        """
+        for key in keys:
+            expected = self._boto3_url(storage, key, expires)
+            amz_date = parse_qs(urlsplit(expected).query)["X-Amz-Date"][0]
+            now = datetime.strptime(amz_date, "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc)
+            actual = storage.presigner.sign([key], expires, now=now)[0]
+            if expected != actual:
+                raise AssertionError(f"Подписи не совпадают с boto3:\n{expected}\n{actual}")
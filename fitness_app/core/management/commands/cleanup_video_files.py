@@ -1,33 +1,137 @@
 # fitness_app/core/management/commands/cleanup_video_files.py
-# Выполнить: docker compose exec web python manage.py cleanup_video_files
-from django.core.management.base import BaseCommand
-from fitness_app.core.models import Video
+# Выполнить: docker compose exec web python manage.py cleanup_video_files [--dry-run]
+"""
+Удаляет из хранилища видео (локального или S3) файлы HLS и куски параллельного
+кодирования ({prefix}{id}/hls/, {prefix}{id}/chunks/) видео, которых нет в БД.
+
+Листинг бакета читается постранично и обрабатывается пачками: для каждой пачки
+существование id проверяется одним запросом filter(id__in=...), поэтому память
+не зависит от размера бакета и числа видео. Сироты удаляются пачками
+DeleteObjects в несколько потоков. После каждой пачки последний обработанный
+ключ пишется в файл --checkpoint, и повторный запуск продолжает с него
+(StartAfter в S3).
+"""
+
+import json
 import os
-import shutil
-from django.conf import settings
+import re
+import time
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from fitness_app.core.hls_utils import HLS_REMOTE_PREFIXES
+from fitness_app.core.storage import get_video_storage
+
+# Каталоги объекта, которые создаёт обработка видео
+SWEEP_SUBDIRS = ('hls', 'chunks')
+
 
 class Command(BaseCommand):
-    help = 'Удаляет папки videos/{id}/hls/ для несуществующих видео и очищает orphaned исходники'
+    help = 'Удаляет из хранилища HLS-файлы и куски кодирования видео, которых нет в БД'
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Только показать, что будет удалено")
+        parser.add_argument("--batch-size", type=int, default=5000,
+                            help="Ключей листинга на одну проверку в БД и одно удаление")
+        parser.add_argument("--workers", type=int, default=None,
+                            help="Потоков удаления (по умолчанию S3_DELETE_WORKERS)")
+        parser.add_argument("--rate-limit", type=float, default=0,
+                            help="Не больше N удалённых объектов в секунду (0 — без ограничения)")
+        parser.add_argument("--checkpoint", default=None,
+                            help="Файл с позицией листинга для продолжения прерванного запуска")
 
     def handle(self, *args, **options):
-        media_videos_path = os.path.join(settings.MEDIA_ROOT, 'videos')
-        if not os.path.exists(media_videos_path):
-            self.stdout.write("Папка videos не найдена")
+        self.storage = get_video_storage()
+        self.options = options
+        self.state = self._load_checkpoint()
+        self.stats = {'scanned': 0, 'orphans': 0, 'deleted': 0}
+        self.orphan_ids = set()
+        self.started = time.monotonic()
+
+        for model_label, prefix in HLS_REMOTE_PREFIXES.items():
+            model = apps.get_model(model_label)
+            key_re = re.compile(rf"^{re.escape(prefix)}(\d+)/(?:{'|'.join(SWEEP_SUBDIRS)})/")
+            # id не начинается с нуля: листинг по первой цифре не затрагивает чужие каталоги
+            for digit in "123456789":
+                self._sweep(model, key_re, f"{prefix}{digit}")
+
+        elapsed = time.monotonic() - self.started
+        verb = "Будет удалено" if options["dry_run"] else "Удалено"
+        self.stdout.write(
+            f"Просмотрено {self.stats['scanned']} объектов за {elapsed:.1f} с; "
+            f"сирот: {self.stats['orphans']} ({len(self.orphan_ids)} видео); "
+            f"{verb}: {self.stats['orphans'] if options['dry_run'] else self.stats['deleted']}"
+        )
+        if options["checkpoint"] and not options["dry_run"] and os.path.exists(options["checkpoint"]):
+            os.remove(options["checkpoint"])
+        self.stdout.write(self.style.SUCCESS("Очистка завершена"))
+
+    def _sweep(self, model, key_re, list_prefix: str) -> None:
+        if list_prefix in self.state['done']:
             return
+        start_after = self.state['last_key'] if self.state['prefix'] == list_prefix else None
+        if start_after:
+            self.stdout.write(f"{list_prefix}: продолжаем после {start_after}")
+
+        batch = []
+        for key in self.storage.list_prefix(list_prefix, start_after=start_after):
+            batch.append(key)
+            if len(batch) >= self.options["batch_size"]:
+                self._process_batch(model, key_re, list_prefix, batch)
+                batch = []
+        if batch:
+            self._process_batch(model, key_re, list_prefix, batch)
+
+        self.state['done'].append(list_prefix)
+        self.state['prefix'] = self.state['last_key'] = None
+        self._save_checkpoint()
 
-        existing_ids = set(Video.objects.values_list('id', flat=True))
+    def _process_batch(self, model, key_re, list_prefix: str, keys: list) -> None:
+        self.stats['scanned'] += len(keys)
+        keys_by_id = {}
+        for key in keys:
+            match = key_re.match(key)
+            if match:
+                keys_by_id.setdefault(int(match.group(1)), []).append(key)
 
-        # Удаляем папки, для которых нет видео в БД
-        for item in os.listdir(media_videos_path):
-            item_path = os.path.join(media_videos_path, item)
-            if os.path.isdir(item_path) and item.isdigit():
-                vid = int(item)
-                if vid not in existing_ids:
-                    self.stdout.write(f"Удаляем папку {item_path} (нет видео с id={vid})")
-                    shutil.rmtree(item_path)
+        existing = set(model.objects.filter(id__in=list(keys_by_id)).values_list('id', flat=True))
+        orphans = []
+        for obj_id, obj_keys in keys_by_id.items():
+            if obj_id not in existing:
+                if (model._meta.label, obj_id) not in self.orphan_ids:
+                    self.stdout.write(f"{model._meta.label} id={obj_id}: нет в БД, объекты будут удалены")
+                    self.orphan_ids.add((model._meta.label, obj_id))
+                orphans.extend(obj_keys)
+        self.stats['orphans'] += len(orphans)
 
-        # Удаляем старые исходники в папке 2026 (и других годов), которые не привязаны к видео
-        # (проще удалить всё, что не обработано? но осторожно)
-        # В данном случае оставляем на усмотрение администратора
+        if orphans and not self.options["dry_run"]:
+            self.stats['deleted'] += self.storage.delete_keys(orphans, workers=self.options["workers"])
+            self._throttle()
 
-        self.stdout.write(self.style.SUCCESS("Очистка завершена"))
\ No newline at end of file
+        self.state['prefix'] = list_prefix
+        self.state['last_key'] = keys[-1]
+        self._save_checkpoint()
+
+    def _throttle(self) -> None:
+        # Средняя скорость удаления с начала запуска не выше --rate-limit
+        rate_limit = self.options["rate_limit"]
+        if rate_limit > 0:
+            delay = self.stats['deleted'] / rate_limit - (time.monotonic() - self.started)
+            if delay > 0:
+                time.sleep(delay)
+
+    def _load_checkpoint(self) -> dict:
+        path = self.options["checkpoint"]
+        if path and os.path.exists(path):
+            with open(path, 'r') as f:
+                return json.load(f)
+        return {'done': [], 'prefix': None, 'last_key': None}
+
+    def _save_checkpoint(self) -> None:
+        path = self.options["checkpoint"]
+        if not path or self.options["dry_run"]:
+            return
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.state, f)
+        os.replace(path + '.tmp', path)
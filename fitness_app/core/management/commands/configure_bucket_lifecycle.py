@@ -0,0 +1,49 @@
+# fitness_app/core/management/commands/configure_bucket_lifecycle.py
+# Выполнить: docker compose exec web python manage.py configure_bucket_lifecycle [--days 7]
+"""
+Добавляет в бакет видео правило жизненного цикла AbortIncompleteMultipartUpload:
+части незавершённых multipart-загрузок (упавший воркер, прерванная загрузка
+из админки) удаляются через --days дней и не оплачиваются бессрочно.
+Остальные правила бакета сохраняются, правило с тем же ID заменяется.
+"""
+
+from botocore.exceptions import ClientError
+from django.core.management.base import BaseCommand, CommandError
+
+from fitness_app.core.storage import get_video_storage
+
+RULE_ID = "abort-incomplete-multipart-uploads"
+
+
+class Command(BaseCommand):
+    help = 'Добавляет в бакет правило удаления незавершённых multipart-загрузок'
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=7,
+                            help="Через сколько дней после начала удалять незавершённую загрузку")
+
+    def handle(self, *args, **options):
+        storage = get_video_storage()
+        client = getattr(storage, 'client', None)
+        if client is None:
+            raise CommandError("Хранилище видео не S3 (USE_S3=False): правило не нужно")
+        bucket = storage.bucket_name
+
+        try:
+            rules = client.get_bucket_lifecycle_configuration(Bucket=bucket).get('Rules', [])
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') != 'NoSuchLifecycleConfiguration':
+                raise
+            rules = []
+
+        rules = [rule for rule in rules if rule.get('ID') != RULE_ID]
+        rules.append({
+            'ID': RULE_ID,
+            'Status': 'Enabled',
+            'Filter': {'Prefix': ''},
+            'AbortIncompleteMultipartUpload': {'DaysAfterInitiation': options["days"]},
+        })
+        client.put_bucket_lifecycle_configuration(Bucket=bucket, LifecycleConfiguration={'Rules': rules})
+        self.stdout.write(self.style.SUCCESS(
+            f"Бакет {bucket}: незавершённые загрузки удаляются через {options['days']} дн. (правил: {len(rules)})"
+        ))
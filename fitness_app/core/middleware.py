@@ -1,8 +1,23 @@
+import hashlib
 import logging
 import time
 
 from django.shortcuts import redirect
 from .models import DocumentVersion, UserConsent
+from .catalog_cache import get_cached
+
+# Отпечаток активных версий документов, на которые пользователь уже дал согласие
+CONSENT_SESSION_KEY = 'consent_fingerprint'
+
+
+def get_active_document_versions():
+    """(id активных версий документов, их отпечаток) из кэша; сбрасывается сигналами DocumentVersion."""
+    def build():
+        version_ids = sorted(DocumentVersion.objects.filter(is_active=True).values_list('id', flat=True))
+        fingerprint = hashlib.sha256(",".join(map(str, version_ids)).encode('utf-8')).hexdigest()[:16]
+        return version_ids, fingerprint
+    return get_cached('consent', 'active_versions', build)
+
 
 class ConsentMiddleware:
     def __init__(self, get_response):
@@ -21,19 +36,33 @@ class ConsentMiddleware:
             ]
             # Проверяем, начинается ли текущий путь с одного из exempt_paths
             if not any(request.path.startswith(path) for path in exempt_paths):
-                if not self.has_valid_consents(request.user):
+                if not self.has_valid_consents(request):
                     request.session['next_url'] = request.path
                     return redirect('accept_consent')
         return self.get_response(request)
 
 
-    def has_valid_consents(self, user):
-        active_versions = DocumentVersion.objects.filter(is_active=True).select_related('document')
-        consented_version_ids = UserConsent.objects.filter(
+    def has_valid_consents(self, request):
+        """
+        Согласие сверяется с отпечатком активных версий документов (кэш витрины,
+        сбрасывается при сохранении DocumentVersion). Отпечаток, для которого согласия
+        пользователя уже проверены, хранится в сессии — пока новые версии не
+        опубликованы, проверка не обращается к БД.
+        """
+        user = request.user
+        version_ids, fingerprint = get_active_document_versions()
+        session_value = f"{user.id}:{fingerprint}"
+        if request.session.get(CONSENT_SESSION_KEY) == session_value:
+            return True
+
+        consented_count = UserConsent.objects.filter(
             user=user,
-            document_version__in=active_versions
-        ).values_list('document_version_id', flat=True)
-        return set(active_versions.values_list('id', flat=True)) == set(consented_version_ids)
+            document_version_id__in=version_ids
+        ).count()
+        if consented_count != len(version_ids):
+            return False
+        request.session[CONSENT_SESSION_KEY] = session_value
+        return True
 
 
 class RequestLogMiddleware:
@@ -0,0 +1,519 @@
+# Generated by Django 5.2.5 on 2026-10-18 02:51
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('core', '0003_alter_category_color'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Banner',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=200, verbose_name='Заголовок')),
+                ('subtitle', models.TextField(blank=True, max_length=500, verbose_name='Подзаголовок')),
+                ('button_text', models.CharField(blank=True, default='Смотреть', max_length=50, verbose_name='Текст кнопки')),
+                ('button_link', models.CharField(default='/', max_length=200, verbose_name='Ссылка кнопки')),
+                ('image', models.ImageField(upload_to='banners/', verbose_name='Изображение')),
+                ('image_mobile', models.ImageField(blank=True, upload_to='banners/mobile/', verbose_name='Изображение (мобильное)')),
+                ('show_title', models.BooleanField(default=True, verbose_name='Показывать заголовок')),
+                ('show_subtitle', models.BooleanField(default=True, verbose_name='Показывать подзаголовок')),
+                ('text_color', models.CharField(default='#FFFFFF', max_length=7, verbose_name='Цвет текста')),
+                ('overlay_color', models.CharField(default='rgba(0,0,0,0.4)', max_length=25, verbose_name='Цвет оверлея')),
+                ('text_position', models.CharField(choices=[('left', 'Слева'), ('center', 'Центр'), ('right', 'Справа')], default='center', max_length=20, verbose_name='Позиция текста')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Активный')),
+                ('priority', models.IntegerField(default=1, help_text='Чем выше число, тем выше приоритет', verbose_name='Приоритет')),
+                ('show_on_mobile', models.BooleanField(default=True, verbose_name='Показывать на мобильных')),
+                ('show_on_desktop', models.BooleanField(default=True, verbose_name='Показывать на ПК')),
+                ('start_date', models.DateTimeField(blank=True, null=True, verbose_name='Дата начала показа')),
+                ('end_date', models.DateTimeField(blank=True, null=True, verbose_name='Дата окончания показа')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+                ('is_clickable', models.BooleanField(default=True, help_text='Весь баннер становится кликабельной ссылкой', verbose_name='Кликабельный баннер')),
+                ('click_link', models.CharField(blank=True, default='/', help_text='Куда ведет клик по баннеру (если кнопка скрыта)', max_length=200, verbose_name='Ссылка баннера')),
+                ('show_button', models.BooleanField(default=True, help_text='Отображать кнопку на баннере', verbose_name='Показывать кнопку')),
+                ('button_on_hover', models.BooleanField(default=False, help_text='Показывать кнопку только при наведении мыши', verbose_name='Кнопка при наведении')),
+            ],
+            options={
+                'verbose_name': 'Баннер',
+                'verbose_name_plural': 'Баннеры',
+                'ordering': ['-priority', '-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Document',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(choices=[('privacy', 'Политика конфиденциальности'), ('terms', 'Пользовательское соглашение'), ('offer', 'Договор оферты')], max_length=20, unique=True, verbose_name='Тип документа')),
+            ],
+            options={
+                'verbose_name': 'Документ',
+                'verbose_name_plural': 'Документы',
+            },
+        ),
+        migrations.CreateModel(
+            name='SeoBlock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=200, verbose_name='Заголовок')),
+                ('content', models.TextField(help_text='Можно использовать HTML теги: <strong>, <em>, <a>, <ul>, <li>, <p>', verbose_name='Контент')),
+                ('slug', models.SlugField(max_length=100, unique=True, verbose_name='URL-идентификатор')),
+                ('style', models.CharField(choices=[('default', 'По умолчанию (темный градиент)'), ('light', 'Светлый фон'), ('image_left', 'Изображение слева, текст справа'), ('image_right', 'Изображение справа, текст слева'), ('centered', 'Центрированный текст без изображения'), ('gradient', 'Градиентный фон без изображения')], default='default', max_length=20, verbose_name='Стиль отображения')),
+                ('background_color', models.CharField(default='#1f2937', max_length=7, verbose_name='Цвет фона')),
+                ('text_color', models.CharField(default='#ffffff', max_length=7, verbose_name='Цвет текста')),
+                ('header_tag', models.CharField(choices=[('h1', 'H1'), ('h2', 'H2'), ('h3', 'H3')], default='h2', max_length=2, verbose_name='Тег заголовка')),
+                ('image', models.ImageField(blank=True, null=True, upload_to='seo_blocks/', verbose_name='Изображение')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Активный')),
+                ('order', models.IntegerField(default=0, help_text='Чем меньше число, тем выше блок', verbose_name='Порядок')),
+                ('show_on_home', models.BooleanField(default=True, verbose_name='Показывать на главной')),
+                ('show_on_category', models.BooleanField(default=False, verbose_name='Показывать в категориях')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+            ],
+            options={
+                'verbose_name': 'SEO блок',
+                'verbose_name_plural': 'SEO блоки',
+                'ordering': ['order', '-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Service',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Название услуги')),
+                ('slug', models.SlugField(max_length=100, unique=True, verbose_name='URL')),
+                ('image', models.ImageField(blank=True, help_text='Рекомендуемый размер: 200×200px', null=True, upload_to='services/%Y/%m/', verbose_name='Картинка')),
+                ('icon', models.CharField(default='star', help_text='Например: dumbbell, running, heart-pulse. Используется, если нет картинки', max_length=50, verbose_name='Иконка (Font Awesome)')),
+                ('color', models.CharField(default='bg-gradient-to-br from-purple-600 to-pink-600', max_length=300, verbose_name='Цвет градиента')),
+                ('short_description', models.TextField(blank=True, help_text='Отображается на карточке', max_length=200, verbose_name='Краткое описание')),
+                ('full_description', models.TextField(blank=True, help_text='Подробное описание на странице услуги', verbose_name='Полное описание')),
+                ('price', models.DecimalField(decimal_places=0, max_digits=10, verbose_name='Стоимость')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Активна')),
+                ('order', models.IntegerField(default=0, verbose_name='Порядок вывода')),
+            ],
+            options={
+                'verbose_name': 'Услуга',
+                'verbose_name_plural': 'Услуги',
+                'ordering': ['order', 'name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SubscriptionPlan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Название')),
+                ('period', models.IntegerField(choices=[(1, '1 месяц'), (3, '3 месяца'), (12, '12 месяцев')], default=1, verbose_name='Период (месяцы)')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=8, verbose_name='Цена (руб)')),
+                ('original_price', models.DecimalField(blank=True, decimal_places=2, max_digits=8, null=True, verbose_name='Исходная цена')),
+                ('description', models.TextField(blank=True, verbose_name='Описание')),
+                ('is_popular', models.BooleanField(default=False, verbose_name='Популярный')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Активен')),
+                ('order', models.IntegerField(default=0, verbose_name='Порядок')),
+            ],
+            options={
+                'verbose_name': 'Тарифный план',
+                'verbose_name_plural': 'Тарифные планы',
+                'ordering': ['order'],
+            },
+        ),
+        migrations.AlterModelOptions(
+            name='video',
+            options={'ordering': ['-created_at'], 'verbose_name': 'Видео', 'verbose_name_plural': 'Видео'},
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='description',
+            field=models.TextField(blank=True, help_text='Краткое описание категории (до 200 символов). Отображается под названием.', max_length=200, verbose_name='Краткое описание'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='image',
+            field=models.ImageField(blank=True, help_text='Рекомендуемый размер: 200×200px. Если загружена картинка, она будет отображаться вместо иконки', null=True, upload_to='category_images/%Y/%m/', verbose_name='Картинка категории'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='is_featured',
+            field=models.BooleanField(default=False, help_text='Выделить категорию звездочкой на главной странице', verbose_name='Рекомендуемая'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='is_visible',
+            field=models.BooleanField(default=True, help_text='Если выключено, категория не будет показываться в меню и на главной, но останется доступна по прямой ссылке.', verbose_name='Отображать на сайте'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='tags',
+            field=models.CharField(blank=True, help_text='Теги через запятую (например: для начинающих, дома, без инвентаря). Отображаются на планшетах и ПК.', max_length=100, verbose_name='Теги'),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='allow_comments',
+            field=models.BooleanField(default=True, verbose_name='Разрешить комментарии'),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='allow_likes',
+            field=models.BooleanField(default=True, verbose_name='Разрешить лайки'),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='allow_sharing',
+            field=models.BooleanField(default=True, verbose_name='Разрешить репост'),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, verbose_name='Дата добавления'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='duration',
+            field=models.IntegerField(default=0, verbose_name='Длительность (секунды)'),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='hls_last_ttl',
+            field=models.IntegerField(blank=True, help_text='Значение AWS_QUERYSTRING_EXPIRE в секундах, использованное при генерации ссылок', null=True, verbose_name='TTL при последнем обновлении ссылок'),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='hls_links_refreshed_at',
+            field=models.DateTimeField(blank=True, help_text='Используется для автоматического обновления ссылок при просмотре', null=True, verbose_name='Дата последнего обновления подписанных ссылок'),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='hls_master_playlist',
+            field=models.URLField(blank=True, help_text='URL master.m3u8 после обработки', max_length=500, null=True, verbose_name='HLS master playlist'),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='hls_profiles',
+            field=models.JSONField(blank=True, default=dict, help_text='Словарь с URL для каждого профиля (1080p, 720p, ...)', verbose_name='Профили HLS'),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='is_processed',
+            field=models.BooleanField(default=False, help_text='Флаг, указывающий, что видео прошло транскодирование', verbose_name='Обработано в HLS'),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='last_viewed_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Последний просмотр'),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='processing_error',
+            field=models.TextField(blank=True, help_text='Текст ошибки, если обработка не удалась', null=True, verbose_name='Ошибка обработки'),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='source_probe',
+            field=models.JSONField(blank=True, default=dict, help_text='Разрешение, fps, длительность, кодеки и битрейт исходного файла; заполняется при обработке', verbose_name='Параметры исходника (ffprobe)'),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='thumbnail',
+            field=models.ImageField(blank=True, null=True, upload_to='video_thumbs/%Y/%m/', verbose_name='Превью'),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='views',
+            field=models.IntegerField(default=0, verbose_name='Просмотры'),
+        ),
+        migrations.AlterField(
+            model_name='category',
+            name='icon',
+            field=models.CharField(default='film', help_text='Например: dumbbell, running, heart-pulse, yoga, fire. Будет использоваться, если не загружена картинка', max_length=50, verbose_name='Иконка (Font Awesome)'),
+        ),
+        migrations.AlterField(
+            model_name='video',
+            name='description',
+            field=models.TextField(verbose_name='Описание'),
+        ),
+        migrations.AlterField(
+            model_name='video',
+            name='file',
+            field=models.FileField(max_length=500, upload_to='%Y/%m/', verbose_name='Файл'),
+        ),
+        migrations.AlterField(
+            model_name='video',
+            name='is_free',
+            field=models.BooleanField(default=False, verbose_name='Бесплатное'),
+        ),
+        migrations.AlterField(
+            model_name='video',
+            name='title',
+            field=models.CharField(max_length=100, verbose_name='Название'),
+        ),
+        migrations.CreateModel(
+            name='DocumentVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version_number', models.PositiveIntegerField(verbose_name='Номер версии')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('content_hash', models.CharField(editable=False, max_length=64, verbose_name='Хеш содержимого')),
+                ('text', models.TextField(verbose_name='Текст документа')),
+                ('is_active', models.BooleanField(default=False, verbose_name='Активна')),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='versions', to='core.document', verbose_name='Документ')),
+            ],
+            options={
+                'verbose_name': 'Версия документа',
+                'verbose_name_plural': 'Версии документов',
+                'ordering': ['-version_number'],
+                'unique_together': {('document', 'version_number')},
+            },
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='current_version',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.documentversion', verbose_name='Текущая версия'),
+        ),
+        migrations.CreateModel(
+            name='HlsRendition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                ('name', models.CharField(max_length=20, verbose_name='Профиль')),
+                ('width', models.IntegerField(verbose_name='Ширина')),
+                ('height', models.IntegerField(verbose_name='Высота')),
+                ('remote_base', models.CharField(max_length=500, verbose_name='Папка HLS в хранилище')),
+                ('target_duration', models.IntegerField(default=10, verbose_name='EXT-X-TARGETDURATION')),
+                ('segment_count', models.IntegerField(default=0, verbose_name='Сегментов')),
+                ('duration', models.FloatField(default=0, verbose_name='Длительность, с')),
+                ('total_bytes', models.BigIntegerField(default=0, verbose_name='Размер, байт')),
+                ('average_bitrate', models.IntegerField(default=0, verbose_name='Средний битрейт, бит/с')),
+                ('peak_bitrate', models.IntegerField(default=0, verbose_name='Пиковый битрейт, бит/с')),
+                ('codecs', models.CharField(blank=True, max_length=100, verbose_name='CODECS')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+            ],
+            options={
+                'verbose_name': 'Профиль HLS',
+                'verbose_name_plural': 'Профили HLS',
+                'ordering': ['-height'],
+            },
+        ),
+        migrations.CreateModel(
+            name='HlsSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence', models.PositiveIntegerField(verbose_name='Номер')),
+                ('name', models.CharField(max_length=255, verbose_name='Файл')),
+                ('duration', models.FloatField(verbose_name='Длительность, с')),
+                ('byte_size', models.BigIntegerField(verbose_name='Размер, байт')),
+                ('rendition', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='segments', to='core.hlsrendition')),
+            ],
+            options={
+                'verbose_name': 'Сегмент HLS',
+                'verbose_name_plural': 'Сегменты HLS',
+                'ordering': ['rendition', 'sequence'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Marathon',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=200, verbose_name='Название марафона')),
+                ('slug', models.SlugField(max_length=200, unique=True, verbose_name='URL')),
+                ('short_description', models.CharField(blank=True, max_length=300, verbose_name='Краткое описание')),
+                ('full_description', models.TextField(blank=True, verbose_name='Полное описание')),
+                ('thumbnail', models.ImageField(blank=True, upload_to='marathons/', verbose_name='Превью')),
+                ('banner_color', models.CharField(default='#6366f1', help_text='HEX цвет (например: #6366f1 для фиолетового)', max_length=7, verbose_name='Цвет баннера')),
+                ('price', models.DecimalField(decimal_places=0, default=0, max_digits=10, verbose_name='Цена')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Активен')),
+                ('is_featured', models.BooleanField(default=False, verbose_name='Рекомендуемый')),
+                ('order', models.IntegerField(default=0, verbose_name='Порядок')),
+                ('sales_count', models.IntegerField(default=0, editable=False, verbose_name='Продано')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+                ('category', models.ForeignKey(blank=True, help_text='Для навигации (необязательно)', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='marathons', to='core.category', verbose_name='Связанная категория')),
+                ('teaser_videos', models.ManyToManyField(blank=True, help_text='БЕСПЛАТНЫЕ видео для ознакомления с марафоном. Эти видео будут видны всем пользователям до покупки.', related_name='marathon_teasers', to='core.video', verbose_name='Тизерные видео')),
+            ],
+            options={
+                'verbose_name': 'Марафон',
+                'verbose_name_plural': 'Марафоны',
+                'ordering': ['order', '-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='MarathonAccess',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('purchased_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата покупки')),
+                ('amount_paid', models.DecimalField(decimal_places=0, max_digits=10, verbose_name='Сумма оплаты')),
+                ('payment_id', models.CharField(blank=True, max_length=100, verbose_name='ID платежа')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Активен')),
+                ('valid_until', models.DateTimeField(blank=True, null=True, verbose_name='Действует до')),
+                ('marathon', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='accesses', to='core.marathon')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='marathon_accesses', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Доступ к марафону',
+                'verbose_name_plural': 'Доступы к марафонам',
+                'ordering': ['-purchased_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='MarathonVideo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=200, verbose_name='Название')),
+                ('file', models.FileField(max_length=500, upload_to='marathon_videos/%Y/%m/', verbose_name='Файл')),
+                ('description', models.TextField(blank=True, verbose_name='Описание')),
+                ('duration', models.IntegerField(default=0, verbose_name='Длительность (секунды)')),
+                ('thumbnail', models.ImageField(blank=True, null=True, upload_to='marathon_thumbs/%Y/%m/', verbose_name='Превью')),
+                ('order', models.IntegerField(default=0, verbose_name='Порядок')),
+                ('views', models.IntegerField(default=0, verbose_name='Просмотры')),
+                ('last_viewed_at', models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Последний просмотр')),
+                ('hls_master_playlist', models.URLField(blank=True, help_text='URL master.m3u8 после обработки', max_length=500, null=True, verbose_name='HLS master playlist')),
+                ('hls_profiles', models.JSONField(blank=True, default=dict, help_text='Словарь с URL для каждого профиля (1080p, 720p, ...)', verbose_name='Профили HLS')),
+                ('is_processed', models.BooleanField(default=False, help_text='Флаг, указывающий, что видео прошло транскодирование', verbose_name='Обработано в HLS')),
+                ('processing_error', models.TextField(blank=True, help_text='Текст ошибки, если обработка не удалась', null=True, verbose_name='Ошибка обработки')),
+                ('hls_links_refreshed_at', models.DateTimeField(blank=True, null=True, verbose_name='Дата последнего обновления подписанных ссылок')),
+                ('hls_last_ttl', models.IntegerField(blank=True, null=True, verbose_name='TTL при последнем обновлении ссылок')),
+                ('source_probe', models.JSONField(blank=True, default=dict, verbose_name='Параметры исходника (ffprobe)')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата добавления')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+                ('marathon', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='marathon_videos', to='core.marathon')),
+            ],
+            options={
+                'verbose_name': 'Видео марафона',
+                'verbose_name_plural': 'Видео марафонов',
+                'ordering': ['marathon', 'order', 'created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Payment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=0, max_digits=10, verbose_name='Сумма')),
+                ('payment_id', models.CharField(blank=True, max_length=100, null=True, unique=True, verbose_name='ID платежа в ЮКасса')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает оплаты'), ('succeeded', 'Успешно'), ('canceled', 'Отменён'), ('failed', 'Ошибка')], default='pending', max_length=20, verbose_name='Статус')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+                ('confirmation_url', models.URLField(blank=True, max_length=500, null=True, verbose_name='Ссылка на оплату')),
+                ('marathon', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payments', to='core.marathon', verbose_name='Марафон')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payments', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Платёж',
+                'verbose_name_plural': 'Платежи',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ServiceRequest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('full_name', models.CharField(max_length=100, verbose_name='ФИО')),
+                ('email', models.EmailField(max_length=254)),
+                ('phone', models.CharField(max_length=15, verbose_name='Телефон')),
+                ('additional_info', models.TextField(blank=True, help_text='Цели, пожелания, уровень подготовки и т.д.', verbose_name='Дополнительная информация')),
+                ('status', models.CharField(choices=[('new', 'Новая'), ('processing', 'В обработке'), ('invoice_sent', 'Счёт выставлен'), ('paid', 'Оплачено'), ('completed', 'Выполнено'), ('cancelled', 'Отменено')], default='new', max_length=20, verbose_name='Статус')),
+                ('amount', models.DecimalField(decimal_places=0, max_digits=10, verbose_name='Сумма')),
+                ('payment_id', models.CharField(blank=True, max_length=100, verbose_name='ID платежа')),
+                ('result_file', models.FileField(blank=True, upload_to='service_results/%Y/%m/', verbose_name='Файл с результатом')),
+                ('result_text', models.TextField(blank=True, verbose_name='Текстовая информация')),
+                ('result_url', models.URLField(blank=True, verbose_name='Ссылка на результат')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата заявки')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='requests', to='core.service', verbose_name='Услуга')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='service_requests', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Заявка на услугу',
+                'verbose_name_plural': 'Заявки на услуги',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='UserConsent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('consented_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата согласия')),
+                ('ip_address', models.GenericIPAddressField(verbose_name='IP-адрес')),
+                ('user_agent', models.TextField(verbose_name='User-Agent')),
+                ('document_version', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.documentversion', verbose_name='Версия документа')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='consents', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Согласие пользователя',
+                'verbose_name_plural': 'Согласия пользователей',
+            },
+        ),
+        migrations.CreateModel(
+            name='UserSubscription',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_date', models.DateTimeField(auto_now_add=True, verbose_name='Дата начала')),
+                ('end_date', models.DateTimeField(verbose_name='Дата окончания')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Активна')),
+                ('payment_id', models.CharField(blank=True, max_length=100, verbose_name='ID платежа')),
+                ('auto_renew', models.BooleanField(default=True, verbose_name='Автопродление')),
+                ('plan', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='core.subscriptionplan')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='subscriptions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Подписка пользователя',
+                'verbose_name_plural': 'Подписки пользователей',
+            },
+        ),
+        migrations.CreateModel(
+            name='VideoComment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text', models.TextField(max_length=1000, verbose_name='Текст комментария')),
+                ('is_like', models.BooleanField(default=False, verbose_name='Это лайк')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+                ('is_approved', models.BooleanField(default=True, verbose_name='Одобрен')),
+                ('is_edited', models.BooleanField(default=False, verbose_name='Редактировался')),
+                ('parent', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='children', to='core.videocomment', verbose_name='Родительский комментарий')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='video_comments', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('video', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='comments', to='core.video', verbose_name='Видео')),
+            ],
+            options={
+                'verbose_name': 'Комментарий к видео',
+                'verbose_name_plural': 'Комментарии к видео',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='hlsrendition',
+            index=models.Index(fields=['content_type', 'object_id'], name='core_hlsren_content_2b42e7_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='hlsrendition',
+            constraint=models.UniqueConstraint(fields=('content_type', 'object_id', 'name'), name='unique_hls_rendition'),
+        ),
+        migrations.AddConstraint(
+            model_name='hlssegment',
+            constraint=models.UniqueConstraint(fields=('rendition', 'sequence'), name='unique_hls_segment'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='marathonaccess',
+            unique_together={('user', 'marathon')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='userconsent',
+            unique_together={('user', 'document_version')},
+        ),
+        migrations.AddIndex(
+            model_name='videocomment',
+            index=models.Index(fields=['video', 'created_at'], name='core_videoc_video_i_6fd7fb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='videocomment',
+            index=models.Index(fields=['user', 'created_at'], name='core_videoc_user_id_44bda4_idx'),
+        ),
+    ]
@@ -1,16 +1,18 @@
 # fitness_app/core/models.py
 
-import os
-import shutil
 import logging
 import hashlib
 
 from django.db import models
 from django.contrib.auth.models import User
+from django.contrib.contenttypes.fields import GenericForeignKey, GenericRelation
+from django.contrib.contenttypes.models import ContentType
 from django.urls import reverse
 from django.utils import timezone
 from django.conf import settings
 
+from .view_counters import arecord_view, record_view
+
 
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -117,6 +119,7 @@ class Video(models.Model):
     thumbnail = models.ImageField('Превью', upload_to='video_thumbs/%Y/%m/', blank=True, null=True)
     created_at = models.DateTimeField('Дата добавления', auto_now_add=True)
     views = models.IntegerField('Просмотры', default=0)
+    last_viewed_at = models.DateTimeField('Последний просмотр', null=True, blank=True, db_index=True)
 
     # Поля для социальных функций (только для бесплатных видео)
     allow_comments = models.BooleanField('Разрешить комментарии', default=True)
@@ -160,6 +163,13 @@ class Video(models.Model):
         blank=True,
         help_text="Значение AWS_QUERYSTRING_EXPIRE в секундах, использованное при генерации ссылок"
     )
+    source_probe = models.JSONField(
+        "Параметры исходника (ffprobe)",
+        default=dict,
+        blank=True,
+        help_text="Разрешение, fps, длительность, кодеки и битрейт исходного файла; заполняется при обработке"
+    )
+    hls_renditions = GenericRelation('HlsRendition')
 
     class Meta:
         verbose_name = 'Видео'
@@ -174,34 +184,6 @@ class Video(models.Model):
             self.allow_likes = False
         super().save(*args, **kwargs)
 
-    def delete(self, *args, **kwargs):
-        """Удаляет видео и связанные с ним файлы (HLS и исходник)."""
-        # Удаляем HLS-файлы (папку videos/{id}/hls/)
-        try:
-            # Определяем путь к папке HLS в зависимости от хранилища
-            backend = getattr(settings, 'VIDEO_STORAGE_BACKEND', 'local')
-            if backend == 'local':
-                hls_path = os.path.join(settings.MEDIA_ROOT, 'videos', str(self.id), 'hls')
-                if os.path.exists(hls_path):
-                    shutil.rmtree(hls_path)
-                    logging.getLogger(__name__).info(f"Удалена папка HLS для видео {self.id}")
-            else:
-                # Для S3: в будущем можно реализовать удаление через storage.delete
-                # Пока пропускаем
-                pass
-        except Exception as e:
-            logging.getLogger(__name__).warning(f"Не удалось удалить HLS-файлы для видео {self.id}: {e}")
-
-        # Удаляем исходный файл, если он ещё существует
-        if self.file:
-            try:
-                self.file.delete(save=False)
-                logging.getLogger(__name__).info(f"Удалён исходный файл видео {self.id}")
-            except Exception as e:
-                logging.getLogger(__name__).warning(f"Не удалось удалить исходный файл видео {self.id}: {e}")
-
-        super().delete(*args, **kwargs)
-
     def __str__(self):
         return self.title
 
@@ -214,8 +196,13 @@ class Video(models.Model):
         return f"{minutes:02d}:{seconds:02d}"
 
     def increment_views(self):
+        # Просмотр копится в Redis и переносится в БД пачкой (view_counters.flush_view_counters)
+        record_view(self)
+        self.views += 1
+
+    async def aincrement_views(self):
+        await arecord_view(self)
         self.views += 1
-        self.save(update_fields=['views'])
 
     def likes_count(self):
         return self.comments.filter(is_like=True).count()
@@ -627,6 +614,7 @@ class MarathonVideo(models.Model):
     thumbnail = models.ImageField('Превью', upload_to='marathon_thumbs/%Y/%m/', blank=True, null=True)
     order = models.IntegerField('Порядок', default=0)
     views = models.IntegerField('Просмотры', default=0)
+    last_viewed_at = models.DateTimeField('Последний просмотр', null=True, blank=True, db_index=True)
 
     # HLS поля (аналогично Video)
     hls_master_playlist = models.URLField(
@@ -663,6 +651,12 @@ class MarathonVideo(models.Model):
         null=True,
         blank=True,
     )
+    source_probe = models.JSONField(
+        "Параметры исходника (ffprobe)",
+        default=dict,
+        blank=True,
+    )
+    hls_renditions = GenericRelation('HlsRendition')
 
     created_at = models.DateTimeField('Дата добавления', auto_now_add=True)
     updated_at = models.DateTimeField('Дата обновления', auto_now=True)
@@ -687,40 +681,39 @@ class MarathonVideo(models.Model):
         return f"{minutes:02d}:{seconds:02d}"
 
     def increment_views(self):
+        # Просмотр копится в Redis и переносится в БД пачкой (view_counters.flush_view_counters)
+        record_view(self)
+        self.views += 1
+
+    async def aincrement_views(self):
+        await arecord_view(self)
         self.views += 1
-        self.save(update_fields=['views'])
 
     # ========== HLS методы ==========
     def get_hls_stream_url(self):
         """
         Динамически генерирует подписанную ссылку на master.m3u8.
-        При необходимости перегенерирует ссылки (если TTL изменился или истекло 80% времени).
-        Возвращает URL или None.
+        Устаревающие ссылки обновляются в фоне (refresh_hls_links); синхронно —
+        только если они уже истекли. Возвращает URL или None.
         """
         if not self.is_processed:
             return None
 
         from django.conf import settings
-        from django.utils import timezone
         from .storage import get_video_storage
-        from .hls_utils import refresh_video_links_generic
+        from .hls_utils import (refresh_video_links_generic, is_presigned_delivery,
+                                hls_links_expired, hls_links_need_refresh, schedule_hls_links_refresh)
+        from .hls_delivery import get_hls_stream_url
+
+        if not is_presigned_delivery():
+            return get_hls_stream_url(self)
         import logging
         logger = logging.getLogger(__name__)
 
         current_ttl = settings.AWS_QUERYSTRING_EXPIRE
-        need_refresh = False
-
-        if self.hls_last_ttl != current_ttl:
-            need_refresh = True
-        elif not self.hls_links_refreshed_at:
-            need_refresh = True
-        else:
-            seconds_since_refresh = (timezone.now() - self.hls_links_refreshed_at).total_seconds()
-            if seconds_since_refresh >= current_ttl * 0.8:
-                need_refresh = True
 
-        if need_refresh:
-            logger.info(f"HLS ссылки для MarathonVideo {self.id} устарели, перегенерация.")
+        if hls_links_expired(self):
+            logger.info(f"HLS ссылки для MarathonVideo {self.id} истекли, перегенерация.")
             success = refresh_video_links_generic(
                 obj=self,
                 remote_base=f"marathon_video/{self.id}/hls/",
@@ -730,6 +723,8 @@ class MarathonVideo(models.Model):
                 self.refresh_from_db()
             else:
                 logger.error(f"Не удалось обновить ссылки для MarathonVideo {self.id}")
+        elif hls_links_need_refresh(self):
+            schedule_hls_links_refresh(self)
 
         try:
             storage = get_video_storage()
@@ -739,45 +734,66 @@ class MarathonVideo(models.Model):
             logger.error(f"Ошибка генерации подписанной ссылки для MarathonVideo {self.id}: {e}")
             return None
 
-    def delete(self, *args, **kwargs):
-        """Удаляет видео и все связанные HLS-файлы (из S3 или локально)."""
-        import shutil, os, logging
-        from django.conf import settings
-        from .storage import get_video_storage
-        logger = logging.getLogger(__name__)
 
-        # Удаляем HLS-файлы
-        try:
-            storage = get_video_storage()
-            remote_base = f"marathon_video/{self.id}/hls/"
-            # Пытаемся удалить рекурсивно (для S3)
-            if hasattr(storage, 'client') and hasattr(storage, 'bucket_name'):
-                # S3: удаляем все объекты с префиксом
-                objects = storage.client.list_objects_v2(
-                    Bucket=storage.bucket_name,
-                    Prefix=remote_base
-                ).get('Contents', [])
-                for obj in objects:
-                    storage.client.delete_object(Bucket=storage.bucket_name, Key=obj['Key'])
-                logger.info(f"Удалены HLS-файлы MarathonVideo {self.id} из S3")
-            else:
-                # Локальное хранилище
-                hls_path = os.path.join(settings.MEDIA_ROOT, 'videos', f'marathon_video_{self.id}', 'hls')
-                if os.path.exists(hls_path):
-                    shutil.rmtree(hls_path)
-                    logger.info(f"Удалена локальная папка HLS для MarathonVideo {self.id}")
-        except Exception as e:
-            logger.warning(f"Не удалось удалить HLS-файлы MarathonVideo {self.id}: {e}")
+class HlsRendition(models.Model):
+    """
+    Закодированный профиль HLS (Video или MarathonVideo). Заполняется при публикации HLS,
+    чтобы список профилей и сегментов брать из БД, а не из хранилища.
+    """
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    content_object = GenericForeignKey('content_type', 'object_id')
+
+    name = models.CharField('Профиль', max_length=20)
+    width = models.IntegerField('Ширина')
+    height = models.IntegerField('Высота')
+    remote_base = models.CharField('Папка HLS в хранилище', max_length=500)
+    target_duration = models.IntegerField('EXT-X-TARGETDURATION', default=10)
+    segment_count = models.IntegerField('Сегментов', default=0)
+    duration = models.FloatField('Длительность, с', default=0)
+    total_bytes = models.BigIntegerField('Размер, байт', default=0)
+    average_bitrate = models.IntegerField('Средний битрейт, бит/с', default=0)
+    peak_bitrate = models.IntegerField('Пиковый битрейт, бит/с', default=0)
+    codecs = models.CharField('CODECS', max_length=100, blank=True)
+    created_at = models.DateTimeField('Дата создания', auto_now_add=True)
 
-        # Удаляем исходный файл
-        if self.file:
-            try:
-                self.file.delete(save=False)
-                logger.info(f"Удалён исходный файл MarathonVideo {self.id}")
-            except Exception as e:
-                logger.warning(f"Не удалось удалить исходный файл MarathonVideo {self.id}: {e}")
+    class Meta:
+        verbose_name = 'Профиль HLS'
+        verbose_name_plural = 'Профили HLS'
+        ordering = ['-height']
+        constraints = [
+            models.UniqueConstraint(fields=['content_type', 'object_id', 'name'], name='unique_hls_rendition'),
+        ]
+        indexes = [
+            models.Index(fields=['content_type', 'object_id']),
+        ]
 
-        super().delete(*args, **kwargs)
+    def __str__(self):
+        return f"{self.content_type.model} {self.object_id}: {self.name}"
+
+    @property
+    def playlist_path(self):
+        return f"{self.remote_base}out_{self.name}.m3u8"
+
+
+class HlsSegment(models.Model):
+    """Сегмент профиля HLS: имя файла в папке профиля, длительность и размер."""
+    rendition = models.ForeignKey(HlsRendition, on_delete=models.CASCADE, related_name='segments')
+    sequence = models.PositiveIntegerField('Номер')
+    name = models.CharField('Файл', max_length=255)
+    duration = models.FloatField('Длительность, с')
+    byte_size = models.BigIntegerField('Размер, байт')
+
+    class Meta:
+        verbose_name = 'Сегмент HLS'
+        verbose_name_plural = 'Сегменты HLS'
+        ordering = ['rendition', 'sequence']
+        constraints = [
+            models.UniqueConstraint(fields=['rendition', 'sequence'], name='unique_hls_segment'),
+        ]
+
+    def __str__(self):
+        return self.name
 
 
 class Service(models.Model):
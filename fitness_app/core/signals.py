@@ -1,21 +1,111 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver
 from django.db import transaction
-from .models import Video, MarathonVideo
-from .tasks import process_video_to_hls, process_marathon_video_to_hls
+from .models import (Video, MarathonVideo, Marathon, MarathonAccess, UserProfile,
+                     Banner, SeoBlock, Category, Service, DocumentVersion)
+from .tasks import process_video_to_hls, process_marathon_video_to_hls, delete_storage_files
+from .hls_utils import HLS_REMOTE_PREFIXES, LINK_FIELDS
+from .storage import is_direct_upload_key
+from .entitlements import bump_entitlements, bump_user_entitlements
+from .catalog_cache import bump_version
 import logging
 
 logger = logging.getLogger(__name__)
 
+def _needs_processing(instance, created, update_fields) -> bool:
+    # Частичные сохранения без поля file (служебные поля, статус обработки)
+    # не должны повторно ставить кодирование в очередь
+    if update_fields is not None and 'file' not in update_fields:
+        return False
+    return created or (instance.file and not instance.is_processed)
+
+
 @receiver(post_save, sender=Video)
-def video_post_save(sender, instance, created, **kwargs):
-    if created or (instance.file and not instance.is_processed):
+def video_post_save(sender, instance, created, update_fields=None, **kwargs):
+    if _needs_processing(instance, created, update_fields):
         logger.info(f"Сигнал post_save: видео {instance.id} требует обработки. Отправляем задачу после фиксации транзакции.")
         transaction.on_commit(lambda: process_video_to_hls.delay(instance.id))
 
 
 @receiver(post_save, sender=MarathonVideo)
-def marathon_video_post_save(sender, instance, created, **kwargs):
-    if created or (instance.file and not instance.is_processed):
+def marathon_video_post_save(sender, instance, created, update_fields=None, **kwargs):
+    if _needs_processing(instance, created, update_fields):
         logger.info(f"Сигнал post_save: MarathonVideo {instance.id} требует обработки.")
-        transaction.on_commit(lambda: process_marathon_video_to_hls.delay(instance.id))
\ No newline at end of file
+        transaction.on_commit(lambda: process_marathon_video_to_hls.delay(instance.id))
+
+
+@receiver(post_delete, sender=Video)
+@receiver(post_delete, sender=MarathonVideo)
+def video_post_delete(sender, instance, **kwargs):
+    """
+    Файлы удалённого видео (в том числе при массовом удалении из админки) удаляются
+    задачей Celery после фиксации транзакции: каталог {id}/ целиком (hls/ и chunks/).
+    """
+    prefix = f"{HLS_REMOTE_PREFIXES[sender._meta.label]}{instance.id}/"
+    keys = []
+    if instance.file:
+        if is_direct_upload_key(instance.file.name):
+            keys.append(instance.file.name)
+        else:
+            try:
+                instance.file.delete(save=False)
+            except Exception as e:
+                logger.warning(f"Не удалось удалить исходный файл {sender.__name__} {instance.id}: {e}")
+    logger.info(f"{sender.__name__} {instance.id} удалено, очистка {prefix} поставлена в очередь")
+    transaction.on_commit(lambda: delete_storage_files.delay([prefix], keys))
+
+
+@receiver(post_save, sender=MarathonAccess)
+@receiver(post_delete, sender=MarathonAccess)
+@receiver(post_save, sender=UserProfile)
+def user_entitlements_changed(sender, instance, **kwargs):
+    """Доступы или профиль пользователя изменились — сбрасываем кэш его прав."""
+    user_id = instance.user_id
+    transaction.on_commit(lambda: bump_user_entitlements(user_id))
+
+
+@receiver(post_save, sender=Marathon)
+@receiver(post_delete, sender=Marathon)
+def marathon_entitlements_changed(sender, instance, **kwargs):
+    transaction.on_commit(bump_entitlements)
+
+
+@receiver(post_save, sender=Banner)
+@receiver(post_delete, sender=Banner)
+@receiver(post_save, sender=SeoBlock)
+@receiver(post_delete, sender=SeoBlock)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=Service)
+def catalog_changed(sender, instance, **kwargs):
+    """Изменились данные витрины — сбрасываем её кэш (catalog_cache)."""
+    transaction.on_commit(lambda: bump_version('catalog'))
+
+
+# Поля видео, которые не показываются в списках категорий (счётчики, служебные данные HLS)
+VIDEO_UNLISTED_FIELDS = {'views', 'last_viewed_at', 'source_probe', *LINK_FIELDS}
+
+
+@receiver(post_save, sender=Video)
+@receiver(post_delete, sender=Video)
+def video_list_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= VIDEO_UNLISTED_FIELDS:
+        return
+    transaction.on_commit(lambda: bump_version('catalog'))
+
+
+@receiver(m2m_changed, sender=Video.categories.through)
+def video_categories_changed(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        transaction.on_commit(lambda: bump_version('catalog'))
+
+
+@receiver(post_save, sender=DocumentVersion)
+@receiver(post_delete, sender=DocumentVersion)
+def document_version_changed(sender, instance, **kwargs):
+    """
+    Изменился набор активных версий документов (в том числе через set_active_version,
+    который сохраняет версию) — ConsentMiddleware перепроверит согласия пользователей.
+    """
+    transaction.on_commit(lambda: bump_version('consent'))
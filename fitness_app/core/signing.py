@@ -0,0 +1,142 @@
+# fitness_app/core/signing.py
+"""
+Пакетная подпись GET-ссылок S3 (SigV4, query string).
+
+generate_presigned_url в boto3 на каждый вызов создаёт объект запроса, прогоняет
+цепочку событий и заново выводит ключ подписи. Для плейлиста из сотен сегментов
+это основная стоимость. S3BatchPresigner выводит ключ подписи и общие части
+канонического запроса один раз на пачку, а для каждого ключа считает только
+хэш канонического запроса и HMAC. Результат совпадает с boto3 (path-style).
+
+Время подписи можно выровнять по интервалу (signing_window): тогда все запросы
+в пределах интервала получают одинаковые URL, которые кэшируются по пути.
+
+Токены на префикс (prefix_token) — альтернатива подписи каждого объекта: один
+HMAC открывает все файлы каталога (например {id}/hls/) до момента expires_at,
+проверку выполняет nginx через auth_request (см. views.hls_token_auth).
+"""
+
+import base64
+import hashlib
+import hmac
+import time
+from datetime import datetime, timezone
+from typing import Iterable, List, Optional, Tuple
+from urllib.parse import quote, urlsplit
+
+ALGORITHM = "AWS4-HMAC-SHA256"
+UNSIGNED_PAYLOAD = "UNSIGNED-PAYLOAD"
+# Максимальный срок действия подписи SigV4 — 7 суток
+MAX_EXPIRES = 7 * 24 * 3600
+
+
+def _hmac(key: bytes, msg: str) -> bytes:
+    return hmac.new(key, msg.encode("utf-8"), hashlib.sha256).digest()
+
+
+def derive_signing_key(secret_key: str, date_stamp: str, region: str, service: str = "s3") -> bytes:
+    key = _hmac(("AWS4" + secret_key).encode("utf-8"), date_stamp)
+    key = _hmac(key, region)
+    key = _hmac(key, service)
+    return _hmac(key, "aws4_request")
+
+
+def signing_window(bucket: int, now: Optional[datetime] = None) -> Tuple[datetime, int]:
+    """
+    Начало интервала подписи длиной bucket секунд, содержащего now,
+    и сколько секунд осталось до его конца.
+    """
+    now = now or datetime.now(timezone.utc)
+    timestamp = int(now.timestamp())
+    start = timestamp - timestamp % bucket
+    return datetime.fromtimestamp(start, timezone.utc), start + bucket - timestamp
+
+
+def _canonical_host(endpoint_url: str) -> str:
+    # Как в botocore: порт по умолчанию в заголовок Host не попадает
+    parts = urlsplit(endpoint_url)
+    default_port = {"http": 80, "https": 443}.get(parts.scheme)
+    if parts.port and parts.port != default_port:
+        return f"{parts.hostname}:{parts.port}"
+    return parts.hostname
+
+
+class S3BatchPresigner:
+    """
+    Подписывает GET-ссылки на объекты одного бакета (path-style: {endpoint}/{bucket}/{key}).
+    Экземпляр неизменяем и потокобезопасен.
+    """
+
+    def __init__(self, endpoint_url: str, region_name: str, bucket_name: str,
+                 access_key: str, secret_key: str, session_token: Optional[str] = None):
+        self.endpoint_url = endpoint_url.rstrip("/")
+        self.region_name = region_name
+        self.bucket_name = bucket_name
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.session_token = session_token
+        self.host = _canonical_host(endpoint_url)
+        self._bucket_path = "/" + quote(bucket_name, safe="-_.~")
+
+    @classmethod
+    def from_client(cls, client, bucket_name: str) -> "S3BatchPresigner":
+        """Берёт endpoint, регион и учётные данные у boto3-клиента."""
+        credentials = client._request_signer._credentials.get_frozen_credentials()
+        return cls(
+            client.meta.endpoint_url, client.meta.region_name, bucket_name,
+            credentials.access_key, credentials.secret_key, credentials.token,
+        )
+
+    def sign(self, keys: Iterable[str], expires: int, now: Optional[datetime] = None) -> List[str]:
+        """Подписанные URL для списка ключей (в том же порядке), срок действия — expires секунд."""
+        now = now or datetime.now(timezone.utc)
+        amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+        date_stamp = amz_date[:8]
+        scope = f"{date_stamp}/{self.region_name}/s3/aws4_request"
+        signing_key = derive_signing_key(self.secret_key, date_stamp, self.region_name)
+
+        params = {
+            "X-Amz-Algorithm": ALGORITHM,
+            "X-Amz-Credential": f"{self.access_key}/{scope}",
+            "X-Amz-Date": amz_date,
+            "X-Amz-Expires": str(min(int(expires), MAX_EXPIRES)),
+            "X-Amz-SignedHeaders": "host",
+        }
+        if self.session_token:
+            params["X-Amz-Security-Token"] = self.session_token
+        query = "&".join(
+            f"{quote(name, safe='-_.~')}={quote(value, safe='-_.~')}" for name, value in sorted(params.items())
+        )
+        # Общие части канонического запроса и строки для подписи
+        request_tail = f"\n{query}\nhost:{self.host}\n\nhost\n{UNSIGNED_PAYLOAD}"
+        string_prefix = f"{ALGORITHM}\n{amz_date}\n{scope}\n"
+        url_prefix = self.endpoint_url + self._bucket_path
+
+        urls = []
+        for key in keys:
+            path = "/" + quote(key, safe="/~")
+            canonical_request = "GET\n" + self._bucket_path + path + request_tail
+            string_to_sign = string_prefix + hashlib.sha256(canonical_request.encode("utf-8")).hexdigest()
+            signature = hmac.new(signing_key, string_to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
+            urls.append(f"{url_prefix}{path}?{query}&X-Amz-Signature={signature}")
+        return urls
+
+
+def prefix_token(prefix: str, expires_at: int, secret: str) -> str:
+    """Токен доступа ко всем объектам с путём, начинающимся с prefix, до expires_at (unix time)."""
+    digest = hmac.new(secret.encode("utf-8"), f"{expires_at}:{prefix}".encode("utf-8"), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest[:18]).decode("ascii")
+
+
+def verify_prefix_token(token: str, path: str, expires_at: int, secret: str, now: Optional[float] = None) -> bool:
+    """Проверяет токен для объекта path: срок не истёк и токен выдан на каталог объекта."""
+    if expires_at < (now if now is not None else time.time()):
+        return False
+    if ".." in path.split("/"):
+        return False
+    return hmac.compare_digest(token, prefix_token(token_prefix(path), expires_at, secret))
+
+
+def token_prefix(path: str) -> str:
+    """Префикс, на который выдаётся токен: каталог объекта (для HLS — {id}/hls/)."""
+    return path.rsplit("/", 1)[0] + "/" if "/" in path else ""
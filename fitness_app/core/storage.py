@@ -5,24 +5,386 @@
 """
 
 import os
+import json
+import time
+import errno
 import shutil
 import logging
+import mimetypes
+import threading
 from abc import ABC, abstractmethod
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Optional
 
 from django.conf import settings
 from django.core.files.storage import Storage
 from storages.backends.s3boto3 import S3Boto3Storage
 import boto3
+from boto3.s3.transfer import TransferConfig
 from botocore.client import Config
+from botocore.exceptions import ClientError
+from prometheus_client import REGISTRY, Counter
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from .signing import S3BatchPresigner, prefix_token, signing_window, token_prefix
 
 logger = logging.getLogger(__name__)
 
 
+# Типы содержимого HLS (mimetypes знает их не во всех версиях Python)
+HLS_CONTENT_TYPES = {
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".ts": "video/mp2t",
+}
+
+
+def guess_content_type(path: str) -> str:
+    ext = os.path.splitext(path)[1].lower()
+    if ext in HLS_CONTENT_TYPES:
+        return HLS_CONTENT_TYPES[ext]
+    return mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+
+# ioctl FICLONE (Linux): копия файла через общие экстенты (btrfs, XFS и т.п.)
+FICLONE = 0x40049409
+
+
+def _reflink(src: str, dst: str) -> None:
+    import fcntl
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError:
+            fdst.close()
+            os.remove(dst)
+            raise
+
+
+def stage_file(src: str, dst: str, allow_hardlink: bool = True) -> str:
+    """
+    Размещает копию src по пути dst без копирования данных, если это возможно:
+    жёсткая ссылка (та же ФС), затем reflink (copy-on-write), иначе обычное копирование.
+    Жёсткую ссылку можно использовать, только если ни src, ни dst не будут изменяться на месте.
+    Возвращает использованный способ: 'hardlink', 'reflink' или 'copy'.
+    """
+    if allow_hardlink:
+        try:
+            os.link(src, dst)
+            return "hardlink"
+        except OSError:
+            pass
+    try:
+        _reflink(src, dst)
+        shutil.copystat(src, dst)
+        return "reflink"
+    except (OSError, ImportError):
+        pass
+    shutil.copy2(src, dst)
+    return "copy"
+
+
+def replace_file(src: str, dst: str) -> None:
+    """Атомарно перемещает src в dst (os.replace); между разными устройствами — копирование и удаление."""
+    try:
+        os.replace(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        tmp = dst + ".part"
+        shutil.copy2(src, tmp)
+        os.replace(tmp, dst)
+        os.remove(src)
+
+
+def build_s3_config() -> Config:
+    """
+    Настройки botocore для всех S3-клиентов: path-style, SigV4, пул S3_MAX_POOL_CONNECTIONS
+    соединений с TCP keep-alive, повторы в режиме 'standard' и таймауты соединения/чтения.
+    """
+    return Config(
+        s3={'addressing_style': 'path'},
+        signature_version='s3v4',
+        max_pool_connections=getattr(settings, 'S3_MAX_POOL_CONNECTIONS', 10),
+        tcp_keepalive=getattr(settings, 'S3_TCP_KEEPALIVE', True),
+        retries={'max_attempts': getattr(settings, 'S3_MAX_RETRIES', 5), 'mode': 'standard'},
+        connect_timeout=getattr(settings, 'S3_CONNECT_TIMEOUT', 5),
+        read_timeout=getattr(settings, 'S3_READ_TIMEOUT', 60),
+    )
+
+
+def build_s3_client(endpoint_url: str, region_name: str, access_key: str, secret_key: str):
+    """
+    Создаёт boto3-клиент S3 с настройками build_s3_config().
+    Клиент потокобезопасен и используется всеми потоками одного хранилища.
+    """
+    return boto3.client(
+        's3',
+        endpoint_url=endpoint_url,
+        region_name=region_name,
+        aws_access_key_id=access_key,
+        aws_secret_access_key=secret_key,
+        config=build_s3_config(),
+    )
+
+
+def get_transfer_config() -> TransferConfig:
+    """
+    Настройки управляемой передачи boto3: файлы больше S3_MULTIPART_THRESHOLD
+    передаются частями по S3_TRANSFER_CHUNK_SIZE в S3_TRANSFER_MAX_CONCURRENCY потоков
+    (при скачивании — параллельные ranged GET). Память ограничена размером частей в очереди.
+    """
+    return TransferConfig(
+        multipart_threshold=getattr(settings, 'S3_MULTIPART_THRESHOLD', 16 * 1024 * 1024),
+        multipart_chunksize=getattr(settings, 'S3_TRANSFER_CHUNK_SIZE', 8 * 1024 * 1024),
+        max_concurrency=getattr(settings, 'S3_TRANSFER_MAX_CONCURRENCY', 8),
+        use_threads=True,
+    )
+
+
+# Минимальный размер части multipart-загрузки по спецификации S3 (кроме последней)
+S3_MIN_PART_SIZE = 5 * 1024 * 1024
+# DeleteObjects принимает не больше 1000 ключей за запрос
+S3_DELETE_BATCH = 1000
+
+
+def get_token_url(remote_path: str, expires: int) -> str:
+    """
+    Ссылка {SECURE_LINK_URL}{токен}/{expires_at}/{путь}: токен открывает весь каталог файла
+    до expires_at. Срок выравнивается по S3_SIGNING_BUCKET, как и подписи S3.
+    """
+    bucket = getattr(settings, 'S3_SIGNING_BUCKET', 0)
+    if bucket:
+        window_start, _ = signing_window(bucket)
+        expires_at = int(window_start.timestamp()) + bucket + expires
+    else:
+        expires_at = int(time.time()) + expires
+    token = prefix_token(token_prefix(remote_path), expires_at, settings.SECURE_LINK_SECRET)
+    return f"{settings.SECURE_LINK_URL}{token}/{expires_at}/{remote_path}"
+
+
+@dataclass
+class UploadResult:
+    """Итог загрузки файла: объём, число частей и скорость передачи."""
+    remote_path: str
+    size: int
+    elapsed: float
+    parts: int = 1
+    resumed_parts: int = 0
+    # Байт, переданных в этом вызове (без частей, загруженных до возобновления)
+    uploaded_bytes: Optional[int] = None
+
+    def __post_init__(self):
+        if self.uploaded_bytes is None:
+            self.uploaded_bytes = self.size
+
+    @property
+    def throughput_mbps(self) -> float:
+        """Скорость передачи в МБ/с по фактически загруженным байтам."""
+        if self.elapsed <= 0:
+            return 0.0
+        return self.uploaded_bytes / self.elapsed / (1024 * 1024)
+
+
+# Итоги multipart-загрузок процесса, отдаются в /metrics через StoragePoolCollector
+_upload_stats_lock = threading.Lock()
+_upload_stats = {'uploads': 0, 'bytes': 0, 'seconds': 0.0, 'parts': 0, 'resumed_parts': 0}
+
+
+def _record_upload(result: UploadResult) -> None:
+    with _upload_stats_lock:
+        _upload_stats['uploads'] += 1
+        _upload_stats['bytes'] += result.uploaded_bytes
+        _upload_stats['seconds'] += result.elapsed
+        _upload_stats['parts'] += result.parts - result.resumed_parts
+        _upload_stats['resumed_parts'] += result.resumed_parts
+
+
+class S3MultipartUploader:
+    """
+    Параллельная multipart-загрузка больших файлов в S3 с возобновлением.
+
+    Файл делится на части по part_size байт, части загружаются в concurrency потоков;
+    в памяти одновременно находится не больше concurrency частей. Состояние загрузки
+    (UploadId) хранится рядом с файлом в <файл>.upload.json: при повторном вызове
+    уже загруженные части берутся из ListParts и не передаются заново.
+
+    Если часть не загрузилась, остальные ещё не начатые части отменяются. Без
+    resumable загрузка сразу прерывается (AbortMultipartUpload), иначе её части
+    остались бы в бакете; с resumable=True состояние сохраняется для повторного
+    вызова, а прервать загрузку (abort) должен вызывающий, когда повторы исчерпаны.
+    """
+
+    def __init__(self, client, bucket_name: str, part_size: Optional[int] = None,
+                 concurrency: Optional[int] = None, extra_args: Optional[dict] = None):
+        self.client = client
+        self.bucket_name = bucket_name
+        self.part_size = max(
+            S3_MIN_PART_SIZE, part_size or getattr(settings, 'S3_TRANSFER_CHUNK_SIZE', 8 * 1024 * 1024)
+        )
+        self.concurrency = max(1, concurrency or getattr(settings, 'S3_TRANSFER_MAX_CONCURRENCY', 8))
+        self.extra_args = extra_args or {}
+
+    @staticmethod
+    def state_path(local_path: str) -> str:
+        return local_path + ".upload.json"
+
+    def _load_state(self, local_path: str, remote_path: str, size: int) -> Optional[dict]:
+        """Возвращает сохранённое состояние, если оно относится к этому же файлу и ключу."""
+        try:
+            with open(self.state_path(local_path)) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if (state.get("bucket") != self.bucket_name or state.get("key") != remote_path
+                or state.get("size") != size or state.get("mtime") != os.path.getmtime(local_path)):
+            return None
+        return state
+
+    def _save_state(self, local_path: str, state: dict) -> None:
+        with open(self.state_path(local_path), "w") as f:
+            json.dump(state, f)
+
+    def _clear_state(self, local_path: str) -> None:
+        try:
+            os.remove(self.state_path(local_path))
+        except FileNotFoundError:
+            pass
+
+    def _list_uploaded_parts(self, remote_path: str, upload_id: str) -> dict:
+        """Возвращает {номер части: ETag} для уже загруженных частей (с пагинацией)."""
+        parts = {}
+        kwargs = {'Bucket': self.bucket_name, 'Key': remote_path, 'UploadId': upload_id}
+        while True:
+            response = self.client.list_parts(**kwargs)
+            for part in response.get('Parts', []):
+                parts[part['PartNumber']] = part['ETag']
+            if not response.get('IsTruncated'):
+                return parts
+            kwargs['PartNumberMarker'] = response['NextPartNumberMarker']
+
+    def _upload_part(self, local_path: str, remote_path: str, upload_id: str,
+                     part_number: int, offset: int, length: int) -> str:
+        with open(local_path, "rb") as f:
+            f.seek(offset)
+            body = f.read(length)
+        response = self.client.upload_part(
+            Bucket=self.bucket_name, Key=remote_path, UploadId=upload_id,
+            PartNumber=part_number, Body=body,
+        )
+        return response['ETag']
+
+    def upload(self, local_path: str, remote_path: str, resumable: bool = False) -> UploadResult:
+        size = os.path.getsize(local_path)
+        started = time.monotonic()
+
+        state = self._load_state(local_path, remote_path, size)
+        uploaded = {}
+        if state:
+            try:
+                uploaded = self._list_uploaded_parts(remote_path, state["upload_id"])
+                logger.info(
+                    f"Возобновление загрузки {remote_path}: {len(uploaded)} частей уже в хранилище"
+                )
+            except ClientError as e:
+                logger.warning(f"Не удалось возобновить загрузку {remote_path}: {e}. Начинаем заново")
+                state = None
+                uploaded = {}
+
+        if not state:
+            response = self.client.create_multipart_upload(
+                Bucket=self.bucket_name, Key=remote_path, **self.extra_args
+            )
+            state = {
+                "bucket": self.bucket_name,
+                "key": remote_path,
+                "upload_id": response['UploadId'],
+                "part_size": self.part_size,
+                "size": size,
+                "mtime": os.path.getmtime(local_path),
+            }
+            self._save_state(local_path, state)
+
+        # При возобновлении используем размер части исходной загрузки
+        part_size = state["part_size"]
+        upload_id = state["upload_id"]
+        total_parts = max(1, -(-size // part_size))
+        resumed = len([n for n in uploaded if n <= total_parts])
+
+        pending = [n for n in range(1, total_parts + 1) if n not in uploaded]
+        pending_bytes = sum(min(part_size, size - (n - 1) * part_size) for n in pending)
+        try:
+            self._upload_parts(local_path, remote_path, upload_id, part_size, size, pending, uploaded)
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket_name, Key=remote_path, UploadId=upload_id,
+                MultipartUpload={'Parts': [
+                    {'PartNumber': n, 'ETag': uploaded[n]} for n in range(1, total_parts + 1)
+                ]},
+            )
+        except Exception:
+            if not resumable:
+                self.abort(local_path)
+            raise
+        self._clear_state(local_path)
+
+        result = UploadResult(
+            remote_path=remote_path, size=size, elapsed=time.monotonic() - started,
+            parts=total_parts, resumed_parts=resumed, uploaded_bytes=pending_bytes,
+        )
+        _record_upload(result)
+        logger.info(
+            f"Multipart-загрузка {remote_path}: {size / (1024 * 1024):.1f} МБ, {total_parts} частей "
+            f"(возобновлено {resumed}), {result.elapsed:.1f} с, {result.throughput_mbps:.1f} МБ/с"
+        )
+        return result
+
+    def _upload_parts(self, local_path: str, remote_path: str, upload_id: str, part_size: int,
+                      size: int, pending: list, uploaded: dict) -> None:
+        """Загружает части pending в uploaded; при первой ошибке отменяет ещё не начатые части."""
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            futures = {
+                pool.submit(
+                    self._upload_part, local_path, remote_path, upload_id,
+                    n, (n - 1) * part_size, min(part_size, size - (n - 1) * part_size),
+                ): n
+                for n in pending
+            }
+            try:
+                for future in as_completed(futures):
+                    uploaded[futures[future]] = future.result()
+            except Exception:
+                for future in futures:
+                    future.cancel()
+                raise
+
+    def abort(self, local_path: str) -> None:
+        """Прерывает незавершённую загрузку и удаляет её части из хранилища."""
+        try:
+            with open(self.state_path(local_path)) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        try:
+            self.client.abort_multipart_upload(
+                Bucket=state["bucket"], Key=state["key"], UploadId=state["upload_id"]
+            )
+        except ClientError as e:
+            logger.warning(f"Не удалось прервать загрузку {state['key']}: {e}")
+        self._clear_state(local_path)
+
+
 class VideoStorageInterface(ABC):
     """Интерфейс для низкоуровневых операций с файлами (используется в задачах)"""
+    # Поддерживает ли хранилище загрузку из браузера по подписанным URL (S3DirectUploadMixin)
+    supports_direct_upload = False
+
     @abstractmethod
-    def save_file(self, local_path: str, remote_path: str) -> str:
+    def save_file(self, local_path: str, remote_path: str, resumable: bool = False) -> str:
+        """
+        Загружает файл в хранилище. resumable=True — при ошибке multipart-загрузка
+        не прерывается, повторный вызов догрузит недостающие части; если повторов
+        больше не будет, вызывающий прерывает её через abort_upload.
+        """
         pass
 
     @abstractmethod
@@ -33,31 +395,91 @@ class VideoStorageInterface(ABC):
     def get_signed_url(self, remote_path: str, expires: int = settings.AWS_QUERYSTRING_EXPIRE) -> str:
         pass
 
+    def get_signed_urls(self, remote_paths: list, expires: int = settings.AWS_QUERYSTRING_EXPIRE) -> list:
+        """Подписанные URL для списка путей (в том же порядке). S3-хранилища подписывают пачкой."""
+        return [self.get_signed_url(path, expires=expires) for path in remote_paths]
+
     @abstractmethod
     def delete_file(self, remote_path: str) -> None:
         pass
 
+    def list_prefix(self, prefix: str, start_after: Optional[str] = None) -> Iterator[str]:
+        """
+        Ключи всех объектов с путём, начинающимся с prefix, в лексикографическом порядке
+        (постранично, без загрузки списка целиком); start_after — продолжить после этого ключа.
+        """
+        raise NotImplementedError
+
+    def delete_keys(self, remote_paths: Iterable[str], workers: Optional[int] = None) -> int:
+        """Удаляет объекты по списку ключей. Возвращает число удалённых."""
+        deleted = 0
+        for remote_path in remote_paths:
+            self.delete_file(remote_path)
+            deleted += 1
+        return deleted
+
+    def delete_prefix(self, prefix: str) -> int:
+        """Удаляет все объекты с префиксом prefix (например {id}/hls/). Возвращает число удалённых."""
+        return self.delete_keys(self.list_prefix(prefix))
+
+    def move_file(self, local_path: str, remote_path: str, resumable: bool = False) -> str:
+        """
+        Загружает файл и удаляет локальную копию (для временных файлов).
+        Локальное хранилище переносит файл без копирования данных.
+        """
+        url = self.save_file(local_path, remote_path, resumable=resumable)
+        os.remove(local_path)
+        return url
+
+    def abort_upload(self, local_path: str) -> None:
+        """Прерывает незавершённую resumable-загрузку файла local_path (если она есть)."""
+
+    def save_file_multipart(self, local_path: str, remote_path: str,
+                            part_size: Optional[int] = None, concurrency: Optional[int] = None,
+                            resumable: bool = False) -> UploadResult:
+        """
+        Загрузка большого файла частями (resumable — с возобновлением, см. save_file).
+        Хранилища без multipart загружают файл обычным save_file.
+        """
+        started = time.monotonic()
+        self.save_file(local_path, remote_path)
+        return UploadResult(remote_path=remote_path, size=os.path.getsize(local_path),
+                            elapsed=time.monotonic() - started)
+
 
 class LocalVideoStorage(VideoStorageInterface):
     def __init__(self, base_path: Optional[str] = None):
         self.base_path = base_path or os.path.join(settings.MEDIA_ROOT, "videos")
         logger.info(f"LocalVideoStorage инициализирован с base_path={self.base_path}")
 
-    def save_file(self, local_path: str, remote_path: str) -> str:
+    def save_file(self, local_path: str, remote_path: str, resumable: bool = False) -> str:
+        # Файл в хранилище всегда заменяется атомарно (новый inode), поэтому
+        # жёсткие ссылки, выданные load_file, никогда не меняются на месте
+        dest = os.path.join(self.base_path, remote_path)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        tmp = dest + ".part"
+        method = stage_file(local_path, tmp, allow_hardlink=False)
+        os.replace(tmp, dest)
+        url = settings.MEDIA_URL + "videos/" + remote_path
+        logger.debug(f"Файл сохранён ({method}): {local_path} -> {dest}, URL={url}")
+        return url
+
+    def move_file(self, local_path: str, remote_path: str, resumable: bool = False) -> str:
         dest = os.path.join(self.base_path, remote_path)
         os.makedirs(os.path.dirname(dest), exist_ok=True)
-        shutil.copy2(local_path, dest)
+        replace_file(local_path, dest)
         url = settings.MEDIA_URL + "videos/" + remote_path
-        logger.debug(f"Файл скопирован: {local_path} -> {dest}, URL={url}")
+        logger.debug(f"Файл перемещён: {local_path} -> {dest}, URL={url}")
         return url
 
     def load_file(self, remote_path: str, local_path: str) -> None:
         src = os.path.join(self.base_path, remote_path)
-        shutil.copy2(src, local_path)
-        logger.debug(f"Файл загружен: {src} -> {local_path}")
+        method = stage_file(src, local_path)
+        logger.debug(f"Файл загружен ({method}): {src} -> {local_path}")
 
     def get_signed_url(self, remote_path: str, expires: int = settings.AWS_QUERYSTRING_EXPIRE) -> str:
-        return f"videos/{remote_path}"
+        # nginx отдаёт файл из MEDIA_ROOT только после проверки токена (auth_request)
+        return get_token_url(remote_path, expires)
 
     def delete_file(self, remote_path: str) -> None:
         path = os.path.join(self.base_path, remote_path)
@@ -67,7 +489,37 @@ class LocalVideoStorage(VideoStorageInterface):
         else:
             logger.warning(f"Файл не найден для удаления: {path}")
 
+    def _walk_sorted(self, directory: str, rel: str) -> Iterator[str]:
+        # Каталоги сортируются как "имя/" — так порядок совпадает с порядком ключей S3
+        try:
+            entries = list(os.scandir(directory))
+        except FileNotFoundError:
+            return
+        entries.sort(key=lambda e: e.name + ("/" if e.is_dir() else ""))
+        for entry in entries:
+            if entry.is_dir():
+                yield from self._walk_sorted(entry.path, f"{rel}{entry.name}/")
+            else:
+                yield rel + entry.name
+
+    def list_prefix(self, prefix: str, start_after: Optional[str] = None) -> Iterator[str]:
+        directory = prefix.rsplit("/", 1)[0] + "/" if "/" in prefix else ""
+        for key in self._walk_sorted(os.path.join(self.base_path, directory), directory):
+            if key.startswith(prefix) and (start_after is None or key > start_after):
+                yield key
+
+    def delete_prefix(self, prefix: str) -> int:
+        deleted = super().delete_prefix(prefix)
+        # Каталог префикса удаляется целиком вместе с пустыми подкаталогами
+        if prefix.endswith("/"):
+            shutil.rmtree(os.path.join(self.base_path, prefix), ignore_errors=True)
+        logger.info(f"Удалено {deleted} файлов с префиксом {prefix}")
+        return deleted
+
     # Методы для совместимости с Django Storage API
+    def exists(self, name):
+        return os.path.exists(os.path.join(self.base_path, name))
+
     def save(self, name, content, max_length=None):
         return name
 
@@ -75,38 +527,219 @@ class LocalVideoStorage(VideoStorageInterface):
         return self.get_signed_url(name)
 
 
-class GenericS3VideoStorage(VideoStorageInterface):
+def is_direct_upload_key(key: str) -> bool:
+    """Ключ прямой загрузки из админки: лежит под DIRECT_UPLOAD_PREFIX и не выходит за него."""
+    prefix = getattr(settings, 'DIRECT_UPLOAD_PREFIX', 'uploads/')
+    return isinstance(key, str) and key.startswith(prefix) and '..' not in key.split('/')
+
+
+class S3BatchSigningMixin:
+    """
+    Пакетная подпись ссылок на сегменты: ключ подписи SigV4 выводится один раз на пачку
+    (см. signing.S3BatchPresigner), время подписи выравнивается по S3_SIGNING_BUCKET.
+    Требует self.client и self.bucket_name.
+    """
+    _presigner: Optional[S3BatchPresigner] = None
+
+    @property
+    def presigner(self) -> S3BatchPresigner:
+        if self._presigner is None:
+            self._presigner = S3BatchPresigner.from_client(self.client, self.bucket_name)
+        return self._presigner
+
+    def get_signed_urls(self, remote_paths: list, expires: int = settings.AWS_QUERYSTRING_EXPIRE) -> list:
+        bucket = getattr(settings, 'S3_SIGNING_BUCKET', 0)
+        if not bucket:
+            return self.presigner.sign(remote_paths, expires)
+        # Подпись от начала интервала: URL детерминированы в пределах интервала,
+        # а срок продлён на длину интервала, чтобы ссылка жила не меньше expires
+        signed_at, _ = signing_window(bucket)
+        return self.presigner.sign(remote_paths, expires + bucket, now=signed_at)
+
+
+class S3BatchDeleteMixin:
+    """
+    Постраничный листинг (ListObjectsV2) и пакетное удаление (DeleteObjects, до 1000 ключей
+    за запрос) в S3_DELETE_WORKERS потоков. Требует self.client и self.bucket_name.
+    """
+
+    def list_prefix(self, prefix: str, start_after: Optional[str] = None) -> Iterator[str]:
+        paginator = self.client.get_paginator('list_objects_v2')
+        params = {'Bucket': self.bucket_name, 'Prefix': prefix}
+        if start_after:
+            params['StartAfter'] = start_after
+        for page in paginator.paginate(**params):
+            for item in page.get('Contents', []):
+                yield item['Key']
+
+    def _delete_batch(self, keys: list) -> int:
+        response = self.client.delete_objects(
+            Bucket=self.bucket_name,
+            Delete={'Objects': [{'Key': key} for key in keys], 'Quiet': True},
+        )
+        errors = response.get('Errors', [])
+        for error in errors[:10]:
+            logger.warning(f"Не удалось удалить {error.get('Key')}: {error.get('Code')} {error.get('Message')}")
+        return len(keys) - len(errors)
+
+    def delete_keys(self, remote_paths: Iterable[str], workers: Optional[int] = None) -> int:
+        workers = workers or getattr(settings, 'S3_DELETE_WORKERS', 4)
+        deleted = 0
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = []
+            batch = []
+            for key in remote_paths:
+                batch.append(key)
+                if len(batch) == S3_DELETE_BATCH:
+                    futures.append(executor.submit(self._delete_batch, batch))
+                    batch = []
+                    # Не держим в памяти больше пачек, чем потоков
+                    if len(futures) >= workers * 2:
+                        deleted += futures.pop(0).result()
+            if batch:
+                futures.append(executor.submit(self._delete_batch, batch))
+            deleted += sum(future.result() for future in futures)
+        return deleted
+
+    def delete_prefix(self, prefix: str) -> int:
+        started = time.monotonic()
+        deleted = self.delete_keys(self.list_prefix(prefix))
+        logger.info(f"Удалено {deleted} объектов с префиксом {prefix} за {time.monotonic() - started:.1f} с")
+        return deleted
+
+
+class S3DirectUploadMixin:
+    """
+    Multipart-загрузка из браузера напрямую в бакет: Django создаёт загрузку,
+    подписывает URL для частей и завершает её, но сами данные через воркеры не проходят.
+    Требует self.client и self.bucket_name.
+    """
+    supports_direct_upload = True
+
+    def create_multipart_upload(self, remote_path: str, content_type: str = "") -> str:
+        extra = {'ContentType': content_type or guess_content_type(remote_path)}
+        if self.default_acl:
+            extra['ACL'] = self.default_acl
+        response = self.client.create_multipart_upload(Bucket=self.bucket_name, Key=remote_path, **extra)
+        logger.info(f"Создана multipart-загрузка {remote_path}: {response['UploadId']}")
+        return response['UploadId']
+
+    def presign_upload_part(self, remote_path: str, upload_id: str, part_number: int, expires: int) -> str:
+        return self.client.generate_presigned_url(
+            ClientMethod='upload_part',
+            Params={
+                'Bucket': self.bucket_name, 'Key': remote_path,
+                'UploadId': upload_id, 'PartNumber': part_number,
+            },
+            ExpiresIn=expires,
+            HttpMethod='PUT',
+        )
+
+    def list_uploaded_parts(self, remote_path: str, upload_id: str) -> list:
+        """Возвращает загруженные части [{'PartNumber', 'ETag', 'Size'}] (с пагинацией)."""
+        parts = []
+        kwargs = {'Bucket': self.bucket_name, 'Key': remote_path, 'UploadId': upload_id}
+        while True:
+            response = self.client.list_parts(**kwargs)
+            parts.extend(
+                {'PartNumber': p['PartNumber'], 'ETag': p['ETag'], 'Size': p['Size']}
+                for p in response.get('Parts', [])
+            )
+            if not response.get('IsTruncated'):
+                return parts
+            kwargs['PartNumberMarker'] = response['NextPartNumberMarker']
+
+    def complete_multipart_upload(self, remote_path: str, upload_id: str) -> int:
+        """
+        Завершает загрузку по списку частей из самого хранилища (ETag из браузера не нужны).
+        Возвращает размер собранного объекта.
+        """
+        parts = self.list_uploaded_parts(remote_path, upload_id)
+        if not parts:
+            raise ValueError(f"Нет загруженных частей для {remote_path}")
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket_name, Key=remote_path, UploadId=upload_id,
+            MultipartUpload={'Parts': [
+                {'PartNumber': p['PartNumber'], 'ETag': p['ETag']}
+                for p in sorted(parts, key=lambda p: p['PartNumber'])
+            ]},
+        )
+        size = sum(p['Size'] for p in parts)
+        logger.info(f"Multipart-загрузка {remote_path} завершена: {len(parts)} частей, {size} байт")
+        return size
+
+    def abort_multipart_upload(self, remote_path: str, upload_id: str) -> None:
+        self.client.abort_multipart_upload(Bucket=self.bucket_name, Key=remote_path, UploadId=upload_id)
+        logger.info(f"Multipart-загрузка {remote_path} прервана")
+
+
+class GenericS3VideoStorage(S3BatchSigningMixin, S3BatchDeleteMixin, S3DirectUploadMixin, VideoStorageInterface):
     """Универсальное S3-хранилище, оборачивает S3Boto3Storage"""
     def __init__(self, **options):
         if not options:
             options = settings.STORAGES['private_video']['OPTIONS']
+        self.bucket_name = options['bucket_name']
+        self.default_acl = options.get('default_acl', 'private')
         self.storage = S3Boto3Storage(
             bucket_name=options['bucket_name'],
             endpoint_url=options['endpoint_url'],
             region_name=options['region_name'],
             access_key=options['access_key'],
             secret_key=options['secret_key'],
-            default_acl=options.get('default_acl', 'private'),
+            default_acl=self.default_acl,
             querystring_auth=options.get('querystring_auth', True),
+            client_config=build_s3_config(),
+        )
+        # Общий клиент с пулом соединений для пакетных операций (загрузка HLS и т.п.)
+        self.client = build_s3_client(
+            options['endpoint_url'], options['region_name'], options['access_key'], options['secret_key']
         )
         logger.info("GenericS3VideoStorage инициализирован")
 
-    def save_file(self, local_path: str, remote_path: str) -> str:
-        with open(local_path, "rb") as f:
-            self.storage.save(remote_path, f)
+    def _put_extra_args(self, remote_path: str) -> dict:
+        extra = {'ContentType': guess_content_type(remote_path)}
+        if self.default_acl:
+            extra['ACL'] = self.default_acl
+        return extra
+
+    def save_file(self, local_path: str, remote_path: str, resumable: bool = False) -> str:
+        if os.path.getsize(local_path) > getattr(settings, 'S3_MULTIPART_THRESHOLD', 16 * 1024 * 1024):
+            self.save_file_multipart(local_path, remote_path, resumable=resumable)
+        else:
+            with open(local_path, "rb") as f:
+                self.client.put_object(
+                    Bucket=self.bucket_name, Key=remote_path, Body=f, **self._put_extra_args(remote_path)
+                )
         url = self.storage.url(remote_path)
         logger.debug(f"Файл загружен в S3: {local_path} -> {remote_path}, URL={url}")
         return url
 
     def load_file(self, remote_path: str, local_path: str) -> None:
-        with self.storage.open(remote_path, "rb") as f:
-            content = f.read()
-        with open(local_path, "wb") as f:
-            f.write(content)
+        # Потоковое скачивание частями прямо в файл, без чтения объекта целиком в память
+        self.client.download_file(self.bucket_name, remote_path, local_path, Config=get_transfer_config())
         logger.debug(f"Файл загружен из S3: {remote_path} -> {local_path}")
 
+    def save_file_multipart(self, local_path: str, remote_path: str,
+                            part_size: Optional[int] = None, concurrency: Optional[int] = None,
+                            resumable: bool = False) -> UploadResult:
+        uploader = S3MultipartUploader(
+            self.client, self.bucket_name, part_size=part_size, concurrency=concurrency,
+            extra_args=self._put_extra_args(remote_path),
+        )
+        return uploader.upload(local_path, remote_path, resumable=resumable)
+
+    def abort_upload(self, local_path: str) -> None:
+        S3MultipartUploader(self.client, self.bucket_name).abort(local_path)
+
     def get_signed_url(self, remote_path: str, expires: int = settings.AWS_QUERYSTRING_EXPIRE) -> str:
-        return self.storage.url(remote_path, expire=expires)
+        return self.get_signed_urls([remote_path], expires=expires)[0]
+
+    def get_signed_urls(self, remote_paths: list, expires: int = settings.AWS_QUERYSTRING_EXPIRE) -> list:
+        # Пакетная подпись строит только path-style URL к endpoint; AWS_S3_CUSTOM_DOMAIN
+        # и virtual-host адресацию по-прежнему обрабатывает S3Boto3Storage.url
+        if self.storage.custom_domain or self.storage.addressing_style == 'virtual':
+            return [self.storage.url(remote_path, expire=expires) for remote_path in remote_paths]
+        return super().get_signed_urls(remote_paths, expires=expires)
 
     def delete_file(self, remote_path: str) -> None:
         self.storage.delete(remote_path)
@@ -138,7 +771,7 @@ class GenericS3VideoStorage(VideoStorageInterface):
         return self.storage.generate_filename(filename)
 
 
-class CloudRuS3VideoStorage(Storage, VideoStorageInterface):
+class CloudRuS3VideoStorage(S3BatchSigningMixin, S3BatchDeleteMixin, S3DirectUploadMixin, Storage, VideoStorageInterface):
     """
     Специализированное хранилище для Cloud.ru Object Storage.
     Наследуется от Django Storage для полной совместимости.
@@ -156,18 +789,8 @@ class CloudRuS3VideoStorage(Storage, VideoStorageInterface):
         # location не используем, т.к. upload_to сам формирует путь
         self.location = ''
 
-        # Клиент для подписанных URL (path-style)
-        self.client = boto3.client(
-            's3',
-            endpoint_url=self.endpoint_url,
-            region_name=self.region_name,
-            aws_access_key_id=self.access_key,
-            aws_secret_access_key=self.secret_key,
-            config=Config(
-                s3={'addressing_style': 'path'},
-                signature_version='s3v4',
-            )
-        )
+        # Клиент для подписанных URL и пакетных операций (path-style, общий пул соединений)
+        self.client = build_s3_client(self.endpoint_url, self.region_name, self.access_key, self.secret_key)
 
         # Внутреннее хранилище для операций (без подписей)
         self._storage = S3Boto3Storage(
@@ -178,6 +801,7 @@ class CloudRuS3VideoStorage(Storage, VideoStorageInterface):
             secret_key=self.secret_key,
             default_acl=self.default_acl,
             querystring_auth=False,
+            client_config=build_s3_config(),
         )
         logger.info(f"CloudRuS3VideoStorage инициализирован для бакета {self.bucket_name}")
 
@@ -186,28 +810,44 @@ class CloudRuS3VideoStorage(Storage, VideoStorageInterface):
         return name
 
     # --- Методы VideoStorageInterface (для задач) ---
-    def save_file(self, local_path: str, remote_path: str) -> str:
-        with open(local_path, 'rb') as f:
-            self._storage.save(remote_path, f)
+    def _put_extra_args(self, remote_path: str) -> dict:
+        extra = {'ContentType': guess_content_type(remote_path)}
+        if self.default_acl:
+            extra['ACL'] = self.default_acl
+        return extra
+
+    def save_file(self, local_path: str, remote_path: str, resumable: bool = False) -> str:
+        if os.path.getsize(local_path) > getattr(settings, 'S3_MULTIPART_THRESHOLD', 16 * 1024 * 1024):
+            self.save_file_multipart(local_path, remote_path, resumable=resumable)
+        else:
+            with open(local_path, 'rb') as f:
+                self.client.put_object(
+                    Bucket=self.bucket_name, Key=remote_path, Body=f, **self._put_extra_args(remote_path)
+                )
         url = self.get_signed_url(remote_path, expires=self.querystring_expire)
         logger.debug(f"Файл загружен в Cloud.ru S3: {local_path} -> {remote_path}, URL={url}")
         return url
 
     def load_file(self, remote_path: str, local_path: str) -> None:
-        with self._storage.open(remote_path, 'rb') as f:
-            content = f.read()
-        with open(local_path, 'wb') as f:
-            f.write(content)
+        # Потоковое скачивание частями прямо в файл, без чтения объекта целиком в память
+        self.client.download_file(self.bucket_name, remote_path, local_path, Config=get_transfer_config())
         logger.debug(f"Файл загружен из Cloud.ru S3: {remote_path} -> {local_path}")
 
+    def save_file_multipart(self, local_path: str, remote_path: str,
+                            part_size: Optional[int] = None, concurrency: Optional[int] = None,
+                            resumable: bool = False) -> UploadResult:
+        uploader = S3MultipartUploader(
+            self.client, self.bucket_name, part_size=part_size, concurrency=concurrency,
+            extra_args=self._put_extra_args(remote_path),
+        )
+        return uploader.upload(local_path, remote_path, resumable=resumable)
+
+    def abort_upload(self, local_path: str) -> None:
+        S3MultipartUploader(self.client, self.bucket_name).abort(local_path)
+
     def get_signed_url(self, remote_path: str, expires: int = settings.AWS_QUERYSTRING_EXPIRE) -> str:
         expires = expires or self.querystring_expire
-        url = self.client.generate_presigned_url(
-            ClientMethod='get_object',
-            Params={'Bucket': self.bucket_name, 'Key': remote_path},
-            ExpiresIn=expires,
-            HttpMethod='GET'
-        )
+        url = self.get_signed_urls([remote_path], expires=expires)[0]
         logger.debug(f"Сгенерирован подписанный URL для {remote_path}, expires={expires}")
         return url
 
@@ -245,10 +885,21 @@ class CloudRuS3VideoStorage(Storage, VideoStorageInterface):
         return self._save(name, content)
 
 
-def get_video_storage() -> VideoStorageInterface:
-    """
-    Фабрика, возвращающая реализацию VideoStorageInterface для задач.
-    """
+# ----- Реестр хранилища процесса -----
+# Хранилище (а с ним boto3-клиент и пул TLS-соединений) создаётся один раз на процесс.
+# После fork (воркеры gunicorn/uvicorn, дочерние процессы Celery prefork) экземпляр
+# родителя не используется: соединения пула нельзя делить между процессами.
+_storage_lock = threading.Lock()
+_storage_instance: Optional[VideoStorageInterface] = None
+_storage_pid: Optional[int] = None
+
+STORAGE_INSTANCES = Counter(
+    'video_storage_instances_total',
+    'Сколько раз создавалось хранилище видео (один раз на процесс при нормальной работе)',
+)
+
+
+def _create_video_storage() -> VideoStorageInterface:
     use_s3 = getattr(settings, "USE_S3", False)
     if not use_s3:
         logger.info("Выбран LocalVideoStorage")
@@ -260,4 +911,104 @@ def get_video_storage() -> VideoStorageInterface:
         return CloudRuS3VideoStorage()
     else:
         logger.info(f"Выбран GenericS3VideoStorage (провайдер: {s3_provider})")
-        return GenericS3VideoStorage()
\ No newline at end of file
+        return GenericS3VideoStorage()
+
+
+def get_video_storage() -> VideoStorageInterface:
+    """
+    Реализация VideoStorageInterface для текущего процесса (создаётся при первом вызове).
+    """
+    global _storage_instance, _storage_pid
+    pid = os.getpid()
+    storage = _storage_instance
+    if storage is not None and _storage_pid == pid:
+        return storage
+    with _storage_lock:
+        if _storage_instance is None or _storage_pid != pid:
+            _storage_instance = _create_video_storage()
+            _storage_pid = pid
+            STORAGE_INSTANCES.inc()
+        return _storage_instance
+
+
+def reset_video_storage() -> None:
+    """
+    Сбрасывает хранилище процесса: следующий get_video_storage() создаст новое.
+    Вызывается после fork и при смене настроек.
+    """
+    global _storage_lock, _storage_instance, _storage_pid
+    # Блокировка могла быть захвачена потоком родителя в момент fork
+    _storage_lock = threading.Lock()
+    _storage_instance = None
+    _storage_pid = None
+
+
+os.register_at_fork(after_in_child=reset_video_storage)
+
+
+# ----- Метрики хранилища -----
+def _client_pools(client) -> list:
+    """
+    Пулы urllib3 boto3-клиента. Это внутренние атрибуты botocore и urllib3: если
+    их устройство изменится, метрики пула пропадут, но /metrics продолжит работать.
+    """
+    try:
+        return list(client._endpoint.http_session._manager.pools._container.values())
+    except (AttributeError, TypeError) as e:
+        logger.debug(f"Пулы соединений S3-клиента недоступны: {e}")
+        return []
+
+
+class StoragePoolCollector:
+    """
+    Метрики пула соединений S3-клиента хранилища процесса и итоги multipart-загрузок,
+    снимаются при каждом опросе /metrics. Скорость загрузки:
+    rate(video_storage_upload_bytes_total) / rate(video_storage_upload_seconds_total).
+    """
+
+    def collect(self):
+        max_connections = GaugeMetricFamily(
+            'video_storage_pool_max_connections', 'Размер пула соединений S3-клиента')
+        opened = GaugeMetricFamily(
+            'video_storage_pool_opened_connections', 'Открыто соединений за время жизни пула', labels=['host'])
+        idle = GaugeMetricFamily(
+            'video_storage_pool_idle_connections', 'Свободные соединения в пуле', labels=['host'])
+        requests = CounterMetricFamily(
+            'video_storage_pool_requests', 'Запросов через пул', labels=['host'])
+
+        storage = _storage_instance
+        client = getattr(storage, 'client', None) if _storage_pid == os.getpid() else None
+        if client is not None:
+            try:
+                max_connections.add_metric([], client.meta.config.max_pool_connections)
+                for pool in _client_pools(client):
+                    idle_count = sum(1 for conn in list(pool.pool.queue) if conn is not None)
+                    opened.add_metric([pool.host], pool.num_connections)
+                    idle.add_metric([pool.host], idle_count)
+                    requests.add_metric([pool.host], pool.num_requests)
+            except Exception as e:
+                # Коллектор зарегистрирован глобально: его ошибка сломала бы весь /metrics
+                logger.warning(f"Метрики пула соединений S3 пропущены: {e}")
+        yield max_connections
+        yield opened
+        yield idle
+        yield requests
+        yield from self._collect_uploads()
+
+    def _collect_uploads(self):
+        with _upload_stats_lock:
+            stats = dict(_upload_stats)
+        yield CounterMetricFamily(
+            'video_storage_uploads', 'Завершённых multipart-загрузок', value=stats['uploads'])
+        yield CounterMetricFamily(
+            'video_storage_upload_bytes', 'Байт, переданных multipart-загрузками', value=stats['bytes'])
+        yield CounterMetricFamily(
+            'video_storage_upload_seconds', 'Длительность multipart-загрузок, секунд', value=stats['seconds'])
+        parts = CounterMetricFamily(
+            'video_storage_upload_parts', 'Частей multipart-загрузок', labels=['state'])
+        parts.add_metric(['uploaded'], stats['parts'])
+        parts.add_metric(['resumed'], stats['resumed_parts'])
+        yield parts
+
+
+REGISTRY.register(StoragePoolCollector())
@@ -2,8 +2,21 @@
 
 import logging
 from celery import shared_task
+from django.apps import apps
+from django.conf import settings
 from .models import Video, MarathonVideo
-from .hls_utils import process_video_to_hls_generic, refresh_video_links
+from .storage import get_video_storage
+from . import view_counters
+from .hls_utils import (
+    process_video_to_hls_generic,
+    refresh_video_links,
+    refresh_video_links_generic,
+    refresh_expiring_links_batch,
+    hls_remote_base,
+    encode_chunk_generic,
+    finalize_chunked_generic,
+    fail_chunked_encoding,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -36,4 +49,87 @@ def process_marathon_video_to_hls(self, marathon_video_id: int):
     try:
         process_video_to_hls_generic(mv, "marathon_video/")
     except Exception as e:
-        raise self.retry(exc=e)
\ No newline at end of file
+        raise self.retry(exc=e)
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=60)
+def encode_hls_chunk(self, chunks_base: str, chunk_index: int, profile_names: list,
+                     framerate=None, start: float = 0.0, end=None):
+    """Кодирует один кусок длинного видео (часть chord из start_chunked_encoding)."""
+    try:
+        return encode_chunk_generic(chunks_base, chunk_index, profile_names, framerate, start, end)
+    except Exception as e:
+        raise self.retry(exc=e)
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=60)
+def finalize_chunked_hls(self, chunk_results: list, model_label: str, obj_id: int,
+                         remote_base_prefix: str, profile_names: list, audio_tracks: dict = None):
+    """Собирает закодированные куски в HLS после завершения всех encode_hls_chunk."""
+    model = apps.get_model(model_label)
+    try:
+        obj = model.objects.get(id=obj_id)
+    except model.DoesNotExist:
+        logger.error(f"{model.__name__} {obj_id} не найдено")
+        return
+    try:
+        finalize_chunked_generic(obj, remote_base_prefix, chunk_results, profile_names, audio_tracks)
+    except Exception as e:
+        raise self.retry(exc=e)
+
+
+@shared_task
+def chunked_hls_failed(request, exc, traceback, model_label: str, obj_id: int, remote_base_prefix: str):
+    """
+    Errback chord кодирования по кускам: вызывается, когда encode_hls_chunk или
+    finalize_chunked_hls исчерпали повторы. Без него объект оставался бы
+    «в обработке», а куски — в хранилище.
+    """
+    model = apps.get_model(model_label)
+    try:
+        obj = model.objects.get(id=obj_id)
+    except model.DoesNotExist:
+        logger.error(f"{model.__name__} {obj_id} не найдено")
+        return
+    fail_chunked_encoding(obj, remote_base_prefix, exc)
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=10)
+def refresh_hls_links(self, model_label: str, obj_id: int):
+    """Обновляет подписанные ссылки одного Video/MarathonVideo в фоне."""
+    model = apps.get_model(model_label)
+    try:
+        obj = model.objects.get(id=obj_id)
+    except model.DoesNotExist:
+        logger.error(f"{model.__name__} {obj_id} не найдено")
+        return
+    if not refresh_video_links_generic(obj, hls_remote_base(obj), settings.AWS_QUERYSTRING_EXPIRE):
+        raise self.retry()
+
+
+@shared_task(ignore_result=True)
+def refresh_expiring_hls_links():
+    """Периодическая задача (Celery beat): обновление ссылок до их истечения."""
+    return refresh_expiring_links_batch()
+
+
+@shared_task(bind=True, max_retries=5, default_retry_delay=60)
+def delete_storage_files(self, prefixes: list, keys: list = None):
+    """
+    Удаляет файлы удалённого видео из хранилища: каталоги (HLS, промежуточные куски)
+    и отдельные ключи (исходник, загруженный напрямую в бакет). Повтор безопасен.
+    """
+    storage = get_video_storage()
+    try:
+        for prefix in prefixes:
+            storage.delete_prefix(prefix)
+        if keys:
+            storage.delete_keys(keys)
+    except Exception as e:
+        raise self.retry(exc=e)
+
+
+@shared_task(ignore_result=True)
+def flush_view_counters():
+    """Периодическая задача (Celery beat): перенос просмотров из Redis в БД."""
+    return view_counters.flush_view_counters()
@@ -1,3 +1,780 @@
-from django.test import TestCase
+import io
+import os
+import json
+import time
+import asyncio
+import tempfile
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone as dt_timezone
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlsplit
+from unittest import mock
 
-# Create your tests here.
+import boto3
+import httpx
+import redis
+from botocore.stub import ANY, Stubber
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db.models.signals import post_save
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from . import async_storage, catalog_cache, view_counters
+from .async_storage import S3_NAMESPACE, AsyncS3VideoStorage
+from .ffmpeg_utils import CHUNK_OVERLAP, allocate_encoder_threads, encode_chunk_profile, split_into_chunks
+from .hls_utils import _upload_with_retries
+from .locks import RELEASE_SCRIPT, single_flight
+from .middleware import CONSENT_SESSION_KEY, ConsentMiddleware, get_active_document_versions
+from .models import Video
+from .signing import S3BatchPresigner, prefix_token, token_prefix, verify_prefix_token
+from .storage import (
+    S3_DELETE_BATCH, S3_MIN_PART_SIZE, GenericS3VideoStorage, LocalVideoStorage, S3MultipartUploader,
+    StoragePoolCollector,
+)
+from .views import secure_link_auth, secure_link_file
+
+
+class S3MultipartUploaderTests(SimpleTestCase):
+    """Multipart-загрузка и возобновление по ListParts на заглушке S3 (botocore Stubber)."""
+
+    bucket = "test-bucket"
+    key = "videos/big.mp4"
+    upload_id = "upload-1"
+
+    def setUp(self):
+        self.client = boto3.client(
+            "s3", region_name="us-east-1",
+            aws_access_key_id="test", aws_secret_access_key="test",
+        )
+        self.stubber = Stubber(self.client)
+        self.stubber.activate()
+        self.addCleanup(self.stubber.deactivate)
+
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        # Три части: две полные и неполная последняя
+        self.local_path = os.path.join(temp_dir.name, "big.mp4")
+        with open(self.local_path, "wb") as f:
+            f.write(os.urandom(2 * S3_MIN_PART_SIZE + 1024))
+        self.size = os.path.getsize(self.local_path)
+
+        self.uploader = S3MultipartUploader(self.client, self.bucket, part_size=S3_MIN_PART_SIZE, concurrency=1)
+
+    def _save_state(self):
+        with open(S3MultipartUploader.state_path(self.local_path), "w") as f:
+            json.dump({
+                "bucket": self.bucket,
+                "key": self.key,
+                "upload_id": self.upload_id,
+                "part_size": S3_MIN_PART_SIZE,
+                "size": self.size,
+                "mtime": os.path.getmtime(self.local_path),
+            }, f)
+
+    def _expect_upload_part(self, part_number: int):
+        self.stubber.add_response(
+            "upload_part", {"ETag": f'"etag-{part_number}"'},
+            {"Bucket": self.bucket, "Key": self.key, "UploadId": self.upload_id,
+             "PartNumber": part_number, "Body": ANY},
+        )
+
+    def _expect_complete(self):
+        self.stubber.add_response(
+            "complete_multipart_upload", {},
+            {"Bucket": self.bucket, "Key": self.key, "UploadId": self.upload_id,
+             "MultipartUpload": {"Parts": [
+                 {"PartNumber": n, "ETag": f'"etag-{n}"'} for n in (1, 2, 3)
+             ]}},
+        )
+
+    def test_upload_from_scratch(self):
+        self.stubber.add_response(
+            "create_multipart_upload", {"UploadId": self.upload_id},
+            {"Bucket": self.bucket, "Key": self.key},
+        )
+        for n in (1, 2, 3):
+            self._expect_upload_part(n)
+        self._expect_complete()
+
+        result = self.uploader.upload(self.local_path, self.key)
+
+        self.stubber.assert_no_pending_responses()
+        self.assertEqual((result.parts, result.resumed_parts), (3, 0))
+        self.assertEqual(result.uploaded_bytes, self.size)
+        self.assertFalse(os.path.exists(S3MultipartUploader.state_path(self.local_path)))
+
+    def test_resume_uploads_only_missing_parts(self):
+        self._save_state()
+        # ListParts постранично: части 1 и 2 уже в хранилище
+        self.stubber.add_response(
+            "list_parts",
+            {"Parts": [{"PartNumber": 1, "ETag": '"etag-1"'}], "IsTruncated": True, "NextPartNumberMarker": 1},
+            {"Bucket": self.bucket, "Key": self.key, "UploadId": self.upload_id},
+        )
+        self.stubber.add_response(
+            "list_parts",
+            {"Parts": [{"PartNumber": 2, "ETag": '"etag-2"'}], "IsTruncated": False},
+            {"Bucket": self.bucket, "Key": self.key, "UploadId": self.upload_id, "PartNumberMarker": 1},
+        )
+        self._expect_upload_part(3)
+        self._expect_complete()
+
+        result = self.uploader.upload(self.local_path, self.key)
+
+        self.stubber.assert_no_pending_responses()
+        self.assertEqual((result.parts, result.resumed_parts), (3, 2))
+        self.assertEqual(result.uploaded_bytes, 1024)
+
+    def test_resume_restarts_when_upload_is_gone(self):
+        self._save_state()
+        self.stubber.add_client_error("list_parts", service_error_code="NoSuchUpload", http_status_code=404)
+        self.stubber.add_response(
+            "create_multipart_upload", {"UploadId": self.upload_id},
+            {"Bucket": self.bucket, "Key": self.key},
+        )
+        for n in (1, 2, 3):
+            self._expect_upload_part(n)
+        self._expect_complete()
+
+        result = self.uploader.upload(self.local_path, self.key)
+
+        self.stubber.assert_no_pending_responses()
+        self.assertEqual(result.resumed_parts, 0)
+
+    def _failing_uploader(self, calls: list) -> S3MultipartUploader:
+        """Загрузчик, у которого первая часть падает, а остальные загружаются медленно."""
+        class FailingUploader(S3MultipartUploader):
+            def _upload_part(self, local_path, remote_path, upload_id, part_number, offset, length):
+                calls.append(part_number)
+                if part_number == 1:
+                    raise ConnectionError("обрыв соединения")
+                time.sleep(0.2)
+                return f'"etag-{part_number}"'
+
+        # Шесть частей, один поток: после ошибки могут начаться не больше одной следующей
+        with open(self.local_path, "ab") as f:
+            f.write(os.urandom(3 * S3_MIN_PART_SIZE))
+        self.size = os.path.getsize(self.local_path)
+        return FailingUploader(self.client, self.bucket, part_size=S3_MIN_PART_SIZE, concurrency=1)
+
+    def test_failed_part_cancels_pending_and_aborts(self):
+        calls = []
+        uploader = self._failing_uploader(calls)
+        self.stubber.add_response(
+            "create_multipart_upload", {"UploadId": self.upload_id},
+            {"Bucket": self.bucket, "Key": self.key},
+        )
+        self.stubber.add_response(
+            "abort_multipart_upload", {},
+            {"Bucket": self.bucket, "Key": self.key, "UploadId": self.upload_id},
+        )
+
+        with self.assertRaises(ConnectionError):
+            uploader.upload(self.local_path, self.key)
+
+        self.stubber.assert_no_pending_responses()
+        self.assertLessEqual(set(calls), {1, 2})
+        self.assertFalse(os.path.exists(S3MultipartUploader.state_path(self.local_path)))
+
+    def test_resumable_failure_keeps_state(self):
+        uploader = self._failing_uploader([])
+        self.stubber.add_response(
+            "create_multipart_upload", {"UploadId": self.upload_id},
+            {"Bucket": self.bucket, "Key": self.key},
+        )
+
+        with self.assertRaises(ConnectionError):
+            uploader.upload(self.local_path, self.key, resumable=True)
+
+        self.stubber.assert_no_pending_responses()
+        self.assertTrue(os.path.exists(S3MultipartUploader.state_path(self.local_path)))
+
+    def test_upload_exported_to_metrics(self):
+        def uploaded_bytes():
+            metrics = {m.name: m for m in StoragePoolCollector().collect()}
+            return metrics['video_storage_upload_bytes'].samples[0].value
+
+        before = uploaded_bytes()
+        self.test_resume_uploads_only_missing_parts()
+        self.assertEqual(uploaded_bytes() - before, 1024)
+
+
+class UploadWithRetriesTests(SimpleTestCase):
+    def test_upload_aborted_after_last_retry(self):
+        storage = mock.Mock()
+        storage.save_file.side_effect = ConnectionError("обрыв соединения")
+
+        with self.assertRaises(ConnectionError):
+            _upload_with_retries(storage, "/tmp/out.ts", "1/hls/out.ts", retries=2, backoff=0)
+
+        self.assertEqual(storage.save_file.call_count, 3)
+        storage.save_file.assert_called_with("/tmp/out.ts", "1/hls/out.ts", resumable=True)
+        storage.abort_upload.assert_called_once_with("/tmp/out.ts")
+
+    def test_retry_resumes_without_abort(self):
+        storage = mock.Mock()
+        storage.save_file.side_effect = [ConnectionError("обрыв соединения"), None]
+
+        _upload_with_retries(storage, "/tmp/out.ts", "1/hls/out.ts", retries=2, backoff=0)
+
+        self.assertEqual(storage.save_file.call_count, 2)
+        storage.abort_upload.assert_not_called()
+
+
+@override_settings(S3_DELETE_WORKERS=2)
+class AsyncS3DeletePrefixTests(SimpleTestCase):
+    """delete_prefix поверх httpx.MockTransport: постраничный листинг и разбор ответа DeleteObjects."""
+
+    def setUp(self):
+        # 2500 ключей на двух страницах листинга -> три пачки DeleteObjects
+        self.keys = [f"1/hls/out_{i:04d}.ts" for i in range(2500)]
+        self.delete_bodies = []
+
+    def _list_page(self, keys, token=None):
+        contents = "".join(f"<Contents><Key>{key}</Key></Contents>" for key in keys)
+        truncated = f"<IsTruncated>true</IsTruncated><NextContinuationToken>{token}</NextContinuationToken>" \
+            if token else "<IsTruncated>false</IsTruncated>"
+        return f'<ListBucketResult xmlns="{S3_NAMESPACE}">{contents}{truncated}</ListBucketResult>'
+
+    def _handler(self, request: httpx.Request) -> httpx.Response:
+        if request.method == "GET":
+            if "continuation-token" in request.url.params:
+                return httpx.Response(200, text=self._list_page(self.keys[1500:]))
+            return httpx.Response(200, text=self._list_page(self.keys[:1500], token="page-2"))
+        self.delete_bodies.append(request.content)
+        # В первой пачке два ключа не удаляются
+        if len(self.delete_bodies) == 1:
+            errors = "".join(
+                f"<Error><Key>{key}</Key><Code>AccessDenied</Code><Message>Access Denied</Message></Error>"
+                for key in self.keys[:2]
+            )
+            return httpx.Response(200, text=f'<DeleteResult xmlns="{S3_NAMESPACE}">{errors}</DeleteResult>')
+        return httpx.Response(200, text=f'<DeleteResult xmlns="{S3_NAMESPACE}"/>')
+
+    def _storage(self) -> AsyncS3VideoStorage:
+        presigner = S3BatchPresigner("https://s3.example.com", "us-east-1", "bucket", "test", "test")
+        storage = AsyncS3VideoStorage(SimpleNamespace(presigner=presigner))
+        storage.client = httpx.AsyncClient(transport=httpx.MockTransport(self._handler))
+        return storage
+
+    def test_delete_prefix_counts_only_deleted_keys(self):
+        async def run():
+            storage = self._storage()
+            try:
+                return await storage.delete_prefix("1/hls/")
+            finally:
+                await storage.aclose()
+
+        deleted = asyncio.run(run())
+
+        self.assertEqual(deleted, len(self.keys) - 2)
+        self.assertEqual(len(self.delete_bodies), -(-len(self.keys) // S3_DELETE_BATCH))
+        root = ET.fromstring(self.delete_bodies[0])
+        self.assertEqual(root.tag, f"{{{S3_NAMESPACE}}}Delete")
+        sent = [el.text for body in self.delete_bodies for el in ET.fromstring(body).iter(f"{{{S3_NAMESPACE}}}Key")]
+        self.assertEqual(sorted(sent), self.keys)
+
+    def test_stale_loop_storage_is_closed(self):
+        closed = []
+
+        class FakeStorage:
+            async def aclose(self):
+                closed.append(self)
+
+        stale = FakeStorage()
+
+        async def run():
+            async_storage._async_storages[("stale", 0)] = stale
+            async_storage.get_async_video_storage()
+            await asyncio.sleep(0)
+
+        with mock.patch.object(async_storage, "_async_storages", {}):
+            asyncio.run(run())
+        self.assertEqual(closed, [stale])
+
+
+class StoragePoolCollectorTests(SimpleTestCase):
+    def _collect(self, client) -> dict:
+        with mock.patch("fitness_app.core.storage._storage_instance", SimpleNamespace(client=client)), \
+                mock.patch("fitness_app.core.storage._storage_pid", os.getpid()):
+            return {metric.name: metric for metric in StoragePoolCollector().collect()}
+
+    def test_pool_metrics_from_real_client(self):
+        client = boto3.client("s3", region_name="us-east-1", aws_access_key_id="test", aws_secret_access_key="test")
+        metrics = self._collect(client)
+        self.assertEqual(metrics["video_storage_pool_max_connections"].samples[0].value,
+                         client.meta.config.max_pool_connections)
+
+    def test_changed_internals_do_not_break_metrics(self):
+        # Внутренний атрибут urllib3 другого типа: пулы пропускаются, остальные метрики отдаются
+        client = mock.Mock()
+        client._endpoint.http_session._manager.pools._container = None
+        client.meta.config.max_pool_connections = 10
+        metrics = self._collect(client)
+        self.assertEqual(metrics["video_storage_pool_idle_connections"].samples, [])
+        self.assertIn("video_storage_upload_bytes", metrics)
+
+    def test_broken_pool_skipped(self):
+        client = mock.Mock()
+        client._endpoint.http_session._manager.pools._container = {"key": SimpleNamespace(host="s3")}
+        metrics = self._collect(client)
+        self.assertEqual(metrics["video_storage_pool_opened_connections"].samples, [])
+
+
+class GenericS3SignedUrlTests(SimpleTestCase):
+    def setUp(self):
+        self.storage = GenericS3VideoStorage(
+            bucket_name="videos", endpoint_url="http://minio:9000", region_name="us-east-1",
+            access_key="test", secret_key="test",
+        )
+
+    def test_path_style_batch_signing(self):
+        url = urlsplit(self.storage.get_signed_url("1/hls/master.m3u8", expires=120))
+        self.assertEqual((url.netloc, url.path), ("minio:9000", "/videos/1/hls/master.m3u8"))
+        # S3_SIGNING_BUCKET по умолчанию 0: срок не продлевается
+        self.assertEqual(parse_qs(url.query)["X-Amz-Expires"], ["120"])
+
+    def test_custom_domain_uses_storage_url(self):
+        self.storage.storage.custom_domain = "cdn.example.com"
+        url = urlsplit(self.storage.get_signed_url("1/hls/master.m3u8"))
+        self.assertEqual((url.netloc, url.path), ("cdn.example.com", "/1/hls/master.m3u8"))
+
+
+@override_settings(SECURE_LINK_SECRET="test-secret", SECURE_LINK_AUTH_CACHE_TTL=60)
+class SecureLinkTokenTests(SimpleTestCase):
+    secret = "test-secret"
+    path = "1/hls/out_720p_001.ts"
+
+    def setUp(self):
+        self.now = int(time.time())
+        self.expires_at = self.now + 3600
+        self.token = prefix_token(token_prefix(self.path), self.expires_at, self.secret)
+        self.factory = RequestFactory()
+
+    def _auth(self, uri):
+        return secure_link_auth(self.factory.get("/hls/token-auth/", HTTP_X_ORIGINAL_URI=uri))
+
+    def test_valid_token_opens_whole_directory(self):
+        self.assertEqual(token_prefix(self.path), "1/hls/")
+        for path in (self.path, "1/hls/master.m3u8"):
+            self.assertTrue(verify_prefix_token(self.token, path, self.expires_at, self.secret))
+
+    def test_expired_token(self):
+        expires_at = self.now - 1
+        token = prefix_token("1/hls/", expires_at, self.secret)
+        self.assertFalse(verify_prefix_token(token, self.path, expires_at, self.secret))
+
+    def test_other_directories_rejected(self):
+        for path in ("2/hls/out_720p_001.ts", "1/hls2/out_720p_001.ts", "11/hls/out_720p_001.ts",
+                     "1/hls/sub/out_720p_001.ts", "1/out_720p_001.ts"):
+            self.assertFalse(verify_prefix_token(self.token, path, self.expires_at, self.secret), path)
+
+    def test_traversal_rejected(self):
+        # Даже токен, выданный ровно на такой «каталог», не открывает выход за префикс
+        path = "1/hls/../../secret.txt"
+        token = prefix_token(token_prefix(path), self.expires_at, self.secret)
+        self.assertFalse(verify_prefix_token(token, path, self.expires_at, self.secret))
+        self.assertEqual(self._auth(f"/secure-hls/{self.token}/{self.expires_at}/1/hls/../../secret.txt").status_code, 403)
+
+    def test_tampered_expires_at(self):
+        self.assertFalse(verify_prefix_token(self.token, self.path, self.expires_at + 86400, self.secret))
+        self.assertEqual(self._auth(f"/secure-hls/{self.token}/{self.expires_at + 86400}/{self.path}").status_code, 403)
+
+    def test_auth_caps_cache_by_remaining_lifetime(self):
+        response = self._auth(f"/secure-hls/{self.token}/{self.expires_at}/{self.path}")
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(response["X-Accel-Expires"], "60")
+
+        expires_at = self.now + 10
+        token = prefix_token("1/hls/", expires_at, self.secret)
+        response = self._auth(f"/secure-hls/{token}/{expires_at}/{self.path}")
+        self.assertEqual(response.status_code, 204)
+        self.assertLessEqual(int(response["X-Accel-Expires"]), 10)
+
+    def test_auth_rejects_foreign_uri(self):
+        self.assertEqual(self._auth(f"/media/videos/{self.path}").status_code, 403)
+        self.assertEqual(self._auth("").status_code, 403)
+
+    def test_file_served_from_local_storage(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        os.makedirs(os.path.join(temp_dir.name, "1/hls"))
+        with open(os.path.join(temp_dir.name, self.path), "wb") as f:
+            f.write(b"segment")
+        request = self.factory.get("/")
+        with mock.patch("fitness_app.core.views.get_video_storage", return_value=LocalVideoStorage(temp_dir.name)):
+            response = secure_link_file(request, self.token, self.expires_at, self.path)
+            self.assertEqual(b"".join(response.streaming_content), b"segment")
+            response.close()
+            forbidden = secure_link_file(request, self.token, self.expires_at, "2/hls/out_720p_001.ts")
+            self.assertEqual(forbidden.status_code, 403)
+
+
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        self.redis = mock.Mock()
+        patcher = mock.patch("fitness_app.core.locks.get_redis", return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_lock_released_with_owner_token(self):
+        self.redis.set.return_value = True
+        with self.assertRaises(RuntimeError):
+            with single_flight("hls:1", ttl=30) as acquired:
+                self.assertTrue(acquired)
+                raise RuntimeError("ошибка внутри операции")
+        token = self.redis.set.call_args.args[1]
+        self.assertEqual(self.redis.set.call_args.kwargs, {"nx": True, "px": 30000})
+        self.redis.eval.assert_called_once_with(RELEASE_SCRIPT, 1, "hls:1", token)
+
+    def test_busy_lock_not_released(self):
+        self.redis.set.return_value = None
+        with single_flight("hls:1", ttl=30) as acquired:
+            self.assertFalse(acquired)
+        self.redis.eval.assert_not_called()
+
+    def test_runs_without_lock_when_redis_down(self):
+        self.redis.set.side_effect = redis.ConnectionError("connection refused")
+        with single_flight("hls:1", ttl=30) as acquired:
+            self.assertTrue(acquired)
+        self.redis.eval.assert_not_called()
+
+    def test_release_error_not_raised(self):
+        self.redis.set.return_value = True
+        self.redis.eval.side_effect = redis.TimeoutError("timeout")
+        with single_flight("hls:1", ttl=30) as acquired:
+            self.assertTrue(acquired)
+
+
+class FakeSweepStorage:
+    """Хранилище для cleanup_video_files: отсортированный листинг со StartAfter и учёт удалений."""
+
+    def __init__(self, keys, fail_on_delete=None):
+        self.keys = sorted(keys)
+        self.deleted = []
+        self.list_calls = []
+        self.fail_on_delete = fail_on_delete
+
+    def list_prefix(self, prefix, start_after=None):
+        self.list_calls.append((prefix, start_after))
+        for key in self.keys:
+            if key.startswith(prefix) and (start_after is None or key > start_after):
+                yield key
+
+    def delete_keys(self, keys, workers=None):
+        if self.fail_on_delete and self.fail_on_delete in keys:
+            raise RuntimeError("обрыв соединения")
+        self.deleted.extend(keys)
+        self.keys = [key for key in self.keys if key not in keys]
+        return len(keys)
+
+
+class CleanupVideoFilesTests(SimpleTestCase):
+    keys = [
+        "1/hls/out_720p_000.ts", "1/chunks/chunk_000.mp4",
+        "2/hls/master.m3u8", "2/chunks/chunk_000.mp4", "2/source.mp4", "2/hlsx/a.ts",
+        "23/hls/out_720p_000.ts", "3/hls/master.m3u8",
+        "marathon_video/5/hls/master.m3u8", "marathon_video/6/hls/master.m3u8",
+    ]
+
+    def setUp(self):
+        self.filter_calls = []
+        existing = {"core.Video": {1, 3}, "core.MarathonVideo": {6}}
+
+        def get_model(label):
+            def filter(id__in):
+                self.filter_calls.append((label, sorted(id__in)))
+                return mock.Mock(values_list=lambda *args, **kwargs: [i for i in id__in if i in existing[label]])
+            return SimpleNamespace(objects=SimpleNamespace(filter=filter), _meta=SimpleNamespace(label=label))
+
+        patcher = mock.patch("fitness_app.core.management.commands.cleanup_video_files.apps.get_model", get_model)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _run(self, storage, **options):
+        with mock.patch("fitness_app.core.management.commands.cleanup_video_files.get_video_storage",
+                        return_value=storage):
+            call_command("cleanup_video_files", stdout=io.StringIO(), **options)
+
+    def test_only_processing_dirs_of_missing_ids_deleted(self):
+        storage = FakeSweepStorage(self.keys)
+        self._run(storage)
+        self.assertCountEqual(storage.deleted, [
+            "2/hls/master.m3u8", "2/chunks/chunk_000.mp4", "23/hls/out_720p_000.ts",
+            "marathon_video/5/hls/master.m3u8",
+        ])
+
+    def test_dry_run_deletes_nothing(self):
+        storage = FakeSweepStorage(self.keys)
+        self._run(storage, dry_run=True)
+        self.assertEqual(storage.deleted, [])
+
+    def test_ids_checked_once_per_batch(self):
+        self._run(FakeSweepStorage(self.keys), batch_size=2)
+        # Листинг "2": ["2/chunks/chunk_000.mp4", "2/hls/master.m3u8"], ["2/hlsx/a.ts", "2/source.mp4"], ["23/hls/..."]
+        video_calls = [ids for label, ids in self.filter_calls if label == "core.Video"]
+        self.assertEqual(video_calls, [[1], [2], [], [23], [3]])
+
+    def test_interrupted_run_resumes_from_checkpoint(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        checkpoint = os.path.join(temp_dir.name, "sweep.json")
+
+        storage = FakeSweepStorage(self.keys, fail_on_delete="23/hls/out_720p_000.ts")
+        with self.assertRaises(RuntimeError):
+            self._run(storage, batch_size=2, checkpoint=checkpoint)
+        with open(checkpoint) as f:
+            state = json.load(f)
+        self.assertEqual(state, {"done": ["1"], "prefix": "2", "last_key": "2/source.mp4"})
+
+        storage.fail_on_delete = None
+        storage.list_calls = []
+        self._run(storage, batch_size=2, checkpoint=checkpoint)
+        self.assertEqual(storage.list_calls[0], ("2", "2/source.mp4"))
+        self.assertNotIn(("1", None), storage.list_calls)
+        self.assertIn("23/hls/out_720p_000.ts", storage.deleted)
+        self.assertFalse(os.path.exists(checkpoint))
+
+
+@override_settings(CATALOG_VERSION_CHECK_INTERVAL=60)
+class CatalogCacheTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        catalog_cache._local.clear()
+        catalog_cache._local_versions.clear()
+        self.addCleanup(cache.clear)
+        self.builder = mock.Mock(side_effect=lambda: [self.builder.call_count])
+
+    def test_built_once_and_rebuilt_after_bump(self):
+        self.assertEqual(catalog_cache.get_cached("catalog", "banners", self.builder), [1])
+        self.assertEqual(catalog_cache.get_cached("catalog", "banners", self.builder), [1])
+        catalog_cache.bump_version("catalog")
+        self.assertEqual(catalog_cache.get_cached("catalog", "banners", self.builder), [2])
+
+    def test_bump_keeps_other_groups(self):
+        catalog_cache.get_cached("consent", "documents", self.builder)
+        catalog_cache.bump_version("catalog")
+        catalog_cache.get_cached("consent", "documents", self.builder)
+        self.assertEqual(self.builder.call_count, 1)
+
+    def test_other_process_bump_seen_after_check_interval(self):
+        catalog_cache.get_cached("catalog", "banners", self.builder)
+        # Другой процесс сменил версию в общем кэше: память процесса о ней пока не знает
+        cache.set(catalog_cache.VERSION_KEY.format(group="catalog"), "other", None)
+        self.assertEqual(catalog_cache.get_cached("catalog", "banners", self.builder), [1])
+        with override_settings(CATALOG_VERSION_CHECK_INTERVAL=0):
+            self.assertEqual(catalog_cache.get_cached("catalog", "banners", self.builder), [2])
+
+    def test_shared_cache_reused_by_fresh_process(self):
+        catalog_cache.get_cached("catalog", "banners", self.builder)
+        catalog_cache._local.clear()
+        catalog_cache._local_versions.clear()
+        self.assertEqual(catalog_cache.get_cached("catalog", "banners", self.builder), [1])
+        self.assertEqual(self.builder.call_count, 1)
+
+    def test_video_counters_do_not_bump_catalog(self):
+        video = Video(id=1, title="Видео")
+        with mock.patch("fitness_app.core.signals.bump_version") as bump, \
+                mock.patch("django.db.transaction.on_commit", side_effect=lambda func: func()):
+            post_save.send(sender=Video, instance=video, created=False, update_fields={"views", "last_viewed_at"})
+            bump.assert_not_called()
+            post_save.send(sender=Video, instance=video, created=False, update_fields={"title"})
+            bump.assert_called_once_with("catalog")
+
+
+class ConsentFingerprintTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        catalog_cache._local.clear()
+        catalog_cache._local_versions.clear()
+        self.addCleanup(cache.clear)
+        self.active_ids = [3, 1]
+        self.consented = {1, 3}
+
+        mock.patch(
+            "fitness_app.core.middleware.DocumentVersion.objects.filter",
+            side_effect=lambda **kwargs: mock.Mock(values_list=lambda *args, **kw: self.active_ids),
+        ).start()
+        self.consents = mock.patch(
+            "fitness_app.core.middleware.UserConsent.objects.filter",
+            side_effect=lambda user, document_version_id__in: mock.Mock(
+                count=lambda: len(self.consented & set(document_version_id__in))),
+        ).start()
+        self.addCleanup(mock.patch.stopall)
+        self.middleware = ConsentMiddleware(get_response=mock.Mock())
+
+    def _request(self, user_id=1, session=None):
+        return SimpleNamespace(user=SimpleNamespace(id=user_id), session={} if session is None else session)
+
+    def test_fingerprint_depends_only_on_version_set(self):
+        version_ids, fingerprint = get_active_document_versions()
+        self.assertEqual(version_ids, [1, 3])
+        self.active_ids = [1, 3]
+        catalog_cache.bump_version("consent")
+        self.assertEqual(get_active_document_versions()[1], fingerprint)
+        self.active_ids = [1, 4]
+        catalog_cache.bump_version("consent")
+        self.assertNotEqual(get_active_document_versions()[1], fingerprint)
+
+    def test_session_fingerprint_skips_db(self):
+        request = self._request()
+        self.assertTrue(self.middleware.has_valid_consents(request))
+        self.assertEqual(self.consents.call_count, 1)
+        self.assertTrue(self.middleware.has_valid_consents(request))
+        self.assertEqual(self.consents.call_count, 1)
+        # Отпечаток другого пользователя в той же сессии не засчитывается
+        self.assertTrue(self.middleware.has_valid_consents(self._request(user_id=2, session=request.session)))
+        self.assertEqual(self.consents.call_count, 2)
+
+    def test_new_version_requires_consent_again(self):
+        request = self._request()
+        self.assertTrue(self.middleware.has_valid_consents(request))
+        self.active_ids = [1, 3, 5]
+        catalog_cache.bump_version("consent")
+        self.assertFalse(self.middleware.has_valid_consents(request))
+        self.consented.add(5)
+        self.assertTrue(self.middleware.has_valid_consents(request))
+        self.assertTrue(request.session[CONSENT_SESSION_KEY].startswith("1:"))
+
+    def test_missing_consent_not_remembered(self):
+        self.consented = {1}
+        request = self._request()
+        self.assertFalse(self.middleware.has_valid_consents(request))
+        self.assertNotIn(CONSENT_SESSION_KEY, request.session)
+
+
+class ViewCountersTests(TestCase):
+    def setUp(self):
+        # bulk_create не отправляет post_save: обработка видео не запускается
+        self.first, self.second = Video.objects.bulk_create([
+            Video(title="Первое", file="videos/1.mp4", description="", views=10),
+            Video(title="Второе", file="videos/2.mp4", description="", views=5),
+        ])
+
+    def test_take_buffer_renames_pending(self):
+        client = mock.Mock()
+        client.exists.return_value = False
+        self.assertEqual(view_counters._take_buffer(client, "views:pending:core.Video"),
+                         "views:pending:core.Video:processing")
+        client.rename.assert_called_once_with("views:pending:core.Video", "views:pending:core.Video:processing")
+
+    def test_take_buffer_finishes_leftover_first(self):
+        client = mock.Mock()
+        client.exists.return_value = True
+        view_counters._take_buffer(client, "views:pending:core.Video")
+        client.rename.assert_not_called()
+
+    def test_take_buffer_empty(self):
+        client = mock.Mock()
+        client.exists.return_value = False
+        client.rename.side_effect = redis.ResponseError("no such key")
+        self.assertEqual(view_counters._take_buffer(client, "views:pending:core.Video"),
+                         "views:pending:core.Video:processing")
+
+    def test_apply_batch_updates_only_given_rows(self):
+        viewed_at = datetime(2026, 10, 1, 12, 0, tzinfo=dt_timezone.utc)
+        third = Video.objects.bulk_create([Video(title="Третье", file="videos/3.mp4", description="", views=7)])[0]
+        view_counters._apply_batch(Video, {self.first.pk: 3}, {self.second.pk: viewed_at})
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        third.refresh_from_db()
+        self.assertEqual((self.first.views, self.first.last_viewed_at), (13, None))
+        self.assertEqual((self.second.views, self.second.last_viewed_at), (5, viewed_at))
+        self.assertEqual((third.views, third.last_viewed_at), (7, None))
+
+    def test_flush_moves_buffer_to_db(self):
+        client = mock.Mock()
+        client.exists.return_value = False
+        client.hgetall.side_effect = lambda key: {
+            "views:pending:core.Video:processing": {str(self.first.pk).encode(): b"4", str(self.second.pk).encode(): b"1"},
+            "views:last:core.Video:processing": {str(self.first.pk).encode(): b"1790000000"},
+        }[key]
+        with mock.patch("fitness_app.core.view_counters.get_redis", return_value=client), \
+                override_settings(VIEW_COUNTER_FLUSH_BATCH=1):
+            self.assertEqual(view_counters.flush_model_views("core.Video"), 5)
+        client.delete.assert_called_once_with("views:pending:core.Video:processing", "views:last:core.Video:processing")
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        self.assertEqual((self.first.views, self.second.views), (14, 6))
+        self.assertEqual(self.first.last_viewed_at, datetime.fromtimestamp(1790000000, dt_timezone.utc))
+
+    def test_record_view_falls_back_to_db(self):
+        client = mock.Mock()
+        client.pipeline.return_value.execute.side_effect = redis.ConnectionError("connection refused")
+        with mock.patch("fitness_app.core.view_counters.get_redis", return_value=client):
+            view_counters.record_view(self.first)
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.views, 11)
+        self.assertIsNotNone(self.first.last_viewed_at)
+
+
+class ChunkBoundaryTests(SimpleTestCase):
+    def _split(self, chunk_duration, duration, origin=0.5):
+        with mock.patch("fitness_app.core.ffmpeg_utils.get_video_start_time", return_value=origin), \
+                mock.patch("fitness_app.core.ffmpeg_utils.subprocess.run") as run:
+            chunks = split_into_chunks("/src.mp4", "/work", chunk_duration, hls_time=10, duration=duration)
+        return chunks, [call.args[0] for call in run.call_args_list]
+
+    def _option(self, cmd, name):
+        return cmd[cmd.index(name) + 1] if name in cmd else None
+
+    def test_boundaries_multiple_of_hls_time(self):
+        # 65 с округляется вниз до 60: границы кусков совпадают с границами сегментов
+        chunks, _ = self._split(chunk_duration=65, duration=130)
+        self.assertEqual([(c["start"], c["end"]) for c in chunks],
+                         [(0.5, 60.5), (60.5, 120.5), (120.5, None)])
+        self.assertEqual([c["path"] for c in chunks],
+                         ["/work/chunk_000.mkv", "/work/chunk_001.mkv", "/work/chunk_002.mkv"])
+
+    def test_copy_cut_covers_chunk_with_overlap(self):
+        _, cmds = self._split(chunk_duration=60, duration=130)
+        self.assertEqual([(self._option(cmd, "-ss"), self._option(cmd, "-t")) for cmd in cmds],
+                         [("0", "65"), ("55", "70"), ("115", None)])
+        for index, cmd in enumerate(cmds[:-1]):
+            seek, length = int(self._option(cmd, "-ss")), int(self._option(cmd, "-t"))
+            self.assertLessEqual(seek, max(0, index * 60 - CHUNK_OVERLAP))
+            self.assertGreaterEqual(seek + length, (index + 1) * 60 + CHUNK_OVERLAP)
+
+    def test_short_chunk_duration_and_video(self):
+        chunks, _ = self._split(chunk_duration=4, duration=25)
+        self.assertEqual([c["end"] for c in chunks], [10.5, 20.5, None])
+        chunks, cmds = self._split(chunk_duration=60, duration=30)
+        self.assertEqual([(c["start"], c["end"]) for c in chunks], [(0.5, None)])
+        self.assertIsNone(self._option(cmds[0], "-t"))
+
+    def test_encode_chunk_trims_exact_range(self):
+        profile = {"name": "720p", "width": 1280, "height": 720, "video_bitrate": "2800k", "hls_time": 10}
+        with mock.patch("fitness_app.core.ffmpeg_utils.subprocess.run") as run:
+            encode_chunk_profile("/work/chunk_001.mkv", "/work/720p_001.mkv", profile,
+                                 start=60.5, end=120.5, framerate=25, threads=3)
+            encode_chunk_profile("/work/chunk_002.mkv", "/work/720p_002.mkv", profile, start=120.5)
+        middle, last = [call.args[0] for call in run.call_args_list]
+        self.assertTrue(self._option(middle, "-vf").startswith("trim=start=60.5:end=120.5,setpts=PTS-STARTPTS,"))
+        self.assertTrue(self._option(last, "-vf").startswith("trim=start=120.5,setpts=PTS-STARTPTS,"))
+        self.assertEqual(self._option(middle, "-force_key_frames"), "expr:gte(t,n_forced*10)")
+        self.assertEqual(self._option(middle, "-g"), "250")
+        self.assertEqual(self._option(middle, "-threads:v"), "3")
+        self.assertNotIn("-threads:v", last)
+
+
+class AllocateEncoderThreadsTests(SimpleTestCase):
+    profiles = [
+        {"name": "1080p", "width": 1920, "height": 1080},
+        {"name": "720p", "width": 1280, "height": 720},
+        {"name": "360p", "width": 640, "height": 360},
+    ]
+
+    def test_proportional_to_frame_area(self):
+        # Остаток 5 потоков: 3.21 / 1.43 / 0.36 — лишний поток получает 720p (наибольший остаток)
+        self.assertEqual(allocate_encoder_threads(self.profiles, 8), {"1080p": 4, "720p": 3, "360p": 1})
+
+    def test_budget_fully_used(self):
+        for budget in range(3, 33):
+            allocation = allocate_encoder_threads(self.profiles, budget)
+            self.assertEqual(sum(allocation.values()), budget)
+            self.assertGreaterEqual(allocation["1080p"], allocation["720p"])
+            self.assertGreaterEqual(allocation["720p"], allocation["360p"])
+
+    def test_at_least_one_thread_each(self):
+        self.assertEqual(allocate_encoder_threads(self.profiles, 1), {"1080p": 1, "720p": 1, "360p": 1})
+        self.assertEqual(allocate_encoder_threads([], 8), {})
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.contrib.admin.views.decorators import staff_member_required
 from django.urls import path
 from . import views
@@ -25,6 +26,15 @@ urlpatterns = [
     path('marathon/<slug:slug>/purchase/', views.marathon_purchase, name='marathon_purchase'),
     path('my-marathons/', views.my_marathons, name='my_marathons'),
 
+    # HLS-плейлисты с подписью сегментов при запросе (HLS_DELIVERY_MODE = 'dynamic')
+    path('hls/<str:kind>/<int:obj_id>/master.m3u8', views.hls_master_playlist, name='hls_master_playlist'),
+    path('hls/<str:kind>/<int:obj_id>/<str:profile>.m3u8', views.hls_variant_playlist, name='hls_variant_playlist'),
+
+    # Ссылки с токеном на каталог (LocalVideoStorage, HLS_DELIVERY_MODE = 'token'); в продакшене их отдаёт nginx
+    path('hls/token-auth/', views.secure_link_auth, name='secure_link_auth'),
+    path(settings.SECURE_LINK_URL.lstrip('/') + '<str:token>/<int:expires_at>/<path:path>',
+         views.secure_link_file, name='secure_link_file'),
+
     # Внутренние страницы
     path('videos/', views.video_list, name='videos'),
 
@@ -0,0 +1,193 @@
+# fitness_app/core/view_counters.py
+"""
+Счётчики просмотров видео с буфером в Redis.
+
+Просмотр не пишет в Postgres: в Redis увеличивается счётчик видео (HINCRBY),
+запоминается время последнего просмотра и добавляется точка в почасовой ряд
+для трендов (ZINCRBY). Периодическая задача flush_view_counters переносит
+накопленные приращения в БД одним UPDATE ... SET views = views + CASE ... на
+пачку видео.
+
+Перед переносом буфер атомарно переименовывается в processing-ключ: новые
+просмотры копятся в свежем буфере, а если воркер упал посреди переноса,
+следующий запуск сначала дообработает оставшийся processing-ключ. Счётчики
+не теряются; повтор возможен только при падении между COMMIT и удалением ключа.
+Если Redis недоступен, просмотр записывается сразу атомарным UPDATE.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timezone as dt_timezone
+from typing import List, Tuple
+
+import redis
+import redis.asyncio
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, DateTimeField, F, IntegerField, Value, When
+from django.utils import timezone
+
+from .locks import get_redis, single_flight
+
+logger = logging.getLogger(__name__)
+
+VIEW_COUNTED_MODELS = ('core.Video', 'core.MarathonVideo')
+
+PENDING_KEY = "views:pending:{label}"          # hash id -> приращение
+LAST_VIEWED_KEY = "views:last:{label}"         # hash id -> unix time последнего просмотра
+PROCESSING_SUFFIX = ":processing"
+TRENDING_KEY = "views:trending:{label}:{hour}"  # zset id -> просмотры за час
+FLUSH_LOCK_KEY = "views:flush-lock"
+
+
+def _hour_bucket(timestamp: float) -> int:
+    return int(timestamp // 3600)
+
+
+def _queue_view(pipe, label: str, obj_id: int, now: float) -> None:
+    trending_key = TRENDING_KEY.format(label=label, hour=_hour_bucket(now))
+    pipe.hincrby(PENDING_KEY.format(label=label), obj_id, 1)
+    pipe.hset(LAST_VIEWED_KEY.format(label=label), obj_id, int(now))
+    pipe.zincrby(trending_key, 1, obj_id)
+    pipe.expire(trending_key, (getattr(settings, 'VIEW_TRENDING_HOURS', 48) + 1) * 3600)
+
+
+def _write_view_to_db(obj) -> None:
+    type(obj).objects.filter(pk=obj.pk).update(views=F('views') + 1, last_viewed_at=timezone.now())
+
+
+def record_view(obj) -> None:
+    """Учитывает просмотр Video/MarathonVideo."""
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        _queue_view(pipe, obj._meta.label, obj.pk, time.time())
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Redis недоступен, просмотр {obj._meta.label} {obj.pk} записан в БД: {e}")
+        _write_view_to_db(obj)
+
+
+# Клиент redis.asyncio привязан к циклу событий (как в async_storage)
+_async_clients = {}
+
+
+def _get_async_redis() -> redis.asyncio.Redis:
+    key = (os.getpid(), id(asyncio.get_running_loop()))
+    client = _async_clients.get(key)
+    if client is None:
+        client = redis.asyncio.Redis.from_url(
+            getattr(settings, 'LOCK_REDIS_URL', 'redis://redis:6379/1'),
+            socket_timeout=2,
+            socket_connect_timeout=2,
+        )
+        for stale in [k for k in _async_clients if k != key]:
+            _async_clients.pop(stale, None)
+        _async_clients[key] = client
+    return client
+
+
+async def arecord_view(obj) -> None:
+    """Асинхронный вариант record_view для ASGI-представлений."""
+    try:
+        pipe = _get_async_redis().pipeline(transaction=False)
+        _queue_view(pipe, obj._meta.label, obj.pk, time.time())
+        await pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Redis недоступен, просмотр {obj._meta.label} {obj.pk} записан в БД: {e}")
+        await type(obj).objects.filter(pk=obj.pk).aupdate(
+            views=F('views') + 1, last_viewed_at=timezone.now()
+        )
+
+
+def _take_buffer(client, key: str) -> str:
+    """
+    Переименовывает буфер в processing-ключ и возвращает его имя. Если processing-ключ
+    остался от упавшего переноса, сначала обрабатывается он (новый буфер ждёт).
+    """
+    processing_key = key + PROCESSING_SUFFIX
+    if not client.exists(processing_key):
+        try:
+            client.rename(key, processing_key)
+        except redis.ResponseError:
+            # Буфер пуст (ключа нет) — переносить нечего
+            pass
+    return processing_key
+
+
+def _apply_batch(model, deltas: dict, last_viewed: dict) -> None:
+    views_case = Case(
+        *[When(pk=obj_id, then=Value(delta)) for obj_id, delta in deltas.items()],
+        default=Value(0), output_field=IntegerField(),
+    )
+    last_viewed_case = Case(
+        *[When(pk=obj_id, then=Value(viewed_at)) for obj_id, viewed_at in last_viewed.items()],
+        default=F('last_viewed_at'), output_field=DateTimeField(),
+    )
+    updates = {'views': F('views') + views_case}
+    if last_viewed:
+        updates['last_viewed_at'] = last_viewed_case
+    model.objects.filter(pk__in=set(deltas) | set(last_viewed)).update(**updates)
+
+
+def flush_model_views(model_label: str) -> int:
+    """Переносит накопленные просмотры одной модели в БД. Возвращает число просмотров."""
+    model = apps.get_model(model_label)
+    client = get_redis()
+    pending_key = _take_buffer(client, PENDING_KEY.format(label=model_label))
+    last_key = _take_buffer(client, LAST_VIEWED_KEY.format(label=model_label))
+
+    deltas = {int(k): int(v) for k, v in client.hgetall(pending_key).items()}
+    last_viewed = {
+        int(k): datetime.fromtimestamp(int(v), dt_timezone.utc)
+        for k, v in client.hgetall(last_key).items()
+    }
+    if not deltas and not last_viewed:
+        return 0
+
+    batch_size = getattr(settings, 'VIEW_COUNTER_FLUSH_BATCH', 500)
+    ids = sorted(set(deltas) | set(last_viewed))
+    with transaction.atomic():
+        for start in range(0, len(ids), batch_size):
+            batch_ids = ids[start:start + batch_size]
+            _apply_batch(
+                model,
+                {i: deltas[i] for i in batch_ids if i in deltas},
+                {i: last_viewed[i] for i in batch_ids if i in last_viewed},
+            )
+    client.delete(pending_key, last_key)
+
+    total = sum(deltas.values())
+    logger.info(f"Просмотры {model_label}: {total} для {len(ids)} видео перенесены в БД")
+    return total
+
+
+def flush_view_counters() -> int:
+    """Переносит накопленные просмотры всех моделей в БД (один процесс одновременно)."""
+    total = 0
+    with single_flight(FLUSH_LOCK_KEY, getattr(settings, 'VIEW_COUNTER_FLUSH_INTERVAL', 60) * 5) as acquired:
+        if not acquired:
+            logger.info("Перенос просмотров уже выполняется другим процессом")
+            return 0
+        for model_label in VIEW_COUNTED_MODELS:
+            try:
+                total += flush_model_views(model_label)
+            except redis.RedisError as e:
+                # Буфер остался в Redis и будет перенесён следующим запуском
+                logger.warning(f"Не удалось перенести просмотры {model_label}: {e}")
+    return total
+
+
+def get_trending(model_label: str, hours: int = 24, limit: int = 10) -> List[Tuple[int, int]]:
+    """[(id, просмотры)] самых просматриваемых за последние hours часов (текущий час включительно)."""
+    client = get_redis()
+    current = _hour_bucket(time.time())
+    keys = [TRENDING_KEY.format(label=model_label, hour=hour) for hour in range(current - hours + 1, current + 1)]
+    result_key = f"views:trending:{model_label}:top:{current}:{hours}"
+    # Сумма почасовых рядов пересчитывается не чаще раза в минуту
+    if not client.exists(result_key):
+        client.zunionstore(result_key, keys)
+        client.expire(result_key, 60)
+    return [(int(obj_id), int(score)) for obj_id, score in client.zrevrange(result_key, 0, limit - 1, withscores=True)]
@@ -1,3 +1,6 @@
+import os
+import re
+import time
 import uuid
 import logging
 import json
@@ -6,23 +9,33 @@ from django.utils import timezone
 
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.contrib.auth.views import redirect_to_login
 from django.contrib import messages
 from django.urls import reverse
 
 from django.views.generic import DetailView
 from django.views.decorators.http import require_POST
 
-from django.shortcuts import render, get_object_or_404, redirect
-from django.http import HttpResponseForbidden, JsonResponse, HttpResponseBadRequest, HttpResponse, Http404
+from django.shortcuts import render, get_object_or_404, aget_object_or_404, redirect
+from django.template.response import TemplateResponse
+from django.http import HttpResponseForbidden, JsonResponse, HttpResponseBadRequest, HttpResponse, Http404, FileResponse
 
 from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
 from django.core.mail import send_mail
+from django.utils.cache import get_conditional_response
+from asgiref.sync import sync_to_async
 
-from .tasks import refresh_video_links
 from .decorators import full_access_required
 from .forms import VideoCommentForm, ServiceRequestForm
-from .storage import get_video_storage
+from .storage import LocalVideoStorage, get_video_storage, guess_content_type
+from .async_storage import get_async_video_storage
+from .entitlements import get_entitlements
+from .catalog_cache import get_cached
+from .signing import signing_window, verify_prefix_token
+from . import hls_delivery
+from .hls_utils import (is_presigned_delivery, hls_links_expired, hls_links_need_refresh,
+                        schedule_hls_links_refresh, hls_remote_base, refresh_video_links_generic)
 from .models import (Category,
                      Marathon,
                      MarathonAccess,
@@ -52,7 +65,9 @@ Configuration.secret_key = settings.YOOKASSA_SECRET_KEY
 
 def home(request):
     # categories = Category.objects.all()  # оставляем для других мест
-    services = Service.objects.filter(is_active=True).order_by('order')
+    services = get_cached('catalog', 'services', lambda: list(
+        Service.objects.filter(is_active=True).order_by('order')
+    ))
     return render(request, 'core/home.html', {
         'services': services,
         # 'categories': categories, добавлен через контекстный процессор
@@ -77,7 +92,12 @@ def video_list(request):
 
 
 def category_detail(request, slug):
-    category = get_object_or_404(Category, slug=slug)
+    categories = get_cached('catalog', 'categories_by_slug', lambda: {
+        c.slug: c for c in Category.objects.all()
+    })
+    category = categories.get(slug)
+    if category is None:
+        raise Http404("Категория не найдена")
     videos = category.videos.all()
 
     # Для неавторизованных показываем только бесплатные
@@ -89,14 +109,57 @@ def category_detail(request, slug):
         if not user_profile.subscription_active:
             videos = videos.filter(is_free=True)
 
+    # Сетка показывает все видео категории (платные — с отметкой PREMIUM)
+    category_videos = get_cached('catalog', f'category_videos:{category.id}', lambda: list(category.videos.all()))
+
     return render(request, 'core/category_detail.html', {
         'category': category,
         'videos': videos,
+        'category_videos': category_videos,
     })
 
 
+async def _aget_hls_stream_url(obj):
+    """
+    Ссылка на мастер-плейлист для async-представлений. Подпись считается в цикле событий;
+    в поток уходит только синхронное обновление уже истёкших ссылок (режим 'presigned').
+    """
+    if not obj.is_processed:
+        return None
+    if not is_presigned_delivery():
+        return hls_delivery.get_hls_stream_url(obj)
+
+    # Устаревающие ссылки обновляются в фоне; синхронно — только уже истёкшие
+    remote_base = hls_remote_base(obj)
+    if hls_links_expired(obj):
+        logger.info(f"Ссылки для {obj.__class__.__name__} {obj.id} истекли, запускаем перегенерацию.")
+        success = await sync_to_async(refresh_video_links_generic)(
+            obj, remote_base, settings.AWS_QUERYSTRING_EXPIRE
+        )
+        if success:
+            await obj.arefresh_from_db()
+        else:
+            logger.error(f"Не удалось обновить ссылки для {obj.__class__.__name__} {obj.id}, продолжаем со старыми.")
+    elif hls_links_need_refresh(obj):
+        await sync_to_async(schedule_hls_links_refresh)(obj)
+
+    try:
+        url = await get_async_video_storage().get_signed_url(
+            remote_base + "master.m3u8", expires=settings.AWS_QUERYSTRING_EXPIRE
+        )
+        logger.debug(f"Сгенерирована ссылка на HLS для {obj.__class__.__name__} {obj.id}")
+        return url
+    except Exception as e:
+        logger.error(f"Ошибка генерации подписанной ссылки для {obj.__class__.__name__} {obj.id}: {e}")
+        return None
+
+
 class VideoDetailView(LoginRequiredMixin, DetailView):
-    """Детальная страница обычного видео (для категорий)"""
+    """
+    Детальная страница обычного видео (для категорий).
+    Асинхронное представление: запросы к БД и хранилищу не занимают поток воркера,
+    шаблон рендерится обработчиком Django после возврата TemplateResponse.
+    """
     model = Video
     template_name = 'core/video_detail.html'
     context_object_name = 'video'
@@ -104,75 +167,37 @@ class VideoDetailView(LoginRequiredMixin, DetailView):
     login_url = '/accounts/login/'
     redirect_field_name = 'next'
 
-    def dispatch(self, request, *args, **kwargs):
-        if not request.user.is_authenticated:
-            return self.handle_no_permission()
+    async def dispatch(self, request, *args, **kwargs):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path(), self.get_login_url(), self.get_redirect_field_name())
 
-        try:
-            video = Video.objects.get(id=kwargs.get('video_id'))
-        except Video.DoesNotExist:
+        video = await Video.objects.filter(id=kwargs.get('video_id')).afirst()
+        if video is None:
             raise Http404("Video does not exist")
 
-        if video.is_free:
-            return super().dispatch(request, *args, **kwargs)
-
-        user_profile, _ = UserProfile.objects.get_or_create(user=request.user)
-        if not user_profile.subscription_active:
+        self.user_profile, _ = await UserProfile.objects.aget_or_create(user=user)
+        if not video.is_free and not self.user_profile.subscription_active:
             return HttpResponseForbidden(
                 "Для просмотра этого видео требуется активная подписка."
             )
 
-        return super().dispatch(request, *args, **kwargs)
-
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        video = self.object
+        self.object = video
+        return await super(LoginRequiredMixin, self).dispatch(request, *args, **kwargs)
 
-        # --- Проверка и обновление ссылок, если они устарели ---
-        if video.is_processed:
-            need_refresh = False
-            current_ttl = settings.AWS_QUERYSTRING_EXPIRE
+    async def get(self, request, *args, **kwargs):
+        context = await self.aget_context_data(object=self.object)
+        return self.render_to_response(context)
 
-            if video.hls_last_ttl != current_ttl:
-                need_refresh = True
-                logger.info(f"TTL изменился для видео {video.id}: было {video.hls_last_ttl}, стало {current_ttl}")
-            elif not video.hls_links_refreshed_at:
-                need_refresh = True
-            else:
-                # Вычисляем, сколько секунд прошло с момента последнего обновления
-                seconds_since_refresh = (timezone.now() - video.hls_links_refreshed_at).total_seconds()
-                # Обновляем, если прошло больше 80% от TTL (или можно 100% – по выбору)
-                if seconds_since_refresh >= current_ttl * 0.8:
-                    need_refresh = True
-
-            if need_refresh:
-                logger.info(f"Ссылки для видео {video.id} устарели, запускаем перегенерацию.")
-                success = refresh_video_links(video.id)
-                if success:
-                    video.refresh_from_db()
-                else:
-                    logger.error(f"Не удалось обновить ссылки для видео {video.id}, продолжаем со старыми.")
-
-        # --- Динамическая генерация подписанной ссылки на мастер-плейлист ---
-        if video.is_processed:
-            try:
-                storage = get_video_storage()
-                master_remote_path = f"{video.id}/hls/master.m3u8"
-                context['hls_stream_url'] = storage.get_signed_url(
-                    master_remote_path,
-                    expires=settings.AWS_QUERYSTRING_EXPIRE
-                )
-                logger.debug(f"Сгенерирована ссылка на HLS для видео {video.id}")
-            except Exception as e:
-                logger.error(f"Ошибка генерации подписанной ссылки для видео {video.id}: {e}")
-                context['hls_stream_url'] = None
-        else:
-            context['hls_stream_url'] = None
+    async def aget_context_data(self, **kwargs):
+        context = self.get_context_data(**kwargs)
+        video = self.object
+        user = await self.request.auser()
 
-        # --- Остальные данные контекста (без изменений) ---
-        user_profile, _ = UserProfile.objects.get_or_create(user=self.request.user)
-        context['user_profile'] = user_profile
+        context['hls_stream_url'] = await _aget_hls_stream_url(video)
+        context['user_profile'] = self.user_profile
 
+        # Querysets ниже ленивые: выполняются при рендере шаблона (в потоке обработчика)
         context['similar_videos'] = Video.objects.filter(
             categories__in=video.categories.all()
         ).exclude(id=video.id).distinct()[:6]
@@ -185,14 +210,10 @@ class VideoDetailView(LoginRequiredMixin, DetailView):
                 is_approved=True,
                 parent__isnull=True
             ).select_related('user').order_by('-created_at')[:20]
-
-            if self.request.user.is_authenticated:
-                context['user_liked'] = video.comments.filter(
-                    user=self.request.user,
-                    is_like=True
-                ).exists()
-            else:
-                context['user_liked'] = False
+            context['user_liked'] = await video.comments.filter(
+                user=user,
+                is_like=True
+            ).aexists()
         else:
             context['comment_form'] = None
             context['comments'] = []
@@ -301,34 +322,160 @@ def toggle_video_like(request, video_id):
     })
 
 
-def marathon_video_detail(request, marathon_slug, video_id):
-    marathon = get_object_or_404(Marathon, slug=marathon_slug, is_active=True)
-    video = get_object_or_404(MarathonVideo, id=video_id, marathon=marathon)
+# ----- Динамические HLS-плейлисты -----
+def _can_watch_hls(user, obj) -> bool:
+    """Те же правила доступа, что и на страницах просмотра видео."""
+    if not user.is_authenticated:
+        return False
+    if isinstance(obj, MarathonVideo):
+        marathon_access = MarathonAccess.objects.filter(
+            user=user, marathon=obj.marathon, is_active=True
+        ).first()
+        return bool(marathon_access and marathon_access.is_valid())
+    if obj.is_free:
+        return True
+    user_profile, _ = UserProfile.objects.get_or_create(user=user)
+    return user_profile.subscription_active
+
+
+def _get_hls_object(request, kind, obj_id):
+    source = hls_delivery.get_hls_source(kind)
+    if source is None:
+        raise Http404("Unknown video kind")
+    model, prefix = source
+    obj = get_object_or_404(model, id=obj_id, is_processed=True)
+    return obj, f"{prefix}{obj.id}/hls/"
+
+
+def _playlist_response(request, content, etag=None) -> HttpResponse:
+    """
+    Ответ с плейлистом и сильным ETag. При выровненных подписях (S3_SIGNING_BUCKET) плейлист
+    не меняется до конца интервала и кэшируется клиентом на это время; content=None —
+    клиент уже прислал актуальный ETag и получит 304 без рендера.
+    """
+    etag = etag or hls_delivery.playlist_etag(content)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(content, content_type='application/vnd.apple.mpegurl')
+    response['ETag'] = etag
+    bucket = hls_delivery.signing_bucket()
+    if bucket:
+        _, remaining = signing_window(bucket)
+        response['Cache-Control'] = f'private, max-age={remaining}'
+    else:
+        # Подписи в плейлисте персональны и ограничены по времени
+        response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@login_required
+def hls_master_playlist(request, kind, obj_id):
+    obj, remote_base = _get_hls_object(request, kind, obj_id)
+    if not _can_watch_hls(request.user, obj):
+        return HttpResponseForbidden("Нет доступа к видео")
+
+    renditions = hls_delivery.get_renditions(obj)
+    profiles = hls_delivery.get_stream_profiles(obj, remote_base, get_video_storage(), renditions)
+    if not profiles:
+        raise Http404("HLS profiles not found")
+    return _playlist_response(request, hls_delivery.render_master_playlist(profiles, renditions))
+
+
+@login_required
+def hls_variant_playlist(request, kind, obj_id, profile):
+    obj, remote_base = _get_hls_object(request, kind, obj_id)
+    if not _can_watch_hls(request.user, obj):
+        return HttpResponseForbidden("Нет доступа к видео")
+
+    storage = get_video_storage()
+    renditions = hls_delivery.get_renditions(obj)
+    if profile not in {p['name'] for p in hls_delivery.get_stream_profiles(obj, remote_base, storage, renditions)}:
+        raise Http404("HLS profile not found")
+
+    expires = hls_delivery.playlist_url_expires(obj)
+    rendition = renditions.get(profile)
+    etag = hls_delivery.variant_playlist_etag(remote_base, profile, storage, expires, rendition)
+    if etag is not None and get_conditional_response(request, etag=etag) is not None:
+        # Плейлист у клиента совпадает с текущим — сегменты не подписываем
+        return _playlist_response(request, None, etag)
+    content = hls_delivery.render_variant_playlist(remote_base, profile, storage, expires, rendition, etag)
+    return _playlist_response(request, content, etag)
+
+
+SECURE_LINK_RE = re.compile(r'^(?P<token>[A-Za-z0-9_-]+)/(?P<expires_at>\d+)/(?P<path>[^?]+)')
+
+
+def secure_link_auth(request):
+    """
+    Проверка токена для nginx auth_request: исходный URI приходит в X-Original-URI.
+    Ответ кэшируется nginx на каталог; X-Accel-Expires ограничивает кэш успешной
+    проверки оставшимся сроком токена, чтобы истёкшая ссылка не открывалась из кэша.
+    """
+    uri = request.headers.get('X-Original-URI', '')
+    if not uri.startswith(settings.SECURE_LINK_URL):
+        return HttpResponseForbidden()
+    match = SECURE_LINK_RE.match(uri[len(settings.SECURE_LINK_URL):])
+    if match and verify_prefix_token(
+        match['token'], match['path'], int(match['expires_at']), settings.SECURE_LINK_SECRET
+    ):
+        response = HttpResponse(status=204)
+        remaining = int(match['expires_at']) - int(time.time())
+        response['X-Accel-Expires'] = max(0, min(remaining, getattr(settings, 'SECURE_LINK_AUTH_CACHE_TTL', 60)))
+        return response
+    return HttpResponseForbidden()
+
+
+def secure_link_file(request, token, expires_at, path):
+    """
+    Отдача файла по ссылке с токеном, если запрос не перехватил nginx (разработка, S3 без прокси):
+    локальный файл — напрямую, объект в бакете — редиректом на подписанный URL.
+    """
+    if not verify_prefix_token(token, path, expires_at, settings.SECURE_LINK_SECRET):
+        return HttpResponseForbidden("Ссылка недействительна или истекла")
+
+    storage = get_video_storage()
+    if isinstance(storage, LocalVideoStorage):
+        local_path = os.path.join(storage.base_path, path)
+        if not os.path.isfile(local_path):
+            raise Http404("File not found")
+        response = FileResponse(open(local_path, 'rb'), content_type=guess_content_type(path))
+    else:
+        response = redirect(storage.get_signed_url(path, expires=max(1, expires_at - int(time.time()))))
+    # Файлы HLS неизменны: сегменты и плейлисты перезаписываются только при переобработке
+    response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
+
+
+async def marathon_video_detail(request, marathon_slug, video_id):
+    marathon = await aget_object_or_404(Marathon, slug=marathon_slug, is_active=True)
+    video = await aget_object_or_404(MarathonVideo, id=video_id, marathon=marathon)
 
     # Проверка доступа
     has_access = False
-    if request.user.is_authenticated:
-        marathon_access = MarathonAccess.objects.filter(
-            user=request.user,
+    user = await request.auser()
+    if user.is_authenticated:
+        marathon_access = await MarathonAccess.objects.filter(
+            user=user,
             marathon=marathon,
             is_active=True
-        ).first()
+        ).afirst()
         if marathon_access and marathon_access.is_valid():
             has_access = True
 
     if not has_access:
         return HttpResponseForbidden("Для просмотра этого видео требуется покупка марафона.")
 
-    video.increment_views()
+    await video.aincrement_views()
 
     # Генерация HLS-ссылки
-    hls_stream_url = video.get_hls_stream_url() if video.is_processed else None
+    hls_stream_url = await _aget_hls_stream_url(video)
 
     similar_videos = MarathonVideo.objects.filter(marathon=marathon).exclude(id=video.id).order_by('order')[:6]
-    marathon_videos_count = marathon.marathon_videos.count()
-    video_order = video.order if video.order else MarathonVideo.objects.filter(marathon=marathon, id__lt=video.id).count() + 1
+    marathon_videos_count = await marathon.marathon_videos.acount()
+    video_order = video.order if video.order else await MarathonVideo.objects.filter(marathon=marathon, id__lt=video.id).acount() + 1
 
-    return render(request, 'core/marathon_video_detail.html', {
+    # TemplateResponse рендерится обработчиком Django вне цикла событий
+    return TemplateResponse(request, 'core/marathon_video_detail.html', {
         'marathon': marathon,
         'video': video,
         'similar_videos': similar_videos,
@@ -345,27 +492,10 @@ def marathon_list(request):
     """
     marathons = Marathon.objects.filter(is_active=True).order_by('order')
 
-    # Получаем доступы текущего пользователя
-    user_marathon_access = {}
-    user_has_active_subscription = False
-
-    if request.user.is_authenticated:
-        # Доступы к марафонам
-        accesses = MarathonAccess.objects.filter(
-            user=request.user,
-            is_active=True
-        ).select_related('marathon')
-
-        for access in accesses:
-            if access.is_valid():
-                user_marathon_access[access.marathon_id] = True
-
-        # Активная подписка
-        try:
-            user_profile = UserProfile.objects.get(user=request.user)
-            user_has_active_subscription = user_profile.subscription_active
-        except UserProfile.DoesNotExist:
-            pass
+    # Доступы и подписка текущего пользователя (из кэша прав)
+    entitlements = get_entitlements(request)
+    user_marathon_access = {marathon_id: True for marathon_id in entitlements.valid_marathon_ids}
+    user_has_active_subscription = entitlements.subscription_active
 
     return render(request, 'core/marathon_list.html', {
         'marathons': marathons,
@@ -686,17 +816,14 @@ def my_marathons(request):
 
     # Марафоны по подписке
     subscribed_marathons = []
-    try:
-        user_profile = UserProfile.objects.get(user=request.user)
-        if user_profile.subscription_active:
-            subscribed_marathons = Marathon.objects.filter(
-                is_active=True,
-                included_in_subscription=True
-            ).exclude(
-                id__in=[ma.marathon_id for ma in marathon_accesses]
-            )
-    except UserProfile.DoesNotExist:
-        pass
+    entitlements = get_entitlements(request)
+    if entitlements.subscription_active:
+        subscribed_marathons = Marathon.objects.filter(
+            is_active=True,
+            included_in_subscription=True
+        ).exclude(
+            id__in=entitlements.marathon_ids
+        )
 
     return render(request, 'core/my_marathons.html', {
         'marathon_accesses': marathon_accesses,
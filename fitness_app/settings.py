@@ -6,6 +6,7 @@ from pathlib import Path
 
 from decouple import config
 from django.contrib.messages import constants as messages
+from django.utils.crypto import salted_hmac
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -118,6 +119,9 @@ TEMPLATES = [
         },
     },
 ]
+# Права пользователя для контекст-процессоров (entitlements.py): кэш на пользователя,
+# сбрасывается сигналами; TTL ограничивает устаревание при изменениях мимо сигналов (queryset.update)
+ENTITLEMENTS_CACHE_TTL = config('ENTITLEMENTS_CACHE_TTL', default=3600, cast=int)  # секунд
 
 ACCOUNT_FORMS = {
     'signup': 'fitness_app.core.forms.CustomSignupForm',
@@ -138,6 +142,29 @@ DATABASES = {
     }
 }
 
+# Общий кэш всех процессов web и Celery (Redis, отдельная база): без него каждый
+# процесс видит свой LocMem-кэш. При недоступности Redis ошибки игнорируются
+# и данные берутся из БД
+CACHES = {
+    'default': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': config('CACHE_REDIS_URL', default='redis://redis:6379/2'),
+        'KEY_PREFIX': 'fitness',
+        'OPTIONS': {
+            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            'SOCKET_CONNECT_TIMEOUT': 2,
+            'SOCKET_TIMEOUT': 2,
+            'IGNORE_EXCEPTIONS': True,
+        },
+    }
+}
+DJANGO_REDIS_LOG_IGNORED_EXCEPTIONS = True
+# Кэш витрины (catalog_cache.py): баннеры, SEO-блоки, категории, услуги, видео категорий
+CATALOG_CACHE_TTL = config('CATALOG_CACHE_TTL', default=3600, cast=int)  # секунд
+CATALOG_LOCAL_CACHE_SIZE = config('CATALOG_LOCAL_CACHE_SIZE', default=256, cast=int)  # записей в памяти процесса
+# Как часто процесс сверяет версию кэша витрины с Redis
+CATALOG_VERSION_CHECK_INTERVAL = config('CATALOG_VERSION_CHECK_INTERVAL', default=2.0, cast=float)  # секунд
+
 # Валидация паролей
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -300,6 +327,81 @@ CELERY_RESULT_BACKEND = 'django-db'
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+# Redis для распределённых блокировок (отдельная база того же Redis)
+LOCK_REDIS_URL = config('LOCK_REDIS_URL', default='redis://redis:6379/1')
+
+# ---------- HLS кодирование ----------
+# Режим кодирования лестницы профилей:
+# 'sequential' — по одному процессу ffmpeg на профиль (исходник декодируется для каждого профиля),
+# 'single_pass' — один процесс ffmpeg на все профили (split/scale + -var_stream_map),
+# 'parallel' — профили кодируются одновременно в ограниченном пуле процессов ffmpeg
+HLS_ENCODE_MODE = config('HLS_ENCODE_MODE', default='sequential')
+# Бюджет потоков x264 на один узел (суммарно на все одновременные процессы ffmpeg); 0 — число ядер
+HLS_ENCODER_THREAD_BUDGET = config('HLS_ENCODER_THREAD_BUDGET', default=0, cast=int)
+# Максимум одновременных процессов ffmpeg в режиме 'parallel'; 0 — по числу профилей
+HLS_PARALLEL_MAX_JOBS = config('HLS_PARALLEL_MAX_JOBS', default=0, cast=int)
+# Копировать видеопоток без перекодирования, если исходник в H.264 совпадает с профилем
+# по разрешению и не превышает его битрейт (сегменты режутся по ключевым кадрам исходника)
+HLS_PASSTHROUGH = config('HLS_PASSTHROUGH', default=False, cast=bool)
+# Распределённое кодирование длинных видео: исходник режется на куски,
+# которые кодируются отдельными задачами Celery на всех воркерах
+HLS_CHUNKED_ENCODING = config('HLS_CHUNKED_ENCODING', default=False, cast=bool)
+HLS_CHUNKED_MIN_DURATION = config('HLS_CHUNKED_MIN_DURATION', default=1200, cast=int)  # секунд
+HLS_CHUNK_DURATION = config('HLS_CHUNK_DURATION', default=300, cast=int)  # длительность куска, секунд (округляется до кратной hls_time)
+# Доставка плейлистов: 'presigned' — подписанные плейлисты переписываются в хранилище при обновлении ссылок,
+# 'dynamic' — Django отдаёт плейлисты сам и подписывает сегменты при каждом запросе,
+# 'token' — плейлисты в хранилище не меняются, зритель получает один токен на каталог {id}/hls/,
+# который проверяет nginx (auth_request), а файлы отдаются с диска или проксируются из бакета.
+# По умолчанию 'presigned' (как и запасное значение в hls_utils); включение 'dynamic' — см. S3.md
+HLS_DELIVERY_MODE = config('HLS_DELIVERY_MODE', default='presigned')
+# Сколько хранить в кэше разобранный список сегментов вариантного плейлиста
+HLS_SEGMENT_CACHE_TTL = config('HLS_SEGMENT_CACHE_TTL', default=86400, cast=int)  # секунд
+# Фоновое обновление подписанных ссылок (режим 'presigned'): каждые HLS_REFRESH_INTERVAL секунд
+# обновляются ссылки обработанных видео, у которых прошло HLS_REFRESH_AHEAD * TTL, — до истечения
+# и до синхронного порога в представлениях. Видео, просмотренные за HLS_REFRESH_ACTIVE_WINDOW,
+# обновляются первыми, остальные — по возрасту ссылок
+# (расписание выполняет celery -A fitness_app beat)
+HLS_REFRESH_INTERVAL = config('HLS_REFRESH_INTERVAL', default=15, cast=int)  # секунд
+HLS_REFRESH_AHEAD = config('HLS_REFRESH_AHEAD', default=0.5, cast=float)
+HLS_REFRESH_BATCH_SIZE = config('HLS_REFRESH_BATCH_SIZE', default=100, cast=int)
+HLS_REFRESH_ACTIVE_WINDOW = config('HLS_REFRESH_ACTIVE_WINDOW', default=86400, cast=int)  # секунд
+# Одновременно ссылки одного видео обновляет только один процесс (блокировка в Redis).
+# Остальные ждут её результата не дольше HLS_REFRESH_LOCK_WAIT и отдают ещё действующие ссылки
+HLS_REFRESH_LOCK_TTL = config('HLS_REFRESH_LOCK_TTL', default=120, cast=int)  # секунд
+HLS_REFRESH_LOCK_WAIT = config('HLS_REFRESH_LOCK_WAIT', default=5.0, cast=float)  # секунд
+# Просмотры копятся в Redis (LOCK_REDIS_URL) и переносятся в БД раз в VIEW_COUNTER_FLUSH_INTERVAL
+# пачками по VIEW_COUNTER_FLUSH_BATCH видео; почасовые ряды для трендов хранятся VIEW_TRENDING_HOURS
+VIEW_COUNTER_FLUSH_INTERVAL = config('VIEW_COUNTER_FLUSH_INTERVAL', default=60, cast=int)  # секунд
+VIEW_COUNTER_FLUSH_BATCH = config('VIEW_COUNTER_FLUSH_BATCH', default=500, cast=int)
+VIEW_TRENDING_HOURS = config('VIEW_TRENDING_HOURS', default=48, cast=int)
+CELERY_BEAT_SCHEDULE = {
+    'refresh-expiring-hls-links': {
+        'task': 'fitness_app.core.tasks.refresh_expiring_hls_links',
+        'schedule': HLS_REFRESH_INTERVAL,
+    },
+    'flush-view-counters': {
+        'task': 'fitness_app.core.tasks.flush_view_counters',
+        'schedule': VIEW_COUNTER_FLUSH_INTERVAL,
+    },
+}
+# Параллельная загрузка HLS в хранилище: число потоков и повторы с экспоненциальной задержкой
+HLS_UPLOAD_WORKERS = config('HLS_UPLOAD_WORKERS', default=8, cast=int)
+HLS_UPLOAD_RETRIES = config('HLS_UPLOAD_RETRIES', default=3, cast=int)
+HLS_UPLOAD_RETRY_BACKOFF = config('HLS_UPLOAD_RETRY_BACKOFF', default=1.0, cast=float)  # секунд
+# Размер пула соединений общего S3-клиента (не меньше числа потоков загрузки)
+S3_MAX_POOL_CONNECTIONS = config('S3_MAX_POOL_CONNECTIONS', default=max(10, HLS_UPLOAD_WORKERS), cast=int)
+# Общий S3-клиент процесса: keep-alive соединений, число повторов запроса (режим botocore 'standard') и таймауты
+S3_TCP_KEEPALIVE = config('S3_TCP_KEEPALIVE', default=True, cast=bool)
+S3_MAX_RETRIES = config('S3_MAX_RETRIES', default=5, cast=int)
+S3_CONNECT_TIMEOUT = config('S3_CONNECT_TIMEOUT', default=5, cast=float)  # секунд
+S3_READ_TIMEOUT = config('S3_READ_TIMEOUT', default=60, cast=float)  # секунд
+# Управляемая передача больших файлов: скачивание ranged GET-ами и multipart-загрузка
+# частями по S3_TRANSFER_CHUNK_SIZE (не меньше 5 МБ) в S3_TRANSFER_MAX_CONCURRENCY потоков
+S3_MULTIPART_THRESHOLD = config('S3_MULTIPART_THRESHOLD', default=16 * 1024 * 1024, cast=int)  # байт
+S3_TRANSFER_CHUNK_SIZE = config('S3_TRANSFER_CHUNK_SIZE', default=8 * 1024 * 1024, cast=int)  # байт
+S3_TRANSFER_MAX_CONCURRENCY = config('S3_TRANSFER_MAX_CONCURRENCY', default=8, cast=int)
+# Удаление каталогов в хранилище: пачки DeleteObjects по 1000 ключей в S3_DELETE_WORKERS потоков
+S3_DELETE_WORKERS = config('S3_DELETE_WORKERS', default=4, cast=int)
 
 # ---------- S3 Конфигурация ----------
 # Тип S3-провайдера: 'generic' (по умолчанию) или 'cloudru'
@@ -308,11 +410,26 @@ S3_PROVIDER = config('S3_PROVIDER', default='generic')
 USE_S3 = config('USE_S3', default=False, cast=bool)
 AWS_QUERYSTRING_EXPIRE = 60 # для тестов
 # AWS_QUERYSTRING_EXPIRE = 604800   # 7 дней
+# Время подписи ссылок выравнивается по интервалам S3_SIGNING_BUCKET секунд (срок действия
+# продлевается на интервал): в пределах интервала URL и плейлисты побайтно совпадают
+# и кэшируются клиентами и прокси, а ссылки живут до expires + S3_SIGNING_BUCKET.
+# 0 (по умолчанию) — подписывать текущим временем, как раньше
+S3_SIGNING_BUCKET = config('S3_SIGNING_BUCKET', default=0, cast=int)  # секунд
+# Ссылки с токеном на каталог (LocalVideoStorage и HLS_DELIVERY_MODE = 'token'):
+# {SECURE_LINK_URL}{токен}/{expires_at}/{путь}, токен — HMAC-SHA256 с ключом SECURE_LINK_SECRET.
+# Если ключ не задан, он выводится из SECRET_KEY (сам SECRET_KEY в токенах не используется)
+SECURE_LINK_URL = '/secure-hls/'
+SECURE_LINK_SECRET = config('SECURE_LINK_SECRET', default='') or salted_hmac(
+    'fitness_app.secure_link', 'SECURE_LINK_SECRET', secret=SECRET_KEY, algorithm='sha256'
+).hexdigest()
+# Сколько nginx кэширует успешную проверку токена (не дольше оставшегося срока токена)
+SECURE_LINK_AUTH_CACHE_TTL = config('SECURE_LINK_AUTH_CACHE_TTL', default=60, cast=int)  # секунд
 
 if USE_S3:
-    tenant_id = config('AWS_TENANT_ID')
+    tenant_id = config('AWS_TENANT_ID', default='')
     access_key_id = config('AWS_ACCESS_KEY_ID')
-    full_access_key = f"{tenant_id}:{access_key_id}"
+    # Cloud.ru ожидает ключ вида "tenant:key"; для MinIO и других провайдеров tenant не задаётся
+    full_access_key = f"{tenant_id}:{access_key_id}" if tenant_id else access_key_id
 
     # Общие параметры для любого S3-хранилища
     COMMON_S3_OPTIONS = {
@@ -365,4 +482,12 @@ else:
             "BACKEND": "django.core.files.storage.FileSystemStorage",
             "OPTIONS": {"location": BASE_DIR / "media/videos", "base_url": "/media/videos/"},
         },
-    }
\ No newline at end of file
+    }
+
+# ---------- Прямая загрузка исходников из админки в бакет ----------
+# Браузер загружает файл частями по подписанным URL (multipart), Django только создаёт
+# и завершает загрузку; доступно, если хранилище видео — S3
+DIRECT_UPLOAD_ENABLED = config('DIRECT_UPLOAD_ENABLED', default=USE_S3, cast=bool)
+DIRECT_UPLOAD_PREFIX = 'uploads/'
+DIRECT_UPLOAD_PART_SIZE = config('DIRECT_UPLOAD_PART_SIZE', default=16 * 1024 * 1024, cast=int)  # байт
+DIRECT_UPLOAD_URL_EXPIRE = config('DIRECT_UPLOAD_URL_EXPIRE', default=3600, cast=int)  # секунд
@@ -17,6 +17,23 @@ urlpatterns = [
          staff_member_required(admin_views.set_active_version),
          name='set_active_version'),
 
+    # Прямая загрузка исходников видео в бакет
+    path('admin/direct-upload/create/',
+         staff_member_required(admin_views.direct_upload_create),
+         name='direct_upload_create'),
+    path('admin/direct-upload/sign-parts/',
+         staff_member_required(admin_views.direct_upload_sign_parts),
+         name='direct_upload_sign_parts'),
+    path('admin/direct-upload/list-parts/',
+         staff_member_required(admin_views.direct_upload_list_parts),
+         name='direct_upload_list_parts'),
+    path('admin/direct-upload/complete/',
+         staff_member_required(admin_views.direct_upload_complete),
+         name='direct_upload_complete'),
+    path('admin/direct-upload/abort/',
+         staff_member_required(admin_views.direct_upload_abort),
+         name='direct_upload_abort'),
+
     path('admin/', admin.site.urls),
     path('accounts/', include('allauth.urls')),
     path('', include('fitness_app.core.urls')),
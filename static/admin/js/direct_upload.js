@@ -0,0 +1,204 @@
+// Прямая загрузка исходника видео в бакет (multipart по подписанным URL).
+// Django только создаёт, подписывает и завершает загрузку — сам файл идёт из браузера в S3.
+// Незавершённая загрузка продолжается с последней загруженной части, если выбрать тот же файл.
+
+document.addEventListener('DOMContentLoaded', function() {
+    const keyInput = document.querySelector('input[name="direct_upload_key"][data-direct-upload]');
+    if (!keyInput) return;
+
+    const form = keyInput.form;
+    const fileInput = form.querySelector('input[type="file"][name="file"]');
+    if (!fileInput) return;
+
+    const CONCURRENCY = 4;
+    const SIGN_BATCH = 20;
+    const PART_RETRIES = 3;
+    const urls = {
+        create: keyInput.dataset.createUrl,
+        sign: keyInput.dataset.signUrl,
+        list: keyInput.dataset.listUrl,
+        complete: keyInput.dataset.completeUrl,
+        abort: keyInput.dataset.abortUrl,
+    };
+
+    let uploading = false;
+    let cancelled = false;
+    let current = null;
+
+    const status = document.createElement('div');
+    status.className = 'help';
+    status.style.marginTop = '6px';
+    fileInput.insertAdjacentElement('afterend', status);
+
+    const cancelLink = document.createElement('a');
+    cancelLink.href = '#';
+    cancelLink.textContent = 'Отменить загрузку';
+    cancelLink.style.marginLeft = '10px';
+    cancelLink.style.display = 'none';
+    status.insertAdjacentElement('afterend', cancelLink);
+
+    function getCookie(name) {
+        const match = document.cookie.match(new RegExp('(?:^|; )' + name + '=([^;]*)'));
+        return match ? decodeURIComponent(match[1]) : '';
+    }
+
+    async function api(url, payload) {
+        const response = await fetch(url, {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json', 'X-CSRFToken': getCookie('csrftoken')},
+            credentials: 'same-origin',
+            body: JSON.stringify(payload),
+        });
+        const data = await response.json().catch(() => ({}));
+        if (!response.ok) {
+            throw new Error(data.error || `HTTP ${response.status}`);
+        }
+        return data;
+    }
+
+    function setStatus(text, color) {
+        status.textContent = text;
+        status.style.color = color || '';
+    }
+
+    function resumeKey(file) {
+        return `directUpload:${keyInput.dataset.directUpload}:${file.name}:${file.size}:${file.lastModified}`;
+    }
+
+    function formatMb(bytes) {
+        return (bytes / (1024 * 1024)).toFixed(1);
+    }
+
+    async function startOrResume(file) {
+        const storageKey = resumeKey(file);
+        const saved = JSON.parse(localStorage.getItem(storageKey) || 'null');
+        if (saved) {
+            try {
+                const listed = await api(urls.list, {key: saved.key, upload_id: saved.upload_id});
+                const done = new Set(listed.parts.map(p => p.PartNumber));
+                setStatus(`Продолжаем загрузку: ${done.size} частей уже в хранилище`);
+                return Object.assign(saved, {done: done});
+            } catch (e) {
+                // Загрузка истекла или была прервана — начинаем заново
+                localStorage.removeItem(storageKey);
+            }
+        }
+        const created = await api(urls.create, {
+            target: keyInput.dataset.directUpload,
+            filename: file.name,
+            content_type: file.type || 'application/octet-stream',
+        });
+        localStorage.setItem(storageKey, JSON.stringify(created));
+        return Object.assign(created, {done: new Set()});
+    }
+
+    async function uploadPart(file, upload, partNumber, signed) {
+        const start = (partNumber - 1) * upload.part_size;
+        const blob = file.slice(start, Math.min(start + upload.part_size, file.size));
+        for (let attempt = 0; ; attempt++) {
+            if (cancelled) throw new Error('Загрузка отменена');
+            try {
+                if (!signed[partNumber]) {
+                    await signBatch(upload, partNumber, signed);
+                }
+                const response = await fetch(signed[partNumber], {method: 'PUT', body: blob});
+                if (!response.ok) throw new Error(`HTTP ${response.status}`);
+                return blob.size;
+            } catch (e) {
+                if (attempt >= PART_RETRIES || cancelled) throw e;
+                // Подписанная ссылка могла истечь — подпишем заново
+                delete signed[partNumber];
+                await new Promise(resolve => setTimeout(resolve, 1000 * Math.pow(2, attempt)));
+            }
+        }
+    }
+
+    async function signBatch(upload, fromPart, signed) {
+        const numbers = [];
+        for (let n = fromPart; n <= upload.totalParts && numbers.length < SIGN_BATCH; n++) {
+            if (!upload.done.has(n) && !signed[n]) numbers.push(n);
+        }
+        const data = await api(urls.sign, {key: upload.key, upload_id: upload.upload_id, part_numbers: numbers});
+        Object.assign(signed, data.urls);
+    }
+
+    async function upload(file) {
+        uploading = true;
+        cancelled = false;
+        keyInput.value = '';
+        cancelLink.style.display = '';
+        setStatus('Подготовка загрузки…');
+
+        const uploadState = await startOrResume(file);
+        current = uploadState;
+        uploadState.totalParts = Math.max(1, Math.ceil(file.size / uploadState.part_size));
+
+        const pending = [];
+        let uploadedBytes = 0;
+        for (let n = 1; n <= uploadState.totalParts; n++) {
+            if (uploadState.done.has(n)) {
+                uploadedBytes += Math.min(uploadState.part_size, file.size - (n - 1) * uploadState.part_size);
+            } else {
+                pending.push(n);
+            }
+        }
+
+        const signed = {};
+        const startedAt = Date.now();
+        let sentBytes = 0;
+        async function worker() {
+            while (pending.length) {
+                const partNumber = pending.shift();
+                const size = await uploadPart(file, uploadState, partNumber, signed);
+                uploadState.done.add(partNumber);
+                uploadedBytes += size;
+                sentBytes += size;
+                const seconds = Math.max(1, (Date.now() - startedAt) / 1000);
+                setStatus(
+                    `Загружено ${formatMb(uploadedBytes)} из ${formatMb(file.size)} МБ ` +
+                    `(${Math.floor(uploadedBytes * 100 / file.size)}%, ${formatMb(sentBytes / seconds)} МБ/с)`
+                );
+            }
+        }
+        await Promise.all(Array.from({length: CONCURRENCY}, worker));
+
+        setStatus('Завершение загрузки…');
+        await api(urls.complete, {key: uploadState.key, upload_id: uploadState.upload_id});
+        localStorage.removeItem(resumeKey(file));
+
+        keyInput.value = uploadState.key;
+        // Сам файл на сервер не отправляется — только ключ объекта в бакете
+        fileInput.value = '';
+        setStatus(`Файл «${file.name}» загружен в хранилище. Сохраните форму, чтобы начать обработку.`, '#059669');
+    }
+
+    fileInput.addEventListener('change', function() {
+        const file = fileInput.files[0];
+        if (!file || uploading) return;
+        upload(file)
+            .catch(function(error) {
+                setStatus(`Ошибка загрузки: ${error.message}. Выберите файл ещё раз, чтобы продолжить.`, '#dc2626');
+                fileInput.value = '';
+            })
+            .finally(function() {
+                uploading = false;
+                cancelLink.style.display = 'none';
+            });
+    });
+
+    cancelLink.addEventListener('click', function(event) {
+        event.preventDefault();
+        if (!current) return;
+        cancelled = true;
+        const file = fileInput.files[0];
+        if (file) localStorage.removeItem(resumeKey(file));
+        api(urls.abort, {key: current.key, upload_id: current.upload_id}).catch(() => {});
+    });
+
+    form.addEventListener('submit', function(event) {
+        if (uploading) {
+            event.preventDefault();
+            alert('Дождитесь окончания загрузки видео в хранилище.');
+        }
+    });
+});